@@ -0,0 +1,119 @@
+"""Offline extract/transform/load benchmarks against the replay server
+Run from spotify_etl_pipeline/: python -m benchmarks.bench_pipeline [--sizes 50 5000 500000] [--latency 0.01] [--load [--async-load]]"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from src.artifact_store import ArtifactStore
+from src.async_load_to_database import load_stream
+from src.auth_spotify import new_spotify_client
+from src.extract_spotify import SpotifyExtractor
+from src.load_to_database import DatabaseLoader
+from src.metadata_cache import MetadataCache
+from src.rate_limiter import RateLimiter
+from src.replay_spotify import REPLAY_USER_ID, ReplayServer, SyntheticLibrary
+from src.transform_spotify import transform_tracks
+from src.watermark_store import WatermarkStore
+
+DEFAULT_SIZES = [50, 5_000, 500_000]
+
+def measure(func, *args, **kwargs):
+    """Run func and return (result, wall seconds, peak traced MB)"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+def make_extractor(server, state_dir):
+    sp = new_spotify_client(auth='replay-token')
+    sp.prefix = server.api_url + '/'
+    extractor = SpotifyExtractor(
+        sp=sp,
+        watermark_store=WatermarkStore(os.path.join(state_dir, 'watermarks.json')),
+        cache=MetadataCache(os.path.join(state_dir, 'metadata_cache.sqlite'))
+    )
+    # Measure the pipeline, not the production quota
+    extractor.limiter = RateLimiter(rate=1e9, burst=1e9, max_in_flight=64)
+    return extractor
+
+def transform(tracks_df, artifact_dir):
+    # Same hand-off as the DAG: an Arrow artifact written by one task, memory-mapped by
+    # the next, then the column-wise transform
+    store = ArtifactStore(artifact_dir)
+    return transform_tracks(store.resolve(store.offload(tracks_df, 'bench', 'recent_tracks')))
+
+def load(tracks_df):
+    try:
+        loader = DatabaseLoader()
+    except Exception as e:
+        return f'skipped ({e.__class__.__name__})'
+    try:
+        # With the user ID, so listening_history is written as in a real run
+        return loader.load_tracks(tracks_df, user_id=REPLAY_USER_ID)
+    finally:
+        loader.close()
+
+def load_async(tracks_df, chunk_size=10_000):
+    # Pipelined loader: the next chunk is sliced/encoded while the current one is written
+    chunks = (tracks_df.iloc[i:i + chunk_size] for i in range(0, len(tracks_df), chunk_size))
+    try:
+        return load_stream(chunks, user_id=REPLAY_USER_ID)
+    except Exception as e:
+        return f'skipped ({e.__class__.__name__})'
+
+def run_size(plays, latency, error_rate, throttle_rate, with_load, async_load=False):
+    library = SyntheticLibrary(plays=plays, distinct_tracks=min(plays, 20_000))
+    with tempfile.TemporaryDirectory() as state_dir, \
+            ReplayServer(library=library, latency=latency, error_rate=error_rate,
+                         throttle_rate=throttle_rate, retry_after=0) as server:
+        extractor = make_extractor(server, state_dir)
+        extractor.user_id = REPLAY_USER_ID
+        # Start just before the first synthetic play so every play is "new"
+        extractor.watermarks.set(REPLAY_USER_ID, library.start_ms - 1)
+
+        tracks_df, extract_s, extract_mb = measure(extractor.get_recent_played, incremental=True)
+        requests_made = server.stats()
+        transformed_df, transform_s, transform_mb = measure(transform, tracks_df, state_dir)
+
+        result = {
+            'plays': plays,
+            'rows': len(tracks_df),
+            'extract': {'seconds': round(extract_s, 3), 'peak_mb': round(extract_mb, 1), **requests_made,
+                        'rate_limiter': extractor.limiter.stats()},
+            'transform': {'seconds': round(transform_s, 3), 'peak_mb': round(transform_mb, 1)},
+        }
+        if with_load:
+            loaded, load_s, load_mb = measure(load_async if async_load else load, transformed_df)
+            result['load'] = {'seconds': round(load_s, 3), 'peak_mb': round(load_mb, 1), 'result': loaded}
+        return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of 500 responses')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of 429 responses')
+    parser.add_argument('--load', action='store_true', help='Also load into the configured Postgres')
+    parser.add_argument('--async-load', action='store_true', help='Load with the pipelined AsyncDatabaseLoader')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    for plays in args.sizes:
+        result = run_size(plays, args.latency, args.error_rate, args.throttle_rate, args.load, args.async_load)
+        print(json.dumps(result))
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
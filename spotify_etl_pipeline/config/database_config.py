@@ -4,11 +4,30 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class DatabaseConfig:
-    DB_HOST = 'localhost'
-    DB_PORT = '5433'
-    DB_NAME = 'spotify_data'
-    DB_USER = 'postgres'
-    DB_PASSWORD = 'postgres'
+    DB_HOST = os.getenv('SPOTIFY_DB_HOST', 'localhost')
+    DB_PORT = os.getenv('SPOTIFY_DB_PORT', '5433')
+    DB_NAME = os.getenv('SPOTIFY_DB_NAME', 'spotify_data')
+    DB_USER = os.getenv('SPOTIFY_DB_USER', 'postgres')
+    DB_PASSWORD = os.getenv('SPOTIFY_DB_PASSWORD', 'postgres')
+
+    # Connection pool shared by every module in a process
+    POOL_MIN_SIZE = int(os.getenv('SPOTIFY_DB_POOL_MIN', '1'))
+    POOL_MAX_SIZE = int(os.getenv('SPOTIFY_DB_POOL_MAX', '10'))
+    POOL_TIMEOUT = float(os.getenv('SPOTIFY_DB_POOL_TIMEOUT', '30'))
+    # Connections idle longer than this are pinged before being handed out
+    POOL_HEALTH_CHECK_AFTER = float(os.getenv('SPOTIFY_DB_POOL_HEALTH_CHECK_AFTER', '30'))
+    STATEMENT_TIMEOUT_MS = int(os.getenv('SPOTIFY_DB_STATEMENT_TIMEOUT_MS', '300000'))
+
+    # Load instrumentation: Prometheus text file, and how often lock waits are sampled (0 disables)
+    LOAD_METRICS_PATH = os.getenv('SPOTIFY_LOAD_METRICS_PATH', 'data/metrics/spotify_load.prom')
+    LOCK_WAIT_SAMPLE_INTERVAL = float(os.getenv('SPOTIFY_LOCK_WAIT_SAMPLE_INTERVAL', '0.05'))
+
+    # listening_history partitions older than this are rolled up and detached
+    HISTORY_RETENTION_MONTHS = int(os.getenv('SPOTIFY_HISTORY_RETENTION_MONTHS', '24'))
+
+    # Data-quality thresholds for each loaded batch (see src/data_quality.py)
+    DQ_MAX_NULL_RATE = float(os.getenv('SPOTIFY_DQ_MAX_NULL_RATE', '0.01'))
+    DQ_MAX_FRESHNESS_LAG_HOURS = float(os.getenv('SPOTIFY_DQ_MAX_FRESHNESS_LAG_HOURS', '48'))
 
     @classmethod
     def get_connection_string(cls):
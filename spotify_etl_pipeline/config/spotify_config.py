@@ -14,3 +14,50 @@ class SpotifyConfig:
     AUTH_URL = 'https://accounts.spotify.com/authorize'
     TOKEN_URL = 'https://accounts.spotify.com/token'
     API_BASE_URL = 'https://api.spotify.com/v1'
+
+    # OAuth token cache (shared by every worker on the host) and how early to refresh
+    TOKEN_CACHE_PATH = os.getenv('SPOTIFY_TOKEN_CACHE', '.spotify_cache')
+    TOKEN_REFRESH_MARGIN = int(os.getenv('SPOTIFY_TOKEN_REFRESH_MARGIN', '300'))
+
+    # Multi-user mode: one token cache file per listener in this directory
+    TOKEN_CACHE_DIR = os.getenv('SPOTIFY_TOKEN_CACHE_DIR', 'data/tokens')
+    MULTI_USER_WORKERS = int(os.getenv('SPOTIFY_MULTI_USER_WORKERS', '8'))
+
+    # Rate limiting shared by every Spotify call in a process
+    RATE_LIMIT_PER_SECOND = float(os.getenv('SPOTIFY_RATE_LIMIT_PER_SECOND', '10'))
+    RATE_LIMIT_BURST = int(os.getenv('SPOTIFY_RATE_LIMIT_BURST', '20'))
+    MAX_IN_FLIGHT_REQUESTS = int(os.getenv('SPOTIFY_MAX_IN_FLIGHT_REQUESTS', '8'))
+
+    # Airflow pool for the mapped extract tasks. At most API_POOL_SLOTS of them
+    # run at once and each gets 1/API_POOL_SLOTS of the rate budget above, so
+    # all workers together stay within it
+    API_POOL = os.getenv('SPOTIFY_API_POOL', 'spotify_api')
+    API_POOL_SLOTS = int(os.getenv('SPOTIFY_API_POOL_SLOTS', '4'))
+
+    # Local state (high-water marks etc.), kept on the shared ./data volume
+    STATE_DIR = os.getenv('SPOTIFY_STATE_DIR', 'data/state')
+    WATERMARK_PATH = os.path.join(STATE_DIR, 'recently_played_watermarks.json')
+
+    # Local Spotify metadata cache (tracks, artists, albums)
+    METADATA_CACHE_PATH = os.path.join(STATE_DIR, 'metadata_cache.sqlite')
+    METADATA_CACHE_TTL = int(os.getenv('SPOTIFY_METADATA_CACHE_TTL', str(7 * 24 * 3600)))
+    METADATA_CACHE_MAX_ENTRIES = int(os.getenv('SPOTIFY_METADATA_CACHE_MAX_ENTRIES', '200000'))
+
+    # Write-ahead staging: extracted plays as checksummed Parquet chunks, so a
+    # failed load can resume without re-extracting
+    STAGING_DIR = os.getenv('SPOTIFY_STAGING_DIR', 'data/staging')
+    STAGING_CHUNK_ROWS = int(os.getenv('SPOTIFY_STAGING_CHUNK_ROWS', '10000'))
+    STAGING_RETENTION_DAYS = int(os.getenv('SPOTIFY_STAGING_RETENTION_DAYS', '7'))
+
+    # DataFrames passed between DAG tasks (Arrow IPC files; XCom only carries references)
+    ARTIFACT_DIR = os.getenv('SPOTIFY_ARTIFACT_DIR', 'data/artifacts')
+    ARTIFACT_RETENTION_DAYS = int(os.getenv('SPOTIFY_ARTIFACT_RETENTION_DAYS', '7'))
+
+    # ETL daemon (python -m src.etl_pipeline): 'daily@HH:MM' or 'every:<seconds>',
+    # user runs at once (also bounds catch-up), and how long shutdown waits for them
+    DAEMON_SCHEDULE = os.getenv('SPOTIFY_DAEMON_SCHEDULE', 'daily@02:00')
+    DAEMON_MAX_CONCURRENT_RUNS = int(os.getenv('SPOTIFY_DAEMON_MAX_CONCURRENT_RUNS', '4'))
+    DAEMON_POLL_SECONDS = float(os.getenv('SPOTIFY_DAEMON_POLL_SECONDS', '30'))
+    DAEMON_RETRY_DELAY = float(os.getenv('SPOTIFY_DAEMON_RETRY_DELAY', '300'))
+    DAEMON_DRAIN_TIMEOUT = float(os.getenv('SPOTIFY_DAEMON_DRAIN_TIMEOUT', '600'))
+    DAEMON_STATE_PATH = os.path.join(STATE_DIR, 'daemon_state.json')
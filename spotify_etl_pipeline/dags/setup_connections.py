@@ -1,14 +1,20 @@
-"""Run this once to set up Airflow connections
+"""Run this once to set up Airflow connections and pools
 Execute: docker exec spotify_etl_pipeline-airflow-webserver-1 python /opt/airflow/dags/setup_connections.py"""
 from airflow.models import Connection
+from airflow.models.pool import Pool
 from airflow import settings
+import sys
 import os
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from config.spotify_config import SpotifyConfig
+
 def setup_connections():
     spotify_conn = Connection(
         conn_id='spotify_postgres',
         conn_type='postgres',
-        host='host.docker.internal'
+        host='host.docker.internal',
         port='5433',
         schema='spotify_data',
         login='postgres',
@@ -32,5 +38,17 @@ def setup_connections():
     print(f"   Port: 5433")
     print(f"   Database: spotify_data")
 
+def setup_pools():
+    # The DAG's mapped extract tasks queue on this pool until it exists
+    Pool.create_or_update_pool(
+        name=SpotifyConfig.API_POOL,
+        slots=SpotifyConfig.API_POOL_SLOTS,
+        description='Spotify API calls (each slot gets an equal share of the rate budget)',
+        include_deferred=False,
+    )
+
+    print(f" Pool '{SpotifyConfig.API_POOL}' set to {SpotifyConfig.API_POOL_SLOTS} slots")
+
 if __name__ == "__main__":
     setup_connections()
+    setup_pools()
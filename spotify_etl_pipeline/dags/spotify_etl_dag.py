@@ -1,15 +1,28 @@
 from airflow import DAG
 from airflow.operators.python import PythonOperator
 from airflow.operators.empty import EmptyOperator
-from airflow.providers.postgres.hooks.postgres import PostgresHook
 from datetime import datetime, timedelta
+import pandas as pd
 import sys
 import os
 
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../src'))
+# The project root (mounted at /opt/airflow), so src modules import as a
+# package and their relative imports resolve
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from extract_spotify import SpotifyExtractor
-import pandas as pd
+from config.spotify_config import SpotifyConfig
+from src.rate_limiter import get_rate_limiter, set_rate_share
+from src.extract_spotify import TIME_RANGES, SpotifyExtractor
+from src.multi_user_etl import discover_token_caches
+from src.load_to_database import DatabaseLoader
+from src.enrich_spotify import SpotifyEnricher
+from src.artifact_store import ArtifactStore
+from src.data_quality import DataQualityEngine
+from src.migrations import migrate
+from src.partitions import maintain_partitions
+from src.staging_store import StagingStore
+from src.transform_spotify import etl_now, transform_profile, transform_tracks
+from src.watermark_store import WatermarkStore
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,97 +37,183 @@ default_args = {
     'start_date': datetime(2023, 12, 22),
 }
 
-def extract_spotify_data(**context):
-    """Extract data from Spotify API"""
-    logger.info('Starting Spotify data extraction...')
+def migrate_schema(**context):
+    """Apply missing schema versions (one query when already up to date)"""
+    applied = migrate()
+    logger.info(f'Applied schema versions: {applied or "none"}')
+    return {'status': 'success', 'applied_versions': applied}
 
-    try:
-        extractor = SpotifyExtractor()
+def maintain_history_partitions(**context):
+    """Create upcoming listening_history partitions and detach those past retention"""
+    detached = maintain_partitions()
+    logger.info(f'Detached partitions: {detached or "none"}')
+    return {'status': 'success', 'detached': detached}
+
+def plan_extraction(**context):
+    """
+    List the users and (user, time_range) pairs the mapped extract tasks run over
+
+    The extract tasks run in the SpotifyConfig.API_POOL pool, created by
+    dags/setup_connections.py.
+    """
+    # One token cache per listener; without any, the single-user cache
+    cache_paths = discover_token_caches() or [SpotifyConfig.TOKEN_CACHE_PATH]
+    users = [{'cache_path': path} for path in cache_paths]
+    top_tracks = [{'cache_path': path, 'time_range': time_range}
+                  for path in cache_paths for time_range in TIME_RANGES]
+
+    ArtifactStore().prune()
+    StagingStore().prune()
+
+    context['ti'].xcom_push(key='users', value=users)
+    context['ti'].xcom_push(key='top_tracks', value=top_tracks)
+    logger.info(f'Planned extraction for {len(users)} users, {len(top_tracks)} top-track ranges')
+    return {'status': 'success', 'users': len(users), 'top_track_ranges': len(top_tracks)}
+
+def _take_rate_share():
+    """Limit this task to its share of the API rate budget (before any client is created)"""
+    set_rate_share(1 / SpotifyConfig.API_POOL_SLOTS)
+
+def extract_plays(cache_path, **context):
+    """Extract one user's profile and new plays (mapped per user)"""
+    _take_rate_share()
+    logger.info(f'Extracting plays for {cache_path}...')
 
-        # Get user profile
+    try:
+        extractor = SpotifyExtractor(cache_path=cache_path)
         profile = extractor.get_user_profile()
-        logger.info(f'Extracted profile: {profile['display_name'] if profile else 'No profile'}')
-
-        # Get recently played tracks (last 50)
-        tracks_df = extractor.get_recent_played(limit=50)
-        logger.info(f'Extracted {len(tracks_df)} recently played tracks')
-
-        # Get top tracks for all time ranges
-        time_range = ['short_term', 'medium_term', 'long_term']
-        top_tracks_data = {}
-
-        for time_range in time_ranges:
-            top_tracks = extractor.get_top_tracks(time_range=time_range, limit=20)
-            top_tracks_data[time_range] = top_tracks
-            logger.info(f'Extracted {len(top_tracks)} top tracks form {time_range}')
-
-            # Push data to XCom for use in other tasks
-            context['ti'].xcom_push(key='user_profile', value=profile)
-            context['ti'].xcom_push(key='recent_tracks', value=tracks_df.to_dict('records'))
-            context['ti'].xcom_push(key='top_tracks_data', value={
-                k: v.to_dict('records') for k, v in top_tracks_data.items()
-            })
+        if not profile:
+            logger.warning(f'No profile for {cache_path}; skipping user')
+            return {'cache_path': cache_path, 'profile': None, 'rate_limit': get_rate_limiter().stats()}
 
-            return {
-                'status': 'success',
-                'profile_extracted': profile is not None,
-                'tracks_extracted': len(tracks_df),
-                'top_tracks_extracted': {k: len(v) for k, v in top_tracks_data.items()}
-            }
+        tracks_df = extractor.get_recent_played(incremental=True)
+        logger.info(f'Extracted {len(tracks_df)} new recently played tracks for {profile["user_id"]}')
+
+        # Plays go to write-ahead staging files, so a failed load resumes from them
+        manifest = StagingStore().write(f'{context["run_id"]}.{profile["user_id"]}', tracks_df, profile=profile)
+
+        return {
+            'cache_path': cache_path,
+            'profile': profile,
+            'staging_run': manifest['run_id'],
+            'tracks_extracted': manifest['rows'],
+            'rate_limit': get_rate_limiter().stats()
+        }
 
     except Exception as e:
-        logger.error(f'Extraction failed: {e}')
+        logger.error(f'Extraction failed for {cache_path}: {e}')
         raise
 
+def extract_top_tracks(cache_path, time_range, **context):
+    """Extract one user's top tracks for one time range (mapped per user and time_range)"""
+    _take_rate_share()
+    logger.info(f'Extracting {time_range} top tracks for {cache_path}...')
+
+    try:
+        top_tracks = SpotifyExtractor(cache_path=cache_path).get_top_tracks(time_range=time_range, limit=20)
+        logger.info(f'Extracted {len(top_tracks)} top tracks form {time_range}')
+
+        # The DataFrame goes to an Arrow file; XCom only carries the reference
+        name = f'top_tracks.{os.path.basename(cache_path)}.{time_range}'
+        ref = ArtifactStore().write_frame(top_tracks, context['run_id'], name)
+        return {
+            'cache_path': cache_path,
+            'time_range': time_range,
+            'top_tracks': ref,
+            'rate_limit': get_rate_limiter().stats()
+        }
+
+    except Exception as e:
+        logger.error(f'Top track extraction failed for {cache_path} ({time_range}): {e}')
+        raise
+
+def merge_extracts(**context):
+    """
+    Reduce the mapped extract outputs into one list of users for the load
+
+    Runs once every mapped task has finished, failed or not: users whose
+    extraction failed are left out (and retried on the next run) rather than
+    holding back everyone else. It fails when nothing was planned, i.e. when
+    migrate_schema or plan_extraction failed.
+    """
+    ti = context['ti']
+    planned = ti.xcom_pull(task_ids='plan_extraction', key='users')
+    if planned is None:
+        raise RuntimeError('plan_extraction did not succeed; nothing was extracted')
+    plays = [r for r in ti.xcom_pull(task_ids='extract_plays') or [] if r]
+    top_tracks = [r for r in ti.xcom_pull(task_ids='extract_top_tracks') or [] if r]
+
+    users = {}
+    for result in plays:
+        if result['profile']:
+            users[result['cache_path']] = {
+                'cache_path': result['cache_path'],
+                'profile': result['profile'],
+                'staging_run': result['staging_run'],
+                'top_tracks': {},
+            }
+    for result in top_tracks:
+        if result['cache_path'] in users:
+            users[result['cache_path']]['top_tracks'][result['time_range']] = result['top_tracks']
+
+    # One frame of every distinct top track, for enrichment
+    artifacts = ArtifactStore()
+    frames = [artifacts.read_frame(r['top_tracks']) for r in top_tracks if r['top_tracks']['rows']]
+    merged = pd.concat(frames, ignore_index=True).drop_duplicates('track_id') if frames else pd.DataFrame()
+    ti.xcom_push(key='top_tracks_data', value=artifacts.write_frame(merged, context['run_id'], 'top_tracks'))
+    ti.xcom_push(key='users', value=list(users.values()))
+    if planned and not users:
+        raise RuntimeError(f'Extraction failed for all {len(planned)} users')
+
+    rate_limit = {}
+    for result in plays + top_tracks:
+        for counter, value in result['rate_limit'].items():
+            rate_limit[counter] = round(rate_limit.get(counter, 0) + value, 3)
+
+    logger.info(f'Merged extracts: {len(users)} users, {len(merged)} distinct top tracks')
+    return {
+        'status': 'success',
+        'users': len(users),
+        'users_failed': len(planned) - len(users),
+        'tracks_extracted': sum(r.get('tracks_extracted', 0) for r in plays),
+        'top_tracks_extracted': len(merged),
+        'rate_limit': rate_limit
+    }
+
 def transform_data(**context):
     """Transform and clean the data"""
     logger.info("Starting data transformation...")
     
     try:
-        # Pull data from previous task via XCom
+        # Pull the merged users from the reduce task via XCom
         ti = context['ti']
-        profile = ti.xcom_pull(task_ids='extract_data', key='user_profile')
-        recent_tracks = ti.xcom_pull(task_ids='extract_data', key='recent_tracks')
+        users = ti.xcom_pull(task_ids='merge_extracts', key='users') or []
         
-        if not profile:
+        if not users:
             logger.warning("No profile data to transform")
             return {'status': 'skipped', 'reason': 'No profile data'}
         
-        # Transform profile data
-        transformed_profile = {
-            'user_id': profile['user_id'],
-            'display_name': profile['display_name'],
-            'email': profile.get('email', ''),
-            'country': profile.get('country', ''),
-            'followers': profile['followers'],
-            'account_type': profile['account_type'],
-            'etl_timestamp': datetime.now()
-        }
-        
-        # Transform tracks data
-        transformed_tracks = []
-        if recent_tracks:
-            for track in recent_tracks:
-                transformed_track = {
-                    'track_id': track['track_id'],
-                    'track_name': track['track_name'],
-                    'artist_id': track['artist_id'],
-                    'artist_name': track['artist_name'],
-                    'album_id': track.get('album_id', ''),
-                    'album_name': track.get('album_name', ''),
-                    'duration_ms': track['duration_ms'],
-                    'popularity': track.get('popularity', 0),
-                    'played_at': track['played_at'],
-                    'etl_timestamp': datetime.now()
-                }
-                transformed_tracks.append(transformed_track)
+        # One timestamp for the whole run; the staged plays are transformed as
+        # DataFrames and re-staged, so the load reads clean, typed chunks
+        etl_timestamp = etl_now()
+        store = StagingStore()
+        transformed_users = []
+        tracks_transformed = 0
+        for user in users:
+            tracks_df = transform_tracks(store.read_all(user['staging_run']), etl_timestamp)
+            manifest = store.write(f'{user["staging_run"]}.transformed', tracks_df, profile=user['profile'])
+            transformed_users.append({
+                'cache_path': user['cache_path'],
+                'profile': transform_profile(user['profile'], etl_timestamp),
+                'staging_run': manifest['run_id'],
+            })
+            tracks_transformed += manifest['rows']
         
         # Push transformed data
-        ti.xcom_push(key='transformed_profile', value=transformed_profile)
-        ti.xcom_push(key='transformed_tracks', value=transformed_tracks)
+        ti.xcom_push(key='transformed_users', value=transformed_users)
         
-        logger.info(f"Transformed profile and {len(transformed_tracks)} tracks")
-        return {'status': 'success', 'tracks_transformed': len(transformed_tracks)}
+        logger.info(f"Transformed {len(transformed_users)} profiles and {tracks_transformed} tracks")
+        return {'status': 'success', 'tracks_transformed': tracks_transformed}
         
     except Exception as e:
         logger.error(f"Transformation failed: {e}")
@@ -126,113 +225,98 @@ def load_to_postgres(**context):
     
     try:
         ti = context['ti']
-        profile = ti.xcom_pull(task_ids='transform_data', key='transformed_profile')
-        tracks = ti.xcom_pull(task_ids='transform_data', key='transformed_tracks')
+        users = ti.xcom_pull(task_ids='transform_data', key='transformed_users')
         
-        if not profile:
+        if not users:
             logger.warning("No data to load")
             return {'status': 'skipped'}
         
-        # Connect to PostgreSQL
-        pg_hook = PostgresHook(postgres_conn_id='spotify_postgres')
-        connection = pg_hook.get_conn()
-        cursor = connection.cursor()
-        
-        # Load user profile
-        cursor.execute("""
-            INSERT INTO users (user_id, display_name, email, country, followers, account_type, etl_timestamp)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (user_id) DO UPDATE SET
-                display_name = EXCLUDED.display_name,
-                email = EXCLUDED.email,
-                country = EXCLUDED.country,
-                followers = EXCLUDED.followers,
-                account_type = EXCLUDED.account_type,
-                etl_timestamp = EXCLUDED.etl_timestamp
-        """, (
-            profile['user_id'],
-            profile['display_name'],
-            profile['email'],
-            profile['country'],
-            profile['followers'],
-            profile['account_type'],
-            profile['etl_timestamp']
-        ))
-        
-        # Load tracks if available
+        # One transaction per staged chunk (COPY + set-based merges + commit marker);
+        # a retry skips the chunks already committed
+        store = StagingStore()
+        watermarks = WatermarkStore()
+        loader = DatabaseLoader()
         tracks_loaded = 0
-        if tracks:
-            for track in tracks:
-                # Insert artist
-                cursor.execute("""
-                    INSERT INTO artists (artist_id, artist_name)
-                    VALUES (%s, %s)
-                    ON CONFLICT (artist_id) DO NOTHING
-                """, (track['artist_id'], track['artist_name']))
-                
-                # Insert track
-                cursor.execute("""
-                    INSERT INTO tracks (track_id, track_name, artist_id, duration_ms, popularity)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (track_id) DO NOTHING
-                """, (
-                    track['track_id'],
-                    track['track_name'],
-                    track['artist_id'],
-                    track['duration_ms'],
-                    track['popularity']
-                ))
-                
-                # Insert listening history
-                cursor.execute("""
-                    INSERT INTO listening_history (user_id, track_id, played_at, context_type)
-                    VALUES (%s, %s, %s, %s)
-                """, (
-                    profile['user_id'],
-                    track['track_id'],
-                    track['played_at'],
-                    'recently_played'
-                ))
-                
-                tracks_loaded += 1
-        
-        connection.commit()
-        cursor.close()
-        connection.close()
+        try:
+            for user in users:
+                profile = user['profile']
+                tracks_loaded += loader.load_staged(store, user['staging_run'], profile_data=profile)
+
+                # Plays are committed, so the next run can start after them
+                max_played_at = store.manifest(user['staging_run'])['max_played_at']
+                if max_played_at:
+                    watermarks.advance(profile['user_id'], [max_played_at])
+        finally:
+            loader.close()
+            loader.metrics.write()
         
-        logger.info(f" Loaded profile and {tracks_loaded} tracks to PostgreSQL")
-        return {'status': 'success', 'tracks_loaded': tracks_loaded}
+        logger.info(f" Loaded {len(users)} profiles and {tracks_loaded} tracks to PostgreSQL")
+        return {'status': 'success', 'tracks_loaded': tracks_loaded, 'load_metrics': loader.metrics.snapshot()}
         
     except Exception as e:
         logger.error(f"Load failed: {e}")
         raise
 
+def enrich_metadata(**context):
+    """Fetch details for new tracks, artists and albums in bulk"""
+    logger.info("Starting metadata enrichment...")
+
+    try:
+        ti = context['ti']
+        users = ti.xcom_pull(task_ids='transform_data', key='transformed_users') or []
+        top_tracks_ref = ti.xcom_pull(task_ids='merge_extracts', key='top_tracks_data')
+        if not users:
+            logger.warning("No users to enrich for")
+            return {'status': 'skipped'}
+
+        store = StagingStore()
+        frames = [store.read_all(user['staging_run']) for user in users]
+        if top_tracks_ref:
+            frames.append(ArtifactStore().read_frame(top_tracks_ref))
+
+        # Catalog lookups work with any listener's token; use one the extract tasks used
+        extractor = SpotifyExtractor(cache_path=users[0]['cache_path'])
+        loader = DatabaseLoader()
+        try:
+            summary = SpotifyEnricher(extractor, loader).enrich(*frames)
+        finally:
+            loader.close()
+
+        return {'status': 'success', 'enriched': summary, 'load_metrics': loader.metrics.snapshot()}
+
+    except Exception as e:
+        logger.error(f"Enrichment failed: {e}")
+        raise
+
 def data_quality_check(**context):
-    """Run data quality checks"""
+    """Run data quality checks over the rows loaded by this run"""
     logger.info("Running data quality checks...")
     
     try:
-        pg_hook = PostgresHook(postgres_conn_id='spotify_postgres')
-        
-        # Check 1: User exists in database
-        user_check = pg_hook.get_first("""
-            SELECT COUNT(*) FROM users WHERE user_id = %s
-        """, ('Cfuna22',))  # Replace with actual user ID
+        ti = context['ti']
+        users = ti.xcom_pull(task_ids='transform_data', key='transformed_users') or []
         
-        # Check 2: Recent tracks were loaded
-        tracks_check = pg_hook.get_first("""
-            SELECT COUNT(*) FROM listening_history 
-            WHERE played_at > NOW() - INTERVAL '7 days'
-        """)
+        # Each check only touches this run's batch; results go to data_quality_metrics
+        store = StagingStore()
+        engine = DataQualityEngine()
+        try:
+            reports = [
+                engine.check_batch(context['run_id'], user['profile']['user_id'],
+                                   store.read_all(user['staging_run'], columns=['track_id', 'played_at']))
+                for user in users
+            ]
+        finally:
+            engine.close()
         
         logger.info(f"Data quality check results:")
-        logger.info(f"  - User exists: {user_check[0] > 0}")
-        logger.info(f"  - Recent tracks: {tracks_check[0]}")
+        for report in reports:
+            logger.info(f"  - {report['user_id']}: {report['rows']} rows, "
+                        f"failed: {', '.join(report['failed']) or 'none'}")
         
         return {
             'status': 'success',
-            'user_exists': user_check[0] > 0,
-            'recent_tracks_count': tracks_check[0]
+            'all_passed': all(report['passed'] for report in reports),
+            'reports': reports
         }
         
     except Exception as e:
@@ -251,12 +335,45 @@ with DAG(
     
     start = EmptyOperator(task_id='start')
     
-    extract_task = PythonOperator(
-        task_id='extract_data',
-        python_callable=extract_spotify_data,
+    migrate_task = PythonOperator(
+        task_id='migrate_schema',
+        python_callable=migrate_schema,
         provide_context=True,
     )
     
+    partitions_task = PythonOperator(
+        task_id='maintain_partitions',
+        python_callable=maintain_history_partitions,
+    )
+    
+    plan_task = PythonOperator(
+        task_id='plan_extraction',
+        python_callable=plan_extraction,
+    )
+    
+    # Mapped at run time: one task per user, one per (user, time_range). They
+    # share the API pool, so at most API_POOL_SLOTS call Spotify at once,
+    # spread across the Celery workers
+    extract_plays_task = PythonOperator.partial(
+        task_id='extract_plays',
+        python_callable=extract_plays,
+        pool=SpotifyConfig.API_POOL,
+        max_active_tis_per_dag=SpotifyConfig.API_POOL_SLOTS,
+    ).expand(op_kwargs=plan_task.output['users'])
+    
+    extract_top_tracks_task = PythonOperator.partial(
+        task_id='extract_top_tracks',
+        python_callable=extract_top_tracks,
+        pool=SpotifyConfig.API_POOL,
+        max_active_tis_per_dag=SpotifyConfig.API_POOL_SLOTS,
+    ).expand(op_kwargs=plan_task.output['top_tracks'])
+    
+    merge_task = PythonOperator(
+        task_id='merge_extracts',
+        python_callable=merge_extracts,
+        trigger_rule='all_done',
+    )
+    
     transform_task = PythonOperator(
         task_id='transform_data',
         python_callable=transform_data,
@@ -269,6 +386,12 @@ with DAG(
         provide_context=True,
     )
     
+    enrich_task = PythonOperator(
+        task_id='enrich_metadata',
+        python_callable=enrich_metadata,
+        provide_context=True,
+    )
+    
     quality_check_task = PythonOperator(
         task_id='data_quality_check',
         python_callable=data_quality_check,
@@ -278,5 +401,8 @@ with DAG(
     end = EmptyOperator(task_id='end')
     
     # Define workflow
-    start >> extract_task >> transform_task >> load_task >> quality_check_task >> end
+    start >> migrate_task >> plan_task
+    migrate_task >> partitions_task >> load_task
+    [extract_plays_task, extract_top_tracks_task] >> merge_task
+    merge_task >> transform_task >> load_task >> enrich_task >> quality_check_task >> end
 
@@ -0,0 +1,84 @@
+import logging
+import os
+import pandas as pd
+import pyarrow as pa
+from config.spotify_config import SpotifyConfig
+from .staging_store import prune_run_dirs, safe_run_id
+
+logger = logging.getLogger(__name__)
+
+# Marks a dict as an artifact reference rather than a plain XCom value
+REF_KEY = '__artifact__'
+
+def is_ref(value):
+    return isinstance(value, dict) and REF_KEY in value
+
+class ArtifactStore:
+    """
+    DataFrames passed between DAG tasks as Arrow IPC files on the shared ./data volume.
+
+    Only a small reference ({'__artifact__': path, 'rows': n, 'columns': [...]})
+    goes through XCom. Files are read through a memory map, so reading a
+    column doesn't copy or parse the rest of the file.
+
+    Layout:
+        <root>/<run_id>/<name>.arrow
+    """
+
+    def __init__(self, root=None):
+        self.root = root or SpotifyConfig.ARTIFACT_DIR
+
+    def write_frame(self, df, run_id, name):
+        """Write df for run_id and return its reference"""
+        run_dir = os.path.join(self.root, safe_run_id(run_id))
+        os.makedirs(run_dir, exist_ok=True)
+        path = os.path.join(run_dir, f'{name}.arrow')
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        tmp_path = f'{path}.tmp'
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path)
+
+        return {REF_KEY: path, 'rows': table.num_rows, 'columns': table.column_names}
+
+    def read_table(self, ref, columns=None):
+        """Memory-mapped Arrow table for a reference (zero-copy)"""
+        with pa.memory_map(ref[REF_KEY], 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+        return table.select(columns) if columns else table
+
+    def read_frame(self, ref, columns=None):
+        """DataFrame for a reference, with the dtypes it was written with"""
+        return self.read_table(ref, columns).to_pandas()
+
+    def offload(self, value, run_id, name):
+        """
+        Replace every DataFrame inside value (a frame, or dicts/lists of them)
+        with a reference, so the rest can go through XCom as-is
+        """
+        if isinstance(value, pd.DataFrame):
+            return self.write_frame(value, run_id, name)
+        if isinstance(value, dict):
+            return {k: self.offload(v, run_id, f'{name}.{k}') for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.offload(v, run_id, f'{name}.{i}') for i, v in enumerate(value)]
+        return value
+
+    def resolve(self, value, columns=None):
+        """Inverse of offload(): read every reference back into a DataFrame"""
+        if is_ref(value):
+            return self.read_frame(value, columns)
+        if isinstance(value, dict):
+            return {k: self.resolve(v, columns) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.resolve(v, columns) for v in value]
+        return value
+
+    def prune(self, max_age_days=None):
+        """Delete artifacts of runs older than max_age_days"""
+        max_age_days = max_age_days if max_age_days is not None else SpotifyConfig.ARTIFACT_RETENTION_DAYS
+        removed = prune_run_dirs(self.root, max_age_days)
+        if removed:
+            logger.info(f'Pruned artifacts of {len(removed)} runs')
+        return removed
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import aiohttp
+import pandas as pd
+from config.spotify_config import SpotifyConfig
+from .auth_spotify import get_auth_manager
+from .rate_limiter import RateLimitExceeded, get_rate_limiter
+from .watermark_store import WatermarkStore
+from .extract_spotify import RECENTLY_PLAYED_PAGE_SIZE, TIME_RANGES, parse_user_profile
+from .parse_spotify import parse_recent_played, parse_top_tracks
+
+logger = logging.getLogger(__name__)
+
+class AsyncSpotifyExtractor:
+    """
+    asyncio counterpart to SpotifyExtractor.
+
+    All requests share one pooled aiohttp session, so profile, recent plays and
+    the three top-track ranges can be fetched concurrently. Returns the same
+    dicts/DataFrames as SpotifyExtractor.
+
+    Each request asks the user's OAuth manager for its token, so a long
+    extraction picks up refreshed tokens instead of the one it started with.
+
+    Usage:
+        async with AsyncSpotifyExtractor() as extractor:
+            data = await extractor.extract_all()
+    """
+
+    def __init__(self, cache_path=None, auth_manager=None, access_token=None, base_url=None, max_connections=10,
+                 timeout=30, watermark_store=None):
+        # A fixed access_token is only meant for fake servers; otherwise the
+        # auth manager hands out (and refreshes) the token per request
+        self.access_token = access_token
+        self.auth_manager = None if access_token else auth_manager or get_auth_manager(cache_path)
+
+        # base_url can point at a local fake server for testing
+        self.base_url = (base_url or SpotifyConfig.API_BASE_URL).rstrip('/')
+        self.max_connections = max_connections
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+        self.watermarks = watermark_store or WatermarkStore()
+        self.limiter = get_rate_limiter()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        """Open the pooled HTTP session"""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def close(self):
+        """Close the HTTP session"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _token(self):
+        if self.access_token:
+            return self.access_token
+        # Reads (and, when due, refreshes) the token cache; keep the event loop free
+        token = await asyncio.to_thread(self.auth_manager.get_access_token, as_dict=False)
+        if not token:
+            raise ConnectionError('Failed to get a Spotify access token')
+        return token
+
+    async def _request(self, path, params=None):
+        headers = {'Authorization': f'Bearer {await self._token()}'}
+        async with self.session.get(f'{self.base_url}/{path}', params=params, headers=headers) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def _get(self, path, params=None):
+        await self.open()
+        # Every Spotify request goes through the shared rate limiter
+        return await self.limiter.call_async(self._request, path, params)
+
+    async def get_user_profile(self):
+        """Get current user's profile info"""
+        logger.info('Fetching user profile...')
+        try:
+            user = await self._get('me')
+            profile_data = parse_user_profile(user)
+            logger.info(f'Retrieved profile for: {profile_data["display_name"]}')
+            return profile_data
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.error(f'Failed to get user profile: {e}')
+            return None
+
+    async def get_top_tracks(self, time_range='short_term', limit=20):
+        """Get user's top tracks for one time range"""
+        logger.info(f'Fetching top tracks ({time_range})...')
+        try:
+            top_tracks = await self._get('me/top/tracks', {'time_range': time_range, 'limit': limit})
+            tracks_df = parse_top_tracks(top_tracks['items'])
+            logger.info(f'retrieved {len(tracks_df)} top tracks ({time_range})')
+            return tracks_df
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.error(f'Failed to get top tracks: {e}')
+            return pd.DataFrame()
+
+    async def get_recent_played(self, limit=50):
+        """Get recent played tracks"""
+        logger.info(f'Fetching {limit} recently played tracks...')
+        try:
+            recent_tracks = await self._get('me/player/recently-played', {'limit': limit})
+            played_df = parse_recent_played(recent_tracks['items'])
+            logger.info(f'Retrieved {len(played_df)} recently played tracks')
+            return played_df
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.error(f'Failed to get recently played tracks: {e}')
+            return pd.DataFrame()
+
+    async def get_recent_played_since_watermark(self, user_id):
+        """Page through plays newer than the user's high-water mark"""
+        after = self.watermarks.get(user_id)
+        logger.info(f'Fetching recently played tracks for {user_id} after {after}...')
+        try:
+            pages_data = []
+            while True:
+                params = {'limit': RECENTLY_PLAYED_PAGE_SIZE}
+                if after is not None:
+                    params['after'] = after
+                page = await self._get('me/player/recently-played', params)
+
+                items = page.get('items') or []
+                pages_data.append(parse_recent_played(items))
+
+                cursor = (page.get('cursors') or {}).get('after')
+                if after is None or not items or not cursor or len(items) < RECENTLY_PLAYED_PAGE_SIZE:
+                    break
+                if int(cursor) <= after:
+                    break
+                after = int(cursor)
+
+            played_df = pd.concat(pages_data, ignore_index=True)
+            logger.info(f'Retrieved {len(played_df)} new plays')
+            return played_df
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.error(f'Failed to get recently played tracks: {e}')
+            return pd.DataFrame()
+
+    async def extract_all(self, recent_limit=50, top_limit=20, time_ranges=None, incremental=False):
+        """
+        Fetch profile, recent plays and top tracks for every time range concurrently
+
+        In incremental mode the recent plays request waits for the profile
+        (to look up the user's watermark); the top-track requests never wait.
+
+        Returns:
+            dict with 'profile', 'recent_tracks' and 'top_tracks' ({time_range: DataFrame})
+        """
+        time_ranges = time_ranges or TIME_RANGES
+        profile_task = asyncio.ensure_future(self.get_user_profile())
+
+        async def recent():
+            if not incremental:
+                return await self.get_recent_played(limit=recent_limit)
+            profile = await profile_task
+            if not profile:
+                return pd.DataFrame()
+            return await self.get_recent_played_since_watermark(profile['user_id'])
+
+        results = await asyncio.gather(
+            profile_task,
+            recent(),
+            *[self.get_top_tracks(time_range=tr, limit=top_limit) for tr in time_ranges]
+        )
+
+        return {
+            'profile': results[0],
+            'recent_tracks': results[1],
+            'top_tracks': dict(zip(time_ranges, results[2:])),
+        }
+
+def extract_all(cache_path=None, **kwargs):
+    """Synchronous entry point (for Airflow tasks and scripts)"""
+    async def _run():
+        async with AsyncSpotifyExtractor(cache_path=cache_path) as extractor:
+            return await extractor.extract_all(**kwargs)
+    return asyncio.run(_run())
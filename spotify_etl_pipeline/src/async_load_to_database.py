@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import time
+import psycopg
+from config.database_config import DatabaseConfig
+from .load_metrics import LoadMetrics
+from .partitions import create_partition_sql, pending_months, remember_partition
+from .load_to_database import (
+    COPY_STAGING_SQL,
+    CREATE_STAGING_SQL,
+    MERGE_ARTISTS_SQL,
+    MERGE_HISTORY_SQL,
+    MERGE_TRACKS_SQL,
+    STAGING_TABLE,
+    UPSERT_USER_SQL,
+    staging_csv,
+    staging_frame,
+    user_params,
+)
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+class AsyncDatabaseLoader:
+    """
+    asyncio counterpart to DatabaseLoader (psycopg 3).
+
+    Each batch is COPY'd into the same staging table and merged with the same
+    statements as DatabaseLoader, but the merges are sent in pipeline mode
+    (one round trip instead of one per statement) and load_stream() prepares
+    chunk N+1 in a worker thread while chunk N is being written.
+
+    Usage:
+        async with AsyncDatabaseLoader() as loader:
+            await loader.load_stream(extractor.iter_saved_tracks())
+    """
+
+    def __init__(self, conninfo=None, statement_timeout_ms=None, metrics=None):
+        self.conninfo = conninfo or DatabaseConfig.get_connection_string()
+        self.statement_timeout_ms = (statement_timeout_ms if statement_timeout_ms is not None
+                                     else DatabaseConfig.STATEMENT_TIMEOUT_MS)
+        # COPY and transaction timings; pipelined merges share one round trip, so
+        # they are timed together as 'merge'
+        self.metrics = metrics or LoadMetrics()
+        self.connection = None
+        # Partition months created by the open transaction, cached once it commits
+        self._pending_months = []
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        """Open the database connection"""
+        if self.connection is None:
+            self.connection = await psycopg.AsyncConnection.connect(
+                self.conninfo,
+                options=f'-c statement_timeout={self.statement_timeout_ms}'
+            )
+
+    async def close(self):
+        """Close the database connection"""
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
+
+    async def _merge_tracks(self, cursor, tracks_df, user_id=None):
+        """
+        COPY tracks_df into the staging table and pipeline the merges into
+        artists, tracks and listening_history (see DatabaseLoader._merge_tracks).
+        Must run inside a transaction.
+        """
+        load_history = user_id is not None and 'played_at' in tracks_df
+        # Hashing and CSV encoding are CPU work; keep the event loop free
+        csv_text = await asyncio.to_thread(lambda: staging_csv(staging_frame(tracks_df)))
+        await cursor.execute(CREATE_STAGING_SQL)
+        started = time.perf_counter()
+        async with cursor.copy(COPY_STAGING_SQL) as copy:
+            await copy.write(csv_text)
+        self.metrics.observe_statement(STAGING_TABLE, time.perf_counter() - started, len(tracks_df),
+                                       len(tracks_df), len(csv_text.encode('utf-8')))
+
+        months = pending_months(tracks_df['played_at']) if load_history else []
+        started = time.perf_counter()
+        async with self.connection.pipeline():
+            await cursor.execute(MERGE_ARTISTS_SQL)
+            await cursor.execute(MERGE_TRACKS_SQL)
+            if load_history:
+                for month in months:
+                    await cursor.execute(create_partition_sql(month))
+                await cursor.execute(MERGE_HISTORY_SQL, (user_id,))
+        self.metrics.observe_statement('merge', time.perf_counter() - started)
+
+        self._pending_months += months
+
+    async def _load_chunk(self, tracks_df, user_id=None, profile_data=None):
+        """Write one chunk (and optionally the user row) in its own transaction; raises on failure"""
+        self._pending_months = []
+        started = time.perf_counter()
+        try:
+            async with self.connection.transaction():
+                async with self.connection.cursor() as cursor:
+                    if profile_data is not None:
+                        await cursor.execute(UPSERT_USER_SQL, user_params(profile_data))
+                    if tracks_df is not None and not tracks_df.empty:
+                        await self._merge_tracks(cursor, tracks_df, user_id)
+        except Exception:
+            self._pending_months = []
+            self.metrics.observe_transaction(time.perf_counter() - started, committed=False)
+            raise
+        self.metrics.observe_transaction(time.perf_counter() - started)
+
+        # Committed: a rolled-back CREATE never reaches the cache
+        for month in self._pending_months:
+            remember_partition(month)
+        self._pending_months = []
+        return 0 if tracks_df is None else len(tracks_df)
+
+    async def load_tracks(self, tracks_df, user_id=None):
+        """Load tracks data to database (async DatabaseLoader.load_tracks)"""
+        if tracks_df.empty:
+            return 0
+
+        try:
+            loaded = await self._load_chunk(tracks_df, user_id)
+            logger.info(f' Loaded {loaded} tracks')
+            return loaded
+
+        except Exception as e:
+            logger.error(f' Failed to load tracks: {e}')
+            return 0
+
+    async def load_batch(self, profile_data, tracks_df):
+        """
+        Load a user's profile and plays in a single transaction
+
+        Raises on failure, like DatabaseLoader.load_batch.
+        """
+        loaded = await self._load_chunk(tracks_df, profile_data['user_id'], profile_data)
+        logger.info(f' Loaded {profile_data["user_id"]} and {loaded} tracks')
+        return loaded
+
+    async def load_stream(self, chunks, user_id=None, transform=None, prefetch=1):
+        """
+        Load a stream of DataFrame chunks, one transaction per chunk
+
+        While chunk N is being written, up to `prefetch` further chunks are
+        pulled from `chunks` and passed through `transform` in a worker thread,
+        so extraction/transform and the database stay busy at the same time.
+
+        Args:
+            chunks: iterable or async iterable of DataFrames (e.g. extractor.iter_saved_tracks())
+            user_id: Owner of the plays, when chunks have played_at
+            transform: Optional function applied to each chunk before loading
+            prefetch: Chunks prepared ahead of the one being written
+
+        Raises on the first failed chunk; chunks before it stay committed.
+
+        Returns:
+            total rows loaded
+        """
+        queue = asyncio.Queue(maxsize=prefetch)
+
+        async def prepare(chunk_df):
+            if transform is not None:
+                chunk_df = await asyncio.to_thread(transform, chunk_df)
+            await queue.put(chunk_df)
+
+        async def produce():
+            try:
+                if hasattr(chunks, '__aiter__'):
+                    async for chunk_df in chunks:
+                        await prepare(chunk_df)
+                else:
+                    iterator = iter(chunks)
+                    while (chunk_df := await asyncio.to_thread(next, iterator, _DONE)) is not _DONE:
+                        await prepare(chunk_df)
+                await queue.put(_DONE)
+            except Exception as e:
+                await queue.put(e)
+
+        producer = asyncio.create_task(produce())
+        total = 0
+        try:
+            while (chunk_df := await queue.get()) is not _DONE:
+                if isinstance(chunk_df, Exception):
+                    raise chunk_df
+                if not chunk_df.empty:
+                    total += await self._load_chunk(chunk_df, user_id)
+        finally:
+            producer.cancel()
+
+        logger.info(f' Streamed {total} tracks into the database')
+        return total
+
+def load_stream(chunks, **kwargs):
+    """Synchronous entry point (for Airflow tasks and scripts)"""
+    async def _run():
+        async with AsyncDatabaseLoader() as loader:
+            return await loader.load_stream(chunks, **kwargs)
+    return asyncio.run(_run())
+
+if __name__ == '__main__':
+    # Smoke test against the configured (local) Postgres with synthetic tracks
+    from .parse_spotify import parse_top_tracks
+    from .replay_spotify import SyntheticLibrary
+
+    logging.basicConfig(level=logging.INFO)
+    library = SyntheticLibrary(distinct_tracks=5000)
+    chunks = (parse_top_tracks(library.track(n) for n in range(start, start + 1000))
+              for start in range(0, 5000, 1000))
+    print(f'Loaded {load_stream(chunks)} tracks')
@@ -1,53 +1,180 @@
+import fcntl
+import threading
+import time
+import requests
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+from spotipy.cache_handler import CacheFileHandler
+from spotipy.oauth2 import SpotifyOAuth, SpotifyOauthError
 from config.spotify_config import SpotifyConfig
+from .watermark_store import write_json_atomic
 import logging
 
 logger = logging.getLogger(__name__)
 
-def get_spotify_client():
+# Define the scopes (permissions) we need
+SCOPES = [
+    'user-read-private',
+    'user-read-email',
+    'user-read-recently-played',
+    'user-top-read', # Read user's top tracks/artists
+    'playlist-read-private', # Read private playlists
+    'user-library-read' #Read saved tracks
+]
+
+class LockedCacheFileHandler(CacheFileHandler):
+    """
+    Token cache shared by Celery workers and threads.
+
+    Tokens are written to a temp file and renamed into place, so readers never
+    see a half-written token; refreshes hold an flock so only one worker
+    refreshes an expiring token.
+    """
+
+    def __init__(self, cache_path):
+        super().__init__(cache_path=cache_path)
+        self.lock_path = f'{cache_path}.lock'
+
+    def lock(self):
+        """Exclusive inter-process lock on the token cache"""
+        lock_file = open(self.lock_path, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    @staticmethod
+    def unlock(lock_file):
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+    def save_token_to_cache(self, token_info):
+        # The temp file is created 0600, like spotipy's own cache file
+        try:
+            write_json_atomic(self.cache_path, token_info)
+        except OSError as e:
+            logger.warning(f"Couldn't write token to cache at {self.cache_path}: {e}")
+
+class SharedSpotifyOAuth(SpotifyOAuth):
+    """
+    SpotifyOAuth that refreshes early and serialises refreshes across processes
+
+    Unless interactive, a missing token raises instead of prompting for a
+    login, which a worker could never complete.
+    """
+
+    def __init__(self, *args, refresh_margin=None, interactive=False, **kwargs):
+        super().__init__(*args, open_browser=interactive, **kwargs)
+        self.refresh_margin = refresh_margin if refresh_margin is not None else SpotifyConfig.TOKEN_REFRESH_MARGIN
+        self.interactive = interactive
+
+    def get_auth_response(self, open_browser=None):
+        if not self.interactive:
+            raise SpotifyOauthError(
+                f'No usable token in {self.cache_handler.cache_path}; log in with python -m src.auth_spotify'
+            )
+        return super().get_auth_response(open_browser=open_browser)
+
+    def is_token_expired(self, token_info):
+        # Refresh a few minutes ahead so no request runs on a token about to expire
+        return token_info['expires_at'] - int(time.time()) < self.refresh_margin
+
+    def validate_token(self, token_info):
+        if token_info is None or not self.is_token_expired(token_info):
+            return super().validate_token(token_info)
+
+        # Another worker may have refreshed while we waited for the lock,
+        # so re-read the cache before refreshing ourselves
+        lock_file = self.cache_handler.lock()
+        try:
+            return super().validate_token(self.cache_handler.get_cached_token())
+        finally:
+            self.cache_handler.unlock(lock_file)
+
+def get_spotify_oauth(cache_path=None, interactive=False):
+    """
+    Create the OAuth manager for one token cache
+
+    Only interactive managers open a browser to log in; the ones used by
+    pipeline clients rely on the cached token.
+    """
+    cache_path = cache_path or SpotifyConfig.TOKEN_CACHE_PATH
+    return SharedSpotifyOAuth(
+        client_id=SpotifyConfig.CLIENT_ID,
+        client_secret=SpotifyConfig.CLIENT_SECRET,
+        redirect_uri=SpotifyConfig.REDIRECT_URI,
+        scope=' '.join(SCOPES),
+        cache_handler=LockedCacheFileHandler(cache_path),
+        interactive=interactive
+    )
+
+# One OAuth manager and one client per token cache, per process
+_oauth_managers = {}
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _get_oauth(cache_path):
+    cache_path = cache_path or SpotifyConfig.TOKEN_CACHE_PATH
+    with _clients_lock:
+        if cache_path not in _oauth_managers:
+            _oauth_managers[cache_path] = get_spotify_oauth(cache_path)
+        return _oauth_managers[cache_path]
+
+def get_auth_manager(cache_path=None):
     """
-    Create and return an authentication Spotify client
-    This will open  browser window for first-time authentication
-    After that, tokens are cached in .cache file
+    The process-wide OAuth manager for a token cache
+
+    Its get_access_token(as_dict=False) returns the cached token, refreshed
+    (once across workers) when it is about to expire.
+    """
+    return _get_oauth(cache_path)
+
+def new_spotify_client(**kwargs):
+    """
+    spotipy client whose session never retries
+
+    spotipy's default session retries 429/5xx in urllib3 and, once retries run
+    out, raises a 429 without headers. With a plain session every 429 and 5xx
+    reaches the shared RateLimiter with its real status and Retry-After.
     """
+    return spotipy.Spotify(requests_session=requests.Session(), **kwargs)
+
+def get_spotify_client(cache_path=None):
+    """
+    Return the process-wide authenticated Spotify client for a token cache
+
+    Tokens come from the cache file (written by `python -m src.auth_spotify`)
+    and are refreshed automatically before they expire. The client is built
+    once per process and reused.
+    """
+    cache_path = cache_path or SpotifyConfig.TOKEN_CACHE_PATH
+    with _clients_lock:
+        if cache_path in _clients:
+            return _clients[cache_path]
+
     try:
-        # Define the scopes (permissions) we need
-        scope = [
-            'user-read-private',
-            'user-read-email',
-            'user-read-recently-played',
-            'user-top-read', # Read user's top tracks/artists
-            'playlist-read-private', # Read private playlists
-            'user-library-read' #Read saved tracks
-        ]
-
-        # Create Spotify OAuth object
-        sp_oauth = SpotifyOAuth(
-            client_id=SpotifyConfig.CLIENT_ID,
-            client_secret=SpotifyConfig.CLIENT_SECRET,
-            redirect_uri=SpotifyConfig.REDIRECT_URI,
-            scope=' '.join(scope),
-            cache_path='.spotify_cache',
-            open_browser=True
-        )
-
-        # Get access token (opens browser if needed)
-        token_info = sp_oauth.get_access_token(as_dict=True)
-
-        if not token_info:
+        sp_oauth = _get_oauth(cache_path)
+
+        # Make sure a token exists without any API call
+        if not sp_oauth.get_access_token(as_dict=True):
             logger.error('Failed to get access token')
             return None
 
-            # Create Spotify client
-        sp = spotipy.Spotify(auth=token_info['access_token'])
-
-            # Test the connection
-        user = sp.current_user()
-        logger.info(f' Successfully connected to Spotify as: {user['display_name']}')
+        # The auth manager refreshes the token on demand;
+        # retries are handled by the shared rate limiter, not by spotipy/urllib3
+        sp = new_spotify_client(auth_manager=sp_oauth)
 
+        with _clients_lock:
+            sp = _clients.setdefault(cache_path, sp)
+        logger.info(f' Spotify client ready ({cache_path})')
         return sp
 
     except Exception as e:
         logger.error(f' authentication failed: {e}')
         return None
+
+if __name__ == '__main__':
+    import sys
+
+    # One-off login: opens a browser and writes the token cache the pipeline reads
+    logging.basicConfig(level=logging.INFO)
+    cache_path = sys.argv[1] if len(sys.argv) > 1 else None
+    if get_spotify_oauth(cache_path, interactive=True).get_access_token(as_dict=False):
+        logger.info(f' Token cached at {cache_path or SpotifyConfig.TOKEN_CACHE_PATH}')
@@ -0,0 +1,195 @@
+import logging
+from datetime import datetime, timezone
+import pandas as pd
+from psycopg2.extras import execute_values
+from config.database_config import DatabaseConfig
+from .db_pool import get_pool
+from .transform_spotify import to_utc
+from .watermark_store import WatermarkStore
+
+logger = logging.getLogger(__name__)
+
+METRICS_TABLE = 'data_quality_metrics'
+
+# Columns whose null rate is tracked, per table
+HISTORY_NULL_COLUMNS = ['track_id', 'context_type']
+TRACK_NULL_COLUMNS = ['track_name', 'artist_id', 'album_id', 'duration_ms']
+
+# listening_history rows of one batch: the user plus the batch's played_at range,
+# so only the matching partitions (and the user_id index) are touched
+BATCH_HISTORY_SQL = f"""
+    SELECT COUNT(*),
+           {', '.join(f'COUNT(*) - COUNT(h.{c})' for c in HISTORY_NULL_COLUMNS)},
+           COUNT(*) - COUNT(DISTINCT (h.played_at, h.track_id)),
+           COUNT(*) FILTER (WHERE h.track_id IS NOT NULL AND t.track_id IS NULL),
+           MAX(h.played_at)
+    FROM listening_history h
+    LEFT JOIN tracks t ON t.track_id = h.track_id
+    WHERE h.user_id = %s AND h.played_at BETWEEN %s AND %s
+"""
+
+# tracks rows of one batch, by primary key
+BATCH_TRACKS_SQL = f"""
+    SELECT COUNT(*), {', '.join(f'COUNT(*) - COUNT({c})' for c in TRACK_NULL_COLUMNS)}
+    FROM tracks WHERE track_id = ANY(%s)
+"""
+
+INSERT_METRICS_SQL = f"""
+    INSERT INTO {METRICS_TABLE}
+        (run_id, user_id, check_name, metric, value, threshold, passed, batch_rows)
+    VALUES %s
+"""
+
+def _rate(count, total):
+    return count / total if total else 0.0
+
+class DataQualityEngine:
+    """
+    Data-quality checks over the rows of one loaded batch.
+
+    - row counts: plays in the database vs. distinct plays staged
+    - null rates of key columns in listening_history and tracks
+    - duplicate keys, in the batch and in listening_history
+    - freshness lag of the newest play
+    - referential integrity of the batch's plays against tracks
+
+    Every query is bounded by the batch (user + played_at range, or track
+    primary keys), so cost follows batch size rather than table size. Each
+    metric is stored as a row of data_quality_metrics for trend queries.
+    """
+
+    def __init__(self, connection=None, max_null_rate=None, max_freshness_lag_hours=None, watermark_store=None):
+        self._pooled = connection is None
+        self.connection = connection or get_pool().getconn()
+        self.max_null_rate = max_null_rate if max_null_rate is not None else DatabaseConfig.DQ_MAX_NULL_RATE
+        self.max_freshness_lag_hours = (max_freshness_lag_hours if max_freshness_lag_hours is not None
+                                        else DatabaseConfig.DQ_MAX_FRESHNESS_LAG_HOURS)
+        self.watermarks = watermark_store or WatermarkStore()
+
+    def close(self):
+        if self._pooled and self.connection is not None:
+            get_pool().putconn(self.connection)
+            self.connection = None
+
+    def _result(self, check, metric, value, threshold=None, passed=None):
+        return {'check': check, 'metric': metric, 'value': value, 'threshold': threshold, 'passed': passed}
+
+    def _null_rates(self, table, columns, null_counts, total):
+        return [
+            self._result('null_rate', f'null_rate.{table}.{column}', _rate(nulls, total), self.max_null_rate,
+                         _rate(nulls, total) <= self.max_null_rate)
+            for column, nulls in zip(columns, null_counts)
+        ]
+
+    def _freshness(self, newest_played_at):
+        if newest_played_at is None or pd.isna(newest_played_at):
+            return []
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        lag_hours = (now - pd.Timestamp(newest_played_at).to_pydatetime()).total_seconds() / 3600
+        return [self._result('freshness', 'freshness_lag_hours', round(lag_hours, 3),
+                             self.max_freshness_lag_hours, lag_hours <= self.max_freshness_lag_hours)]
+
+    def run_checks(self, user_id, tracks_df):
+        """
+        Compute every check for one user's batch (tracks_df needs track_id and played_at)
+
+        Returns:
+            list of {'check', 'metric', 'value', 'threshold', 'passed'}
+        """
+        results = []
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('SELECT COUNT(*) FROM users WHERE user_id = %s', (user_id,))
+            user_rows = cursor.fetchone()[0]
+            results.append(self._result('referential_integrity', 'user_exists', user_rows, 1, user_rows >= 1))
+
+            batch = tracks_df[['track_id', 'played_at']].dropna()
+            results.append(self._result('row_count', 'row_count.batch', len(tracks_df)))
+            if batch.empty:
+                # Nothing new: freshness comes from the watermark
+                watermark_ms = self.watermarks.get(user_id)
+                newest = pd.Timestamp(watermark_ms, unit='ms') if watermark_ms is not None else None
+                return results + self._freshness(newest)
+
+            played_at = to_utc(batch['played_at'])
+            batch_duplicates = int(batch.assign(played_at=played_at).duplicated().sum())
+            expected = len(batch) - batch_duplicates
+            results.append(self._result('duplicate_keys', 'duplicate_keys.batch', batch_duplicates, 0,
+                                        batch_duplicates == 0))
+
+            cursor.execute(BATCH_HISTORY_SQL, (user_id, played_at.min().to_pydatetime(),
+                                               played_at.max().to_pydatetime()))
+            row = cursor.fetchone()
+            loaded, null_counts = row[0], row[1:1 + len(HISTORY_NULL_COLUMNS)]
+            duplicates, orphans, newest = row[1 + len(HISTORY_NULL_COLUMNS):]
+            results.append(self._result('row_count', 'row_count.listening_history', loaded, expected,
+                                        loaded >= expected))
+            results.extend(self._null_rates('listening_history', HISTORY_NULL_COLUMNS, null_counts, loaded))
+            results.append(self._result('duplicate_keys', 'duplicate_keys.listening_history', duplicates, 0,
+                                        duplicates == 0))
+            results.append(self._result('referential_integrity', 'orphan_plays.listening_history', orphans, 0,
+                                        orphans == 0))
+            results.extend(self._freshness(newest))
+
+            track_ids = batch['track_id'].astype(str).unique().tolist()
+            cursor.execute(BATCH_TRACKS_SQL, (track_ids,))
+            row = cursor.fetchone()
+            missing = len(track_ids) - row[0]
+            results.append(self._result('referential_integrity', 'missing_tracks.batch', missing, 0, missing == 0))
+            results.extend(self._null_rates('tracks', TRACK_NULL_COLUMNS, row[1:], row[0]))
+            return results
+        finally:
+            self.connection.rollback()
+            cursor.close()
+
+    def record(self, run_id, user_id, results, batch_rows):
+        """Store results as rows of data_quality_metrics"""
+        cursor = self.connection.cursor()
+        try:
+            execute_values(cursor, INSERT_METRICS_SQL, [
+                (run_id, user_id, r['check'], r['metric'], r['value'], r['threshold'], r['passed'], batch_rows)
+                for r in results
+            ])
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def check_batch(self, run_id, user_id, tracks_df):
+        """
+        Run and record every check for one user's batch
+
+        Returns:
+            {'user_id', 'rows', 'passed', 'failed': [metric, ...], 'metrics': {metric: value}}
+        """
+        results = self.run_checks(user_id, tracks_df)
+        self.record(run_id, user_id, results, len(tracks_df))
+
+        failed = [r['metric'] for r in results if r['passed'] is False]
+        for r in results:
+            if r['passed'] is False:
+                logger.warning(f'Data quality check {r["metric"]} failed for {user_id}: '
+                               f'{r["value"]} (threshold {r["threshold"]})')
+        logger.info(f'Data quality for {user_id}: {len(results) - len(failed)}/{len(results)} metrics ok')
+        return {
+            'user_id': user_id,
+            'rows': len(tracks_df),
+            'passed': not failed,
+            'failed': failed,
+            'metrics': {r['metric']: r['value'] for r in results},
+        }
+
+    def history(self, metric, limit=30):
+        """Most recent values of one metric, newest first: [(checked_at, user_id, value, passed)]"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT checked_at, user_id, value, passed FROM {METRICS_TABLE}
+                WHERE metric = %s ORDER BY checked_at DESC LIMIT %s
+            """, (metric, limit))
+            return cursor.fetchall()
+        finally:
+            self.connection.rollback()
+            cursor.close()
@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions, pool
+from config.database_config import DatabaseConfig
+
+logger = logging.getLogger(__name__)
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 connection pool with health checks and a statement timeout.
+
+    getconn() blocks (up to `timeout` seconds) when all `max_size` connections
+    are in use instead of failing, so bursts of worker threads queue up rather
+    than exhausting max_connections on the server.
+    """
+
+    def __init__(self, dsn=None, min_size=None, max_size=None, timeout=None,
+                 statement_timeout_ms=None, health_check_after=None):
+        self.dsn = dsn or DatabaseConfig.get_connection_string()
+        self.min_size = min_size if min_size is not None else DatabaseConfig.POOL_MIN_SIZE
+        self.max_size = max_size if max_size is not None else DatabaseConfig.POOL_MAX_SIZE
+        self.timeout = timeout if timeout is not None else DatabaseConfig.POOL_TIMEOUT
+        self.health_check_after = (health_check_after if health_check_after is not None
+                                   else DatabaseConfig.POOL_HEALTH_CHECK_AFTER)
+        statement_timeout_ms = (statement_timeout_ms if statement_timeout_ms is not None
+                                else DatabaseConfig.STATEMENT_TIMEOUT_MS)
+
+        self._pool = pool.ThreadedConnectionPool(
+            self.min_size,
+            self.max_size,
+            dsn=self.dsn,
+            options=f'-c statement_timeout={statement_timeout_ms}'
+        )
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._last_used = {}
+        self._lock = threading.Lock()
+        logger.info(f'Connection pool ready ({self.min_size}-{self.max_size} connections)')
+
+    def _is_healthy(self, connection):
+        if connection.closed:
+            return False
+        with self._lock:
+            idle = time.monotonic() - self._last_used.get(id(connection), 0)
+        if idle < self.health_check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Check out a healthy connection (caller must putconn it)"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise pool.PoolError(f'No database connection available within {self.timeout}s')
+        try:
+            connection = self._pool.getconn()
+            if not self._is_healthy(connection):
+                logger.warning('Discarding broken pooled connection')
+                self._pool.putconn(connection, close=True)
+                connection = self._pool.getconn()
+            return connection
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, connection, close=False):
+        """Return a connection to the pool, rolling back anything left open"""
+        try:
+            if not connection.closed and connection.status != extensions.STATUS_READY:
+                connection.rollback()
+        except psycopg2.Error:
+            close = True
+        with self._lock:
+            self._last_used[id(connection)] = time.monotonic()
+        self._pool.putconn(connection, close=close or bool(connection.closed))
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        with get_pool().connection() as connection:
+            ...  # commit explicitly; uncommitted work is rolled back on return
+        """
+        connection = self.getconn()
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def close(self):
+        self._pool.closeall()
+
+@contextmanager
+def without_statement_timeout(connection):
+    """
+    Lift the pool's statement_timeout on this session for a long job
+    (migrations, backfills), restoring it before the connection is returned
+
+    Open work on the connection is rolled back on the way out.
+    """
+    # SET/RESET are committed, or a later rollback would undo them
+    with connection.cursor() as cursor:
+        cursor.execute('SET statement_timeout = 0')
+    connection.commit()
+    try:
+        yield connection
+    finally:
+        if not connection.closed:
+            connection.rollback()
+            with connection.cursor() as cursor:
+                cursor.execute('RESET statement_timeout')
+            connection.commit()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Process-wide connection pool built from DatabaseConfig"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+def close_pool():
+    """Close every pooled connection (e.g. at process shutdown)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -0,0 +1,119 @@
+import logging
+import time
+from .db_pool import get_pool, without_statement_timeout
+from .migrations import drop_invalid_index
+from .partitions import is_partitioned
+
+logger = logging.getLogger(__name__)
+
+CONSTRAINT_NAME = 'uq_listening_history_play'
+# Session temp table: one row per duplicated play with the history_id to keep
+KEEP_TABLE = 'dedup_keep'
+
+def delete_duplicates(connection, batch_size=50000, pause_seconds=0.1):
+    """
+    Delete duplicate plays (same user_id, played_at, track_id), keeping the oldest row
+
+    The keep set (oldest history_id per duplicated play) is computed once into
+    a temp table, so each batch joins a history_id range against that small
+    table instead of scanning listening_history again. Batches of `batch_size`
+    history_ids commit one by one, so locks are short and the table stays
+    writable while it runs.
+
+    Returns:
+        number of rows deleted
+    """
+    cursor = connection.cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS {KEEP_TABLE}')
+    cursor.execute(f"""
+        CREATE TEMP TABLE {KEEP_TABLE} AS
+        SELECT user_id, played_at, track_id, MIN(history_id) AS keep_id, MAX(history_id) AS last_id
+        FROM listening_history
+        GROUP BY user_id, played_at, track_id
+        HAVING COUNT(*) > 1
+    """)
+    cursor.execute(f'CREATE INDEX ON {KEEP_TABLE} (user_id, played_at, track_id)')
+    cursor.execute(f'ANALYZE {KEEP_TABLE}')
+    # Only the history_id range that holds duplicates needs visiting
+    cursor.execute(f'SELECT MIN(keep_id) + 1, MAX(last_id) FROM {KEEP_TABLE}')
+    low, high = cursor.fetchone()
+    connection.commit()
+
+    deleted = 0
+    if low is not None:
+        for start in range(low, high + 1, batch_size):
+            cursor.execute(f"""
+                DELETE FROM listening_history dup
+                USING {KEEP_TABLE} keep
+                WHERE dup.history_id BETWEEN %s AND %s
+                  AND keep.user_id = dup.user_id
+                  AND keep.played_at = dup.played_at
+                  AND keep.track_id = dup.track_id
+                  AND dup.history_id > keep.keep_id
+            """, (start, start + batch_size - 1))
+            deleted += cursor.rowcount
+            connection.commit()
+            logger.info(f'history_id {start}-{start + batch_size - 1}: {deleted} duplicates deleted so far')
+            if pause_seconds:
+                time.sleep(pause_seconds)
+
+    cursor.execute(f'DROP TABLE IF EXISTS {KEEP_TABLE}')
+    connection.commit()
+    cursor.close()
+    return deleted
+
+def add_unique_constraint(connection):
+    """Build the natural-key index without blocking writes, then attach it as a constraint"""
+    cursor = connection.cursor()
+    cursor.execute('SELECT 1 FROM pg_constraint WHERE conname = %s', (CONSTRAINT_NAME,))
+    if cursor.fetchone():
+        logger.info(f'{CONSTRAINT_NAME} already exists')
+        cursor.close()
+        return
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    connection.autocommit = True
+    try:
+        drop_invalid_index(cursor, CONSTRAINT_NAME)
+        cursor.execute(f"""
+            CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {CONSTRAINT_NAME}
+            ON listening_history (user_id, played_at, track_id)
+        """)
+        cursor.execute(f"""
+            ALTER TABLE listening_history
+            ADD CONSTRAINT {CONSTRAINT_NAME} UNIQUE USING INDEX {CONSTRAINT_NAME}
+        """)
+    finally:
+        connection.autocommit = False
+        cursor.close()
+    logger.info(f'Added {CONSTRAINT_NAME} on listening_history')
+
+def dedup_listening_history(batch_size=50000, pause_seconds=0.1):
+    """
+    One-off job for a pre-partitioning (v1) listening_history: remove existing
+    duplicate plays, then enforce uniqueness
+
+    The partitioned table from schema v2 already has the unique key (and
+    CREATE INDEX CONCURRENTLY cannot run on a partitioned parent), so the job
+    does nothing there.
+    """
+    with get_pool().connection() as connection:
+        with connection.cursor() as cursor:
+            partitioned = is_partitioned(cursor)
+        connection.rollback()
+        if partitioned:
+            logger.info('listening_history is partitioned and already unique on its play key; nothing to do')
+            return 0
+
+        logger.info('Deduplicating listening_history...')
+        # The keep-set scan and the index build can outlast the pool's statement_timeout
+        with without_statement_timeout(connection):
+            deleted = delete_duplicates(connection, batch_size, pause_seconds)
+            logger.info(f'Deleted {deleted} duplicate plays')
+            # Plays inserted while the batches ran can still be duplicates; one more pass
+            deleted += delete_duplicates(connection, batch_size, 0)
+            add_unique_constraint(connection)
+    return deleted
+
+if __name__ == '__main__':
+    dedup_listening_history()
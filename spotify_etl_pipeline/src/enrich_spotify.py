@@ -0,0 +1,141 @@
+import logging
+import pandas as pd
+from .parse_spotify import parse_top_tracks
+
+logger = logging.getLogger(__name__)
+
+AUDIO_FEATURE_COLUMNS = [
+    'danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness',
+    'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo',
+    'duration_ms', 'time_signature'
+]
+
+def collect_ids(*frames):
+    """
+    Collect every track, artist and album ID from extracted DataFrames
+
+    Returns:
+        dict of sets: {'tracks': ..., 'artists': ..., 'albums': ...}
+    """
+    ids = {'tracks': set(), 'artists': set(), 'albums': set()}
+    for df in frames:
+        if df is None or df.empty:
+            continue
+        if 'track_id' in df:
+            ids['tracks'].update(df['track_id'].dropna())
+        if 'album_id' in df:
+            ids['albums'].update(df['album_id'].dropna())
+        if 'artist_ids' in df:
+            ids['artists'].update(a for artist_ids in df['artist_ids'].dropna() for a in artist_ids)
+        elif 'artist_id' in df:
+            ids['artists'].update(df['artist_id'].dropna())
+
+    # Local files and podcasts come through with empty IDs
+    return {kind: {i for i in values if i} for kind, values in ids.items()}
+
+class SpotifyEnricher:
+    """
+    Fill artists, albums, tracks and audio_features for IDs seen in a run.
+
+    Only IDs that are not yet in Postgres are looked up, through
+    SpotifyExtractor.get_entities (metadata cache first, then the API's bulk
+    endpoints at their maximum batch size).
+    """
+
+    def __init__(self, extractor, loader):
+        self.extractor = extractor
+        self.loader = loader
+
+    def _missing(self, query, ids):
+        """Return the subset of ids not matched by `query` (which selects existing IDs)"""
+        if not ids:
+            return []
+        self.loader.cursor.execute(query, (list(ids),))
+        existing = {row[0] for row in self.loader.cursor.fetchall()}
+        return sorted(set(ids) - existing)
+
+    def fetch_artists(self, artist_ids):
+        artists = self.extractor.get_entities('artists', artist_ids)
+        return pd.DataFrame([{
+            'artist_id': artist['id'],
+            'artist_name': artist['name'],
+            'genres': artist.get('genres', []),
+            'popularity': artist.get('popularity'),
+            'followers': (artist.get('followers') or {}).get('total'),
+        } for artist in artists])
+
+    def fetch_albums(self, album_ids):
+        albums = self.extractor.get_entities('albums', album_ids)
+        return pd.DataFrame([{
+            'album_id': album['id'],
+            'album_name': album['name'],
+            'artist_id': album['artists'][0]['id'] if album.get('artists') else None,
+            'album_type': album.get('album_type'),
+            'release_date': album.get('release_date'),
+            'total_tracks': album.get('total_tracks'),
+            'album_image_url': album['images'][0]['url'] if album.get('images') else '',
+        } for album in albums])
+
+    def fetch_tracks(self, track_ids):
+        tracks = self.extractor.get_entities('tracks', track_ids)
+        return parse_top_tracks(tracks)
+
+    def fetch_audio_features(self, track_ids):
+        features = self.extractor.get_entities('audio_features', track_ids)
+        if not features:
+            return pd.DataFrame()
+        features_df = pd.DataFrame(features).rename(columns={'id': 'track_id'})
+        return features_df[['track_id'] + AUDIO_FEATURE_COLUMNS]
+
+    def enrich(self, *frames):
+        """
+        Enrich every entity referenced by the given DataFrames
+
+        Returns:
+            dict with the number of entities fetched per type
+        """
+        ids = collect_ids(*frames)
+        logger.info(
+            f"Enrichment candidates: {len(ids['tracks'])} tracks, "
+            f"{len(ids['artists'])} artists, {len(ids['albums'])} albums"
+        )
+
+        # Artists first: albums and tracks reference them
+        new_artists = self._missing(
+            'SELECT artist_id FROM artists WHERE artist_id = ANY(%s) AND popularity IS NOT NULL',
+            ids['artists']
+        )
+        new_albums = self._missing('SELECT album_id FROM albums WHERE album_id = ANY(%s)', ids['albums'])
+        new_tracks = self._missing('SELECT track_id FROM tracks WHERE track_id = ANY(%s)', ids['tracks'])
+        new_features = self._missing(
+            'SELECT track_id FROM audio_features WHERE track_id = ANY(%s)',
+            ids['tracks']
+        )
+
+        artists_df = self.fetch_artists(new_artists)
+        albums_df = self.fetch_albums(new_albums)
+        tracks_df = self.fetch_tracks(new_tracks)
+        features_df = self.fetch_audio_features(new_features)
+
+        # Album/track artists that were not in the run itself still need a row
+        extra_artists = set()
+        for df in (albums_df, tracks_df):
+            if not df.empty:
+                extra_artists.update(df['artist_id'].dropna())
+        extra_artists -= set(new_artists) | ids['artists']
+        if extra_artists:
+            artists_df = pd.concat([artists_df, self.fetch_artists(sorted(extra_artists))], ignore_index=True)
+
+        self.loader.load_artist_details(artists_df)
+        self.loader.load_albums(albums_df)
+        self.loader.load_tracks(tracks_df)
+        self.loader.load_audio_features(features_df)
+
+        summary = {
+            'artists': len(artists_df),
+            'albums': len(albums_df),
+            'tracks': len(tracks_df),
+            'audio_features': len(features_df),
+        }
+        logger.info(f'Enrichment complete: {summary}')
+        return summary
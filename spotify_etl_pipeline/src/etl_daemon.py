@@ -0,0 +1,259 @@
+import json
+import logging
+import math
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from config.database_config import DatabaseConfig
+from config.spotify_config import SpotifyConfig
+from .db_pool import close_pool, get_pool
+from .load_metrics import close_lock_wait_sampler
+from .etl_pipeline import run_etl
+from .extract_spotify import SpotifyExtractor
+from .multi_user_etl import discover_token_caches
+from .watermark_store import file_lock, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# pg_try_advisory_lock(key, hashtext(user)): one run per user across every daemon process
+USER_LOCK_KEY = 72_605_312
+
+# Missed slots counted at most this far back (they are caught up in one run anyway)
+MAX_MISSED_SLOTS = 10_000
+
+# Pooled connections held by one run: the advisory lock and the DatabaseLoader
+CONNECTIONS_PER_RUN = 2
+
+# Default single-user token cache, when no per-user caches exist
+DEFAULT_USER = 'default'
+
+class IntervalSchedule:
+    """Every `seconds`, on a grid aligned to `anchor` (local time, default midnight)"""
+
+    def __init__(self, seconds, anchor=None):
+        if seconds <= 0:
+            raise ValueError('Schedule interval must be positive')
+        self.seconds = seconds
+        self.anchor = anchor or datetime(2000, 1, 1)
+
+    def next_after(self, moment):
+        """First slot strictly after moment"""
+        elapsed = (moment - self.anchor).total_seconds()
+        return self.anchor + timedelta(seconds=(math.floor(elapsed / self.seconds) + 1) * self.seconds)
+
+    def __repr__(self):
+        return f'every {self.seconds:g}s'
+
+class DailySchedule(IntervalSchedule):
+    """Once a day at `at` ('HH:MM', local time)"""
+
+    def __init__(self, at='02:00'):
+        hour, minute = (int(part) for part in at.split(':'))
+        super().__init__(24 * 3600, datetime(2000, 1, 1, hour, minute))
+        self.at = at
+
+    def __repr__(self):
+        return f'daily at {self.at}'
+
+def parse_schedule(spec):
+    """'daily@HH:MM' or 'every:<seconds>' -> schedule"""
+    kind, _, value = spec.partition('@' if spec.startswith('daily') else ':')
+    if kind == 'daily':
+        return DailySchedule(value or '02:00')
+    if kind == 'every':
+        return IntervalSchedule(float(value))
+    raise ValueError(f'Unknown schedule {spec!r}')
+
+def due_slots(schedule, last, now):
+    """
+    Slots after `last` that are due by `now`, oldest first (capped at MAX_MISSED_SLOTS)
+
+    Any object with next_after(moment) works as a schedule. A user that has
+    never run is due at once.
+    """
+    if last is None:
+        return [now]
+    slots = []
+    slot = schedule.next_after(last)
+    while slot <= now and len(slots) < MAX_MISSED_SLOTS:
+        slots.append(slot)
+        slot = schedule.next_after(slot)
+    return slots
+
+class DaemonState:
+    """Last completed schedule slot per user, persisted so missed slots survive a restart"""
+
+    def __init__(self, path=None):
+        self.path = path or SpotifyConfig.DAEMON_STATE_PATH
+        self._lock = threading.Lock()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Could not read daemon state from {self.path}: {e}')
+            return {}
+
+    def get(self, user):
+        with self._lock:
+            value = self._read().get(user)
+        return datetime.fromisoformat(value) if value else None
+
+    def set(self, user, slot):
+        with self._lock, file_lock(self.path):
+            state = self._read()
+            state[user] = slot.isoformat()
+            write_json_atomic(self.path, state)
+
+class ETLDaemon:
+    """
+    Long-running scheduler for run_etl, one run per user per schedule slot.
+
+    - schedule: anything with next_after(moment) (see IntervalSchedule, DailySchedule)
+    - single-flight: a user whose run is still going is skipped, in this
+      process and (through a Postgres advisory lock) in any other daemon
+    - catch-up: slots missed while down or busy are found from the persisted
+      state and caught up by one run per user, at most max_concurrent_runs at once
+    - failed runs are retried after retry_delay, without advancing the state
+    - SIGTERM/SIGINT stop scheduling, cancel queued runs and wait up to
+      drain_timeout for running ones (their loads commit per transaction)
+    - one SpotifyExtractor per user and the process-wide connection pool are
+      reused for every run
+    """
+
+    discover_every = 300
+
+    def __init__(self, schedule=None, run=None, users=None, max_concurrent_runs=None, poll_seconds=None,
+                 retry_delay=None, drain_timeout=None, state=None):
+        schedule = schedule or SpotifyConfig.DAEMON_SCHEDULE
+        self.schedule = parse_schedule(schedule) if isinstance(schedule, str) else schedule
+        # run(extractor) -> result, or None on failure
+        self.run = run or run_etl
+        # {user: token cache path}; discovered from TOKEN_CACHE_DIR when not given
+        self._fixed_users = users
+        self.max_concurrent_runs = max_concurrent_runs or SpotifyConfig.DAEMON_MAX_CONCURRENT_RUNS
+        if self.max_concurrent_runs * CONNECTIONS_PER_RUN > DatabaseConfig.POOL_MAX_SIZE:
+            raise ValueError(f'{self.max_concurrent_runs} concurrent runs need {CONNECTIONS_PER_RUN} pooled connections '
+                             f'each, but SPOTIFY_DB_POOL_MAX is {DatabaseConfig.POOL_MAX_SIZE}')
+        self.poll_seconds = poll_seconds if poll_seconds is not None else SpotifyConfig.DAEMON_POLL_SECONDS
+        self.retry_delay = retry_delay if retry_delay is not None else SpotifyConfig.DAEMON_RETRY_DELAY
+        self.drain_timeout = drain_timeout if drain_timeout is not None else SpotifyConfig.DAEMON_DRAIN_TIMEOUT
+        self.state = state or DaemonState()
+
+        self.executor = ThreadPoolExecutor(self.max_concurrent_runs, thread_name_prefix='spotify-etl')
+        self.extractors = {}
+        self._running = {}
+        self._retry_at = {}
+        self._users = {}
+        self._discovered_at = None
+        self._stop = threading.Event()
+
+    def users(self, now):
+        if self._fixed_users is not None:
+            return self._fixed_users
+        if self._discovered_at is None or (now - self._discovered_at).total_seconds() >= self.discover_every:
+            paths = discover_token_caches()
+            self._users = {os.path.basename(path): path for path in paths} or {DEFAULT_USER: None}
+            self._discovered_at = now
+        return self._users
+
+    def extractor(self, user, cache_path):
+        """The user's long-lived extractor (built on first use)"""
+        if user not in self.extractors:
+            self.extractors[user] = SpotifyExtractor(cache_path=cache_path)
+        return self.extractors[user]
+
+    def tick(self, now=None):
+        """Submit a run for every user with a due slot that isn't already running"""
+        now = now or datetime.now()
+        self._running = {user: future for user, future in self._running.items() if not future.done()}
+
+        submitted = []
+        for user, cache_path in self.users(now).items():
+            if self._stop.is_set():
+                break
+            if user in self._running:
+                continue
+            if self._retry_at.get(user, now) > now:
+                continue
+            slots = due_slots(self.schedule, self.state.get(user), now)
+            if not slots:
+                continue
+            if len(slots) > 1:
+                logger.info(f'{user}: catching up {len(slots)} missed runs ({slots[0]} to {slots[-1]}) in one')
+            self._running[user] = self.executor.submit(self._run_user, user, cache_path, slots[-1])
+            submitted.append(user)
+        return submitted
+
+    def _run_user(self, user, cache_path, slot):
+        """Run one user under its advisory lock; the slot is recorded only on success"""
+        started = time.perf_counter()
+        try:
+            with get_pool().connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute('SELECT pg_try_advisory_lock(%s, hashtext(%s))', (USER_LOCK_KEY, user))
+                locked = cursor.fetchone()[0]
+                connection.commit()
+                if not locked:
+                    logger.info(f'{user}: already running in another process; skipping slot {slot}')
+                    return None
+                try:
+                    result = self.run(self.extractor(user, cache_path))
+                finally:
+                    cursor.execute('SELECT pg_advisory_unlock(%s, hashtext(%s))', (USER_LOCK_KEY, user))
+                    connection.commit()
+                    cursor.close()
+        except Exception as e:
+            logger.error(f'{user}: run for {slot} failed: {e}')
+            result = None
+
+        if result is None:
+            self._retry_at[user] = datetime.now() + timedelta(seconds=self.retry_delay)
+            logger.warning(f'{user}: no result for {slot}; retrying in {self.retry_delay:g}s')
+            return None
+
+        self._retry_at.pop(user, None)
+        self.state.set(user, slot)
+        logger.info(f'{user}: run for {slot} finished in {time.perf_counter() - started:.1f}s')
+        return result
+
+    def stop(self, *_):
+        """Stop scheduling new runs (safe to call from a signal handler)"""
+        self._stop.set()
+
+    def serve(self):
+        """Run until stopped, then drain in-flight runs"""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        logger.info(f'ETL daemon started ({self.schedule}, up to {self.max_concurrent_runs} runs at once)')
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.tick()
+                except Exception as e:
+                    logger.error(f'Scheduler tick failed: {e}')
+                self._stop.wait(self.poll_seconds)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Cancel queued runs, wait up to drain_timeout for running ones, release database connections"""
+        self._stop.set()
+        futures = [future for future in self._running.values() if not future.cancel() and not future.done()]
+        if futures:
+            logger.info(f'Draining {len(futures)} in-flight runs (up to {self.drain_timeout:g}s)...')
+            _, pending = wait(futures, timeout=self.drain_timeout)
+            if pending:
+                logger.warning(f'{len(pending)} runs still in flight after the drain timeout')
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        close_lock_wait_sampler()
+        close_pool()
+        logger.info('ETL daemon stopped')
@@ -1,52 +1,89 @@
+import argparse
 import logging
 from .extract_spotify import SpotifyExtractor
 from .load_to_database import DatabaseLoader
-import schedule
-import time
+from .enrich_spotify import SpotifyEnricher
+from .transform_spotify import etl_now, transform_profile, transform_tracks
 
 logger = logging.getLogger(__name__)
 
-def run_etl():
-    """Run complete ETL pipeline"""
+def run_etl(extractor=None):
+    """
+    Run complete ETL pipeline
+
+    Pass a long-lived extractor (as the daemon does) to reuse its Spotify
+    client; the database connection always comes from the shared pool.
+
+    Returns:
+        number of tracks processed, or None if the run failed
+    """
     logger.info('Start Spotify ETL Pipeline...')
+    loader = None
 
     try:
         # EXTRACT
-        extractor = SpotifyExtractor()
+        extractor = extractor or SpotifyExtractor()
 
-        # Get user profile
+        # Get user profile; plays can't be stored (or watermarked) without its user_id
         profile = extractor.get_user_profile()
+        if not profile:
+            logger.error('ETL Pipeline failed: no user profile')
+            return None
 
-        resent_tracks = extractor.get_recent_played(limit=50)
+        # Only plays newer than the last successful run
+        resent_tracks = extractor.get_recent_played(incremental=True)
 
-        # TRANSFORM & LOAD
+        # TRANSFORM (column-wise, one timestamp for the batch)
+        etl_timestamp = etl_now()
+        profile = transform_profile(profile, etl_timestamp)
+        resent_tracks = transform_tracks(resent_tracks, etl_timestamp)
+
+        # LOAD
         loader = DatabaseLoader()
 
-        if profile:
-            loader.load_user_profile(profile)
+        loader.load_user_profile(profile)
 
         if not resent_tracks.empty:
-            loader.load_tracks(resent_tracks)
-            logger.info(f' Processed {len(recent_tracks)} tracks')
+            user_id = profile['user_id']
+            if not loader.load_tracks(resent_tracks, user_id=user_id):
+                # Watermark stays put, so the same plays are fetched again on retry
+                logger.error('ETL Pipeline failed: tracks were not loaded')
+                return None
+            # listening_history is committed; only now move past these plays
+            extractor.commit_watermark(resent_tracks, user_id=user_id)
+
+            # Bulk-fetch details for entities we haven't seen before. The plays
+            # are already committed, so a failure here must not fail the run
+            # (the daemon would retry it forever)
+            try:
+                SpotifyEnricher(extractor, loader).enrich(resent_tracks)
+            except Exception as e:
+                logger.error(f'Enrichment failed: {e}')
+            logger.info(f' Processed {len(resent_tracks)} tracks')
         else:
             logger.info('No recent tracks to process')
 
-            loader.close()
-            logger.info('ETL Pipeline completed successfully!')
+        logger.info('ETL Pipeline completed successfully!')
+        return len(resent_tracks)
 
     except Exception as e:
         logger.error(f'ETL Pipeline failed: {e}')
+        return None
 
-# Schedule to run daily
-if __name__ == '__main__':
-    # Run immediately
-    run_etl()
+    finally:
+        if loader is not None:
+            loader.close()
 
-    # Schedule to run daily at 2 AM
-    schedule.every().day.at('02:00').do(run_etl)
+if __name__ == '__main__':
+    from .etl_daemon import ETLDaemon
 
-    logger.info(' ETL schedular started (running daily at 2 AM)')
+    parser = argparse.ArgumentParser(description='Spotify ETL: run once, or as a daemon (default)')
+    parser.add_argument('--once', action='store_true', help='run the pipeline once and exit')
+    parser.add_argument('--schedule', help="'daily@HH:MM' or 'every:<seconds>' (default: SPOTIFY_DAEMON_SCHEDULE)")
+    args = parser.parse_args()
 
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.once:
+        run_etl()
+    else:
+        ETLDaemon(schedule=args.schedule).serve()
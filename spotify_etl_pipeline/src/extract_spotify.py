@@ -1,5 +1,10 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from .auth_spotify import get_spotify_client
+from .metadata_cache import get_metadata_cache
+from .parse_spotify import parse_top_tracks, parse_recent_played, parse_track_items
+from .rate_limiter import RateLimitExceeded, get_rate_limiter
+from .watermark_store import WatermarkStore
 import pandas as pd
 
 # Setup logging
@@ -9,28 +14,69 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Spotify returns at most 50 items per recently-played page
+RECENTLY_PLAYED_PAGE_SIZE = 50
+
+TIME_RANGES = ['short_term', 'medium_term', 'long_term']
+
+# Maximum page sizes for the library and playlist endpoints
+SAVED_TRACKS_PAGE_SIZE = 50
+PLAYLISTS_PAGE_SIZE = 50
+PLAYLIST_ITEMS_PAGE_SIZE = 100
+
+# Bulk lookup endpoints: kind -> (spotipy method, max IDs per call, response key)
+ENTITY_ENDPOINTS = {
+    'tracks': ('tracks', 50, 'tracks'),
+    'artists': ('artists', 50, 'artists'),
+    'albums': ('albums', 20, 'albums'),
+    'audio_features': ('audio_features', 100, None),
+}
+
+def chunked(ids, size):
+    """Split a list of IDs into API-sized batches"""
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+def parse_user_profile(user):
+    """Build the profile dict from a /me response"""
+    return {
+        'user_id': user['id'],
+        'display_name': user['display_name'],
+        'email': user.get('email', ''),
+        'country': user.get('country', ''),
+        'followers': user['followers']['total'] if 'followers' in user else 0,
+        'account_type': user.get('product', 'free'),
+    }
+
 class SpotifyExtractor:
-    def __init__(self):
-        self.sp = get_spotify_client()
+    def __init__(self, watermark_store=None, cache=None, cache_path=None, sp=None):
+        # cache_path selects the user's token cache (defaults to the single-user one);
+        # sp injects a ready client, e.g. one pointed at the replay server
+        self.sp = sp or get_spotify_client(cache_path)
         if not self.sp:
             raise ConnectionError('Failed to connect to Spotify API')
+        self.watermarks = watermark_store or WatermarkStore()
+        self.limiter = get_rate_limiter()
+        self.cache = cache or get_metadata_cache()
+        self.user_id = None
+
+    def _call(self, func, *args, **kwargs):
+        """Every Spotify request goes through the shared rate limiter"""
+        return self.limiter.call(func, *args, **kwargs)
 
     # ===== FIXED: This method is NOW a proper class method =====
     def get_user_profile(self):
         """Get current user's profile info"""
         logger.info('Fetching user profile...')
         try:
-            user = self.sp.current_user()
-            profile_data = {
-                'user_id': user['id'],
-                'display_name': user['display_name'],
-                'email': user.get('email', ''),
-                'country': user.get('country', ''),
-                'followers': user['followers']['total'] if 'followers' in user else 0,
-                'account_type': user.get('product', 'free'),
-            }
+            user = self._call(self.sp.current_user)
+            self.user_id = user['id']
+            profile_data = parse_user_profile(user)
             logger.info(f'Retrieved profile for: {profile_data["display_name"]}')
             return profile_data
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f'Failed to get user profile: {e}')
             return None
@@ -45,68 +91,204 @@ class SpotifyExtractor:
         """
         logger.info(f'Fetching top tracks ({time_range})...')
         try:
-            top_tracks = self.sp.current_user_top_tracks(
+            top_tracks = self._call(
+                self.sp.current_user_top_tracks,
                 time_range=time_range,
                 limit=limit
             )
 
-            tracks_data = []
-            for item in top_tracks['items']:
-                track_info = {
-                    'track_id': item['id'],
-                    'track_name': item['name'],
-                    'artist_id': item['artists'][0]['id'],
-                    'artist_name': item['artists'][0]['name'],
-                    'album_id': item['album']['id'],
-                    'album_name': item['album']['name'],
-                    'popularity': item['popularity'],
-                    'duration_ms': item['duration_ms'],
-                    'explicit': item['explicit'],
-                    'track_number': item['track_number'],
-                    'preview_url': item.get('preview_url', ''),
-                    'spotify_url': item['external_urls']['spotify'],
-                    'album_image_url': item['album']['images'][0]['url'] if item['album']['images'] else ''
-                }
-                tracks_data.append(track_info)
-
-            logger.info(f'retrieved {len(tracks_data)} top tracks')
-            return pd.DataFrame(tracks_data)
+            self._cache_tracks(top_tracks['items'])
+            tracks_df = parse_top_tracks(top_tracks['items'])
+
+            logger.info(f'retrieved {len(tracks_df)} top tracks')
+            return tracks_df
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f'Failed to get top tracks: {e}')
             return pd.DataFrame()
 
-    def get_recent_played(self, limit=50):
-        """Get recent played tracks"""
+    def _cache_tracks(self, tracks):
+        """Full track objects seen in any response save a later lookup"""
+        self.cache.put_many('tracks', {track['id']: track for track in tracks if track and track.get('id')})
+
+    def get_entities(self, kind, ids):
+        """
+        Get full API objects for a list of IDs, from the metadata cache where possible
+
+        Args:
+            kind: 'tracks', 'artists', 'albums' or 'audio_features'
+            ids: Spotify IDs; only cache misses are requested, in maximum-size batches
+        """
+        ids = [i for i in dict.fromkeys(ids) if i]
+        found = self.cache.get_many(kind, ids)
+        missing = [i for i in ids if i not in found]
+
+        method_name, batch_size, key = ENTITY_ENDPOINTS[kind]
+        fetched = {}
+        for batch in chunked(missing, batch_size):
+            response = self._call(getattr(self.sp, method_name), batch)
+            # audio_features returns a bare list, the others wrap it in a key
+            items = response if key is None else response[key]
+            fetched.update((item['id'], item) for item in items if item)
+
+        self.cache.put_many(kind, fetched)
+        found.update(fetched)
+        logger.info(f'{kind}: {len(ids) - len(missing)} from cache, {len(fetched)} fetched')
+        return [found[i] for i in ids if i in found]
+
+    def _get_user_id(self):
+        """Current user's ID (cached after the first lookup)"""
+        if not self.user_id:
+            self.user_id = self._call(self.sp.current_user)['id']
+        return self.user_id
+
+    def get_recent_played(self, limit=50, incremental=False):
+        """
+        Get recent played tracks
+
+        Args:
+            limit: Number of tracks to fetch (max 50), ignored in incremental mode
+            incremental: Only fetch plays newer than the stored high-water mark,
+                paging with the `after` cursor until caught up
+        """
+        if incremental:
+            return self._get_recent_played_since_watermark()
+
         logger.info(f'Fetching {limit} recently played tracks...')
         try:
-            recent_tracks = self.sp.current_user_recently_played(limit=limit)
-
-            played_data = []
-            for item in recent_tracks['items']:
-                track = item['track']
-                played_at = item['played_at']
-
-                # ===== FIXED: Changed 'played_ifo' to 'played_info' =====
-                played_info = {
-                    'played_at': played_at,
-                    'track_id': track['id'],
-                    'track_name': track['name'],
-                    'artist_id': track['artists'][0]['id'],
-                    'artist_name': track['artists'][0]['name'],
-                    'album_id': track['album']['id'],
-                    'album_name': track['album']['name'],
-                    'popularity': track['popularity'],
-                    'duration_ms': track['duration_ms']
-                }
-                played_data.append(played_info)
-
-            logger.info(f'Retrieved {len(played_data)} recently played tracks')
-            return pd.DataFrame(played_data)
+            recent_tracks = self._call(self.sp.current_user_recently_played, limit=limit)
+            self._cache_tracks(item['track'] for item in recent_tracks['items'])
+            played_df = parse_recent_played(recent_tracks['items'])
+
+            logger.info(f'Retrieved {len(played_df)} recently played tracks')
+            return played_df
+
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.error(f'Failed to get recently played tracks: {e}')
+            return pd.DataFrame()
+
+    def _get_recent_played_since_watermark(self):
+        """Fetch only plays newer than the user's high-water mark"""
+        try:
+            user_id = self._get_user_id()
+            after = self.watermarks.get(user_id)
+            logger.info(f'Fetching recently played tracks for {user_id} after {after}...')
+
+            pages_data = []
+            pages = 0
+            while True:
+                if after is None:
+                    # No watermark yet: take the most recent page as the baseline
+                    page = self._call(self.sp.current_user_recently_played, limit=RECENTLY_PLAYED_PAGE_SIZE)
+                else:
+                    page = self._call(
+                        self.sp.current_user_recently_played,
+                        limit=RECENTLY_PLAYED_PAGE_SIZE,
+                        after=after
+                    )
+                pages += 1
+
+                items = page.get('items') or []
+                self._cache_tracks(item['track'] for item in items)
+                pages_data.append(parse_recent_played(items))
+
+                # The `after` cursor points at the newest play on this page
+                cursor = (page.get('cursors') or {}).get('after')
+                if after is None or not items or not cursor or len(items) < RECENTLY_PLAYED_PAGE_SIZE:
+                    break
+                if int(cursor) <= after:
+                    break
+                after = int(cursor)
+
+            played_df = pd.concat(pages_data, ignore_index=True)
+            logger.info(f'Retrieved {len(played_df)} new plays in {pages} request(s)')
+            return played_df
 
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f'Failed to get recently played tracks: {e}')
             return pd.DataFrame()
 
+    def _iter_pages(self, func, *args, **kwargs):
+        """
+        Yield pages of a paginated endpoint by following `next` links.
+        The next page is requested in the background while the caller
+        processes the current one.
+        """
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            page = self._call(func, *args, **kwargs)
+            while page:
+                next_page = prefetcher.submit(self._call, self.sp.next, page) if page.get('next') else None
+                yield page
+                page = next_page.result() if next_page else None
+
+    def _iter_chunks(self, pages, chunk_size, **extra_columns):
+        """Regroup page items into DataFrames of `chunk_size` rows"""
+        buffer = []
+        for page in pages:
+            buffer.extend(page.get('items') or [])
+            while len(buffer) >= chunk_size:
+                chunk_df = parse_track_items(buffer[:chunk_size])
+                buffer = buffer[chunk_size:]
+                if not chunk_df.empty:
+                    yield chunk_df.assign(**extra_columns)
+        if buffer:
+            chunk_df = parse_track_items(buffer)
+            if not chunk_df.empty:
+                yield chunk_df.assign(**extra_columns)
+
+    def iter_saved_tracks(self, chunk_size=1000):
+        """
+        Stream the user's saved tracks as DataFrame chunks
+
+        Memory stays bounded by chunk_size no matter how large the library is.
+        """
+        logger.info('Streaming saved tracks...')
+        pages = self._iter_pages(self.sp.current_user_saved_tracks, limit=SAVED_TRACKS_PAGE_SIZE)
+        total = 0
+        for chunk_df in self._iter_chunks(pages, chunk_size):
+            total += len(chunk_df)
+            yield chunk_df
+        logger.info(f'Streamed {total} saved tracks')
+
+    def iter_playlists(self):
+        """Yield the user's playlists (simplified playlist objects)"""
+        for page in self._iter_pages(self.sp.current_user_playlists, limit=PLAYLISTS_PAGE_SIZE):
+            yield from (playlist for playlist in page.get('items') or [] if playlist)
+
+    def iter_playlist_items(self, playlist_id=None, chunk_size=1000):
+        """
+        Stream playlist tracks as DataFrame chunks with a playlist_id column
+
+        Args:
+            playlist_id: One playlist, or None for every playlist of the user
+            chunk_size: Rows per yielded DataFrame
+        """
+        playlist_ids = [playlist_id] if playlist_id else (p['id'] for p in self.iter_playlists())
+        for pid in playlist_ids:
+            logger.info(f'Streaming items of playlist {pid}...')
+            pages = self._iter_pages(
+                self.sp.playlist_items,
+                pid,
+                limit=PLAYLIST_ITEMS_PAGE_SIZE,
+                additional_types=('track',)
+            )
+            yield from self._iter_chunks(pages, chunk_size, playlist_id=pid)
+
+    def commit_watermark(self, tracks_df, user_id=None):
+        """
+        Advance the stored high-water mark to the newest play in tracks_df.
+        Call this after the plays have been loaded, so a failed load is re-fetched.
+        """
+        if tracks_df is None or tracks_df.empty:
+            return None
+        user_id = user_id or self._get_user_id()
+        return self.watermarks.advance(user_id, tracks_df['played_at'])
+
 def test_extraction():
     """Test the extraction function"""
     print('Testing Spotify ETL Extraction...')
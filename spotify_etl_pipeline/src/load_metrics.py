@@ -0,0 +1,259 @@
+import bisect
+import logging
+import os
+import threading
+import psycopg2
+from config.database_config import DatabaseConfig
+
+logger = logging.getLogger(__name__)
+
+# Prometheus' default buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_PREFIX = 'spotify_load'
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus exposes it"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """[(upper bound label, cumulative count)] including +Inf"""
+        total = 0
+        rows = []
+        for bound, count in zip([str(b) for b in self.buckets] + ['+Inf'], self.counts):
+            total += count
+            rows.append((bound, total))
+        return rows
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': round(self.sum, 6), 'buckets': dict(self.cumulative())}
+
+class TableStats:
+    def __init__(self):
+        self.statements = 0
+        self.rows_attempted = 0
+        self.rows_inserted = 0
+        self.rows_conflicted = 0
+        self.bytes_sent = 0
+        self.latency = Histogram()
+
+    def snapshot(self):
+        return {
+            'statements': self.statements,
+            'rows_attempted': self.rows_attempted,
+            'rows_inserted': self.rows_inserted,
+            'rows_conflicted': self.rows_conflicted,
+            'bytes_sent': self.bytes_sent,
+            'seconds': round(self.latency.sum, 6),
+            'latency': self.latency.snapshot(),
+        }
+
+class LoadMetrics:
+    """
+    Per-table load statistics for DatabaseLoader / AsyncDatabaseLoader.
+
+    - rows attempted / inserted (or updated) / conflicted (skipped by ON CONFLICT
+      or an unchanged row_hash), bytes sent and a statement latency histogram per table
+    - transaction duration and lock wait histograms
+
+    snapshot() gives a JSON-safe dict (for Airflow return values); write()
+    saves Prometheus text exposition format for a textfile collector.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.transactions = Histogram()
+        self.lock_wait = Histogram()
+        self.failed_transactions = 0
+        self._lock = threading.Lock()
+
+    def observe_statement(self, table, seconds, rows_attempted=0, rows_affected=0, bytes_sent=0):
+        with self._lock:
+            stats = self.tables.setdefault(table, TableStats())
+            stats.statements += 1
+            stats.rows_attempted += rows_attempted
+            stats.rows_inserted += rows_affected
+            stats.rows_conflicted += max(rows_attempted - rows_affected, 0)
+            stats.bytes_sent += bytes_sent
+            stats.latency.observe(seconds)
+
+    def observe_transaction(self, seconds, lock_wait_seconds=0.0, committed=True):
+        with self._lock:
+            self.transactions.observe(seconds)
+            self.lock_wait.observe(lock_wait_seconds)
+            if not committed:
+                self.failed_transactions += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'tables': {table: stats.snapshot() for table, stats in self.tables.items()},
+                'transactions': self.transactions.snapshot(),
+                'lock_wait': self.lock_wait.snapshot(),
+                'failed_transactions': self.failed_transactions,
+            }
+
+    def _histogram_lines(self, name, histogram, labels=''):
+        sep = ',' if labels else ''
+        lines = [f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}' for bound, count in histogram.cumulative()]
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {histogram.sum}')
+        lines.append(f'{name}_count{suffix} {histogram.count}')
+        return lines
+
+    def to_prometheus(self):
+        """Prometheus text exposition format"""
+        p = METRIC_PREFIX
+        lines = []
+        with self._lock:
+            for metric, attribute, help_text in [
+                ('statements_total', 'statements', 'Statements executed'),
+                ('rows_attempted_total', 'rows_attempted', 'Rows offered to the database'),
+                ('rows_inserted_total', 'rows_inserted', 'Rows inserted or updated'),
+                ('rows_conflicted_total', 'rows_conflicted', 'Rows skipped by ON CONFLICT or an unchanged row_hash'),
+                ('bytes_sent_total', 'bytes_sent', 'Statement and COPY bytes sent'),
+            ]:
+                lines.append(f'# HELP {p}_{metric} {help_text}')
+                lines.append(f'# TYPE {p}_{metric} counter')
+                for table, stats in sorted(self.tables.items()):
+                    lines.append(f'{p}_{metric}{{table="{table}"}} {getattr(stats, attribute)}')
+
+            lines.append(f'# HELP {p}_statement_seconds Statement latency')
+            lines.append(f'# TYPE {p}_statement_seconds histogram')
+            for table, stats in sorted(self.tables.items()):
+                lines.extend(self._histogram_lines(f'{p}_statement_seconds', stats.latency, f'table="{table}"'))
+
+            lines.append(f'# HELP {p}_transaction_seconds Transaction duration, first statement to commit')
+            lines.append(f'# TYPE {p}_transaction_seconds histogram')
+            lines.extend(self._histogram_lines(f'{p}_transaction_seconds', self.transactions))
+
+            lines.append(f'# HELP {p}_lock_wait_seconds Time a transaction spent waiting on locks (sampled)')
+            lines.append(f'# TYPE {p}_lock_wait_seconds histogram')
+            lines.extend(self._histogram_lines(f'{p}_lock_wait_seconds', self.lock_wait))
+
+            lines.append(f'# HELP {p}_failed_transactions_total Transactions rolled back')
+            lines.append(f'# TYPE {p}_failed_transactions_total counter')
+            lines.append(f'{p}_failed_transactions_total {self.failed_transactions}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path=None):
+        """Atomically write the Prometheus text file (e.g. for node_exporter's textfile collector)"""
+        path = path or DatabaseConfig.LOAD_METRICS_PATH
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+        return path
+
+class LockWaitSampler:
+    """
+    Measures how long backends wait on locks by polling pg_stat_activity.
+
+    One sampler serves the whole process (see get_lock_wait_sampler): a
+    single thread and side connection poll every backend registered with
+    start(pid) in one query, so loaders don't each open a connection. The
+    thread sleeps while nothing is registered and exits promptly on close().
+    """
+
+    def __init__(self, interval=None, dsn=None):
+        self.interval = interval if interval is not None else DatabaseConfig.LOCK_WAIT_SAMPLE_INTERVAL
+        self.dsn = dsn or DatabaseConfig.get_connection_string()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # backend pid -> seconds spent waiting on locks since start(pid)
+        self._waited = {}
+        self._closed = False
+        self._disabled = False
+        self._thread = None
+        self._connection = None
+
+    def _poll(self, pids):
+        """The registered backends currently waiting on a lock"""
+        if self._connection is None:
+            self._connection = psycopg2.connect(self.dsn)
+            self._connection.autocommit = True
+        with self._connection.cursor() as cursor:
+            cursor.execute("SELECT pid FROM pg_stat_activity WHERE pid = ANY(%s) AND wait_event_type = 'Lock'",
+                           (pids,))
+            return [row[0] for row in cursor.fetchall()]
+
+    def _run(self):
+        try:
+            while True:
+                with self._changed:
+                    self._changed.wait_for(lambda: self._waited or self._closed)
+                    if self._closed:
+                        return
+                    pids = list(self._waited)
+
+                waiting = self._poll(pids)
+
+                with self._changed:
+                    for pid in waiting:
+                        if pid in self._waited:
+                            self._waited[pid] += self.interval
+                    self._changed.wait_for(lambda: self._closed, timeout=self.interval)
+        except psycopg2.Error as e:
+            logger.warning(f'Lock wait sampling disabled: {e}')
+            with self._lock:
+                self._disabled = True
+        finally:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def start(self, pid):
+        """Sample backend `pid` until stop(pid)"""
+        if self.interval <= 0:
+            return
+        with self._changed:
+            if self._closed or self._disabled:
+                return
+            self._waited[pid] = 0.0
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='lock-wait-sampler', daemon=True)
+                self._thread.start()
+            self._changed.notify_all()
+
+    def stop(self, pid):
+        """Stop sampling `pid` and return the seconds it spent waiting on locks since start(pid)"""
+        with self._lock:
+            return self._waited.pop(pid, 0.0)
+
+    def close(self):
+        """Stop the sampling thread; it closes the side connection on exit"""
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+_lock_wait_sampler = None
+_lock_wait_sampler_lock = threading.Lock()
+
+def get_lock_wait_sampler():
+    """Process-wide lock wait sampler shared by every DatabaseLoader"""
+    global _lock_wait_sampler
+    with _lock_wait_sampler_lock:
+        if _lock_wait_sampler is None:
+            _lock_wait_sampler = LockWaitSampler()
+        return _lock_wait_sampler
+
+def close_lock_wait_sampler():
+    """Stop the sampler thread and close its connection (e.g. at process shutdown)"""
+    global _lock_wait_sampler
+    with _lock_wait_sampler_lock:
+        if _lock_wait_sampler is not None:
+            _lock_wait_sampler.close()
+            _lock_wait_sampler = None
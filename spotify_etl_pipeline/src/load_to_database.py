@@ -1,106 +1,455 @@
-import psycopg2
+import hashlib
+import io
+import json
+import time
+import numpy as np
+import pandas as pd
+from psycopg2.extensions import AsIs, register_adapter
 from psycopg2.extras import execute_values
-from config.database_config import DatabaseConfig
+from .db_pool import get_pool
+from .load_metrics import LoadMetrics, get_lock_wait_sampler
+from .partitions import ensure_partitions_for, remember_partitions
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Typed (nullable / numpy) DataFrame values straight into SQL parameters
+register_adapter(type(pd.NA), lambda _: AsIs('NULL'))
+register_adapter(np.integer, lambda value: AsIs(int(value)))
+register_adapter(np.floating, lambda value: AsIs(repr(float(value))))
+register_adapter(np.bool_, lambda value: AsIs(bool(value)))
+
+TRACK_COLUMNS = [
+    'track_id', 'track_name', 'artist_id', 'artist_name', 'album_id', 'popularity',
+    'duration_ms', 'explicit', 'track_number', 'preview_url', 'spotify_url', 'album_image_url'
+]
+STAGING_TABLE = 'staging_tracks'
+STAGING_COLUMNS = TRACK_COLUMNS + ['played_at', 'row_hash']
+
+# Content columns behind each table's row_hash; upserts skip rows whose hash is unchanged
+USER_HASH_COLUMNS = ['display_name', 'email', 'country', 'followers', 'account_type']
+ARTIST_HASH_COLUMNS = ['artist_name', 'genres', 'popularity', 'followers']
+TRACK_HASH_COLUMNS = [
+    'track_name', 'artist_id', 'album_id', 'popularity', 'duration_ms', 'explicit',
+    'track_number', 'preview_url', 'spotify_url', 'album_image_url'
+]
+
+UPSERT_USER_SQL = """
+    INSERT INTO users (user_id, display_name, email, country, followers, account_type, row_hash, etl_timestamp)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
+    ON CONFLICT (user_id) DO UPDATE SET
+        display_name = EXCLUDED.display_name,
+        email = EXCLUDED.email,
+        country = EXCLUDED.country,
+        followers = EXCLUDED.followers,
+        account_type = EXCLUDED.account_type,
+        row_hash = EXCLUDED.row_hash,
+        etl_timestamp = EXCLUDED.etl_timestamp
+    WHERE users.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+"""
+
+CREATE_STAGING_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+        track_id VARCHAR(255),
+        track_name VARCHAR(255),
+        artist_id VARCHAR(255),
+        artist_name VARCHAR(255),
+        album_id VARCHAR(255),
+        popularity INTEGER,
+        duration_ms INTEGER,
+        explicit BOOLEAN,
+        track_number INTEGER,
+        preview_url TEXT,
+        spotify_url TEXT,
+        album_image_url TEXT,
+        played_at TIMESTAMP,
+        row_hash CHAR(40)
+    ) ON COMMIT DELETE ROWS
+"""
+COPY_STAGING_SQL = f"COPY {STAGING_TABLE} ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+# Staging -> target merges; DISTINCT ON dedupes repeated artists/tracks/plays inside the batch,
+# and the row_hash condition turns unchanged tracks into no-ops
+MERGE_ARTISTS_SQL = f"""
+    INSERT INTO artists (artist_id, artist_name)
+    SELECT DISTINCT ON (artist_id) artist_id, artist_name
+    FROM {STAGING_TABLE}
+    WHERE artist_id IS NOT NULL
+    ON CONFLICT (artist_id) DO NOTHING
+"""
+MERGE_TRACKS_SQL = f"""
+    INSERT INTO tracks (track_id, track_name, artist_id, album_id, popularity, duration_ms, explicit, track_number, preview_url, spotify_url, album_image_url, row_hash)
+    SELECT DISTINCT ON (track_id)
+        track_id, track_name, artist_id, album_id, popularity, duration_ms,
+        explicit, track_number, preview_url, spotify_url, album_image_url, row_hash
+    FROM {STAGING_TABLE}
+    ON CONFLICT (track_id) DO UPDATE SET
+        track_name = EXCLUDED.track_name,
+        artist_id = EXCLUDED.artist_id,
+        album_id = EXCLUDED.album_id,
+        popularity = EXCLUDED.popularity,
+        duration_ms = EXCLUDED.duration_ms,
+        explicit = EXCLUDED.explicit,
+        track_number = EXCLUDED.track_number,
+        preview_url = EXCLUDED.preview_url,
+        spotify_url = EXCLUDED.spotify_url,
+        album_image_url = EXCLUDED.album_image_url,
+        row_hash = EXCLUDED.row_hash,
+        etl_timestamp = CURRENT_TIMESTAMP
+    WHERE tracks.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+"""
+MERGE_HISTORY_SQL = f"""
+    INSERT INTO listening_history (user_id, track_id, played_at, context_type)
+    SELECT DISTINCT ON (track_id, played_at) %s, track_id, played_at, 'recently_played'
+    FROM {STAGING_TABLE}
+    WHERE played_at IS NOT NULL
+    ON CONFLICT (user_id, played_at, track_id) DO NOTHING
+"""
+
+CHUNK_LOADS_TABLE = 'staging_chunk_loads'
+# Marker name for the user upsert of a staged run (committed with its first chunk)
+PROFILE_MARKER = 'profile'
+
+def row_hash(values):
+    """Stable content hash for a row of values"""
+    payload = json.dumps(values, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def hash_rows(df, columns):
+    """row_hash of every row over `columns`, with nulls and numpy scalars normalised first"""
+    values = df[columns].astype(object).where(df[columns].notna(), None)
+    return [row_hash(list(row)) for row in values.itertuples(index=False, name=None)]
+
+def user_params(profile_data):
+    """Parameters for UPSERT_USER_SQL from a parsed profile"""
+    values = [
+        profile_data['display_name'],
+        profile_data.get('email', ''),
+        profile_data.get('country', ''),
+        profile_data['followers'],
+        profile_data['account_type'],
+    ]
+    return (profile_data['user_id'], *values, row_hash(values), profile_data.get('etl_timestamp'))
+
+def staging_frame(tracks_df):
+    """tracks_df with every staging column and each row's track row_hash"""
+    staging_df = tracks_df.copy()
+    for column in STAGING_COLUMNS:
+        if column not in staging_df:
+            staging_df[column] = None
+    staging_df['row_hash'] = hash_rows(staging_df, TRACK_HASH_COLUMNS)
+    return staging_df
+
+def staging_csv(staging_df):
+    """CSV text of the staging columns, as COPY ... WITH (FORMAT csv) expects"""
+    return staging_df.to_csv(columns=STAGING_COLUMNS, index=False, header=False)
+
 class DatabaseLoader:
-    def __init__(self):
-        self.connect = psycopg2.connect(
-            host=DatabaseConfig.DB_HOST,
-            port=DatabaseConfig.DB_PORT,
-            database=DatabaseConfig.DB_NAME,
-            user=DatabaseConfig.DB_USER,
-            password=DatabaseConfig.DB_PASSWORD
-        )
+    def __init__(self, connection=None, metrics=None):
+        # Borrow from the shared pool unless a connection is handed in
+        self._pooled = connection is None
+        self.connect = connection or get_pool().getconn()
         self.cursor = self.connect.cursor()
+        # Per-table rows/bytes/latency and transaction/lock-wait timings
+        self.metrics = metrics or LoadMetrics()
+        # Lock waits of this connection's backend, sampled by the process-wide sampler
+        self.lock_sampler = get_lock_wait_sampler()
+        self.backend_pid = self.connect.get_backend_pid()
+        self._transaction_started = None
+        # Partitions created by the open transaction, cached once it commits
+        self._pending_partitions = []
+
+    def _begin(self):
+        if self._transaction_started is None:
+            self._transaction_started = time.perf_counter()
+            self.lock_sampler.start(self.backend_pid)
+
+    def _end(self, committed):
+        if self._transaction_started is None:
+            return
+        self.metrics.observe_transaction(
+            time.perf_counter() - self._transaction_started, self.lock_sampler.stop(self.backend_pid), committed
+        )
+        self._transaction_started = None
+
+    def _commit(self):
+        self.connect.commit()
+        remember_partitions(self._pending_partitions)
+        self._pending_partitions = []
+        self._end(committed=True)
+
+    def _rollback(self):
+        self.connect.rollback()
+        self._pending_partitions = []
+        self._end(committed=False)
+
+    def _execute(self, table, query, params=None, rows_attempted=0):
+        """cursor.execute, recording latency, rows affected and bytes sent for `table`"""
+        self._begin()
+        started = time.perf_counter()
+        self.cursor.execute(query, params)
+        self.metrics.observe_statement(
+            table, time.perf_counter() - started, rows_attempted,
+            max(self.cursor.rowcount, 0), len(self.cursor.query or b'')
+        )
+
+    def _execute_values(self, table, query, rows, page_size=1000):
+        """execute_values one page at a time, so each page's rowcount is recorded"""
+        self._begin()
+        for start in range(0, len(rows), page_size):
+            page = rows[start:start + page_size]
+            started = time.perf_counter()
+            execute_values(self.cursor, query, page, page_size=len(page))
+            self.metrics.observe_statement(
+                table, time.perf_counter() - started, len(page),
+                max(self.cursor.rowcount, 0), len(self.cursor.query or b'')
+            )
+
+    def _upsert_user(self, profile_data):
+        """Upsert the user row (no commit)"""
+        self._execute('users', UPSERT_USER_SQL, user_params(profile_data), rows_attempted=1)
 
     def load_user_profile(self, profile_data):
         """Load user profile to database"""
         try:
-            query = """
-                INSERT INTO users (user_id, display_name, email, country, followers, account_type)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON CONFLICT (user_id)
-                DO NOT UPDATE SET
-                    display_name = EXCLUDED.display_name
-                    email = EXCLUDED.email,
-                    country = EXCLUDED.country,
-                    followers = EXCLUDED.followers,
-                    account_type = EXCLUDED.account_type,
-                    updates_at = CURRENT_TIMESTAMP
-            """
-            self.cursor.execute(query, (
-                profile_data['user_id'],
-                profile_data['display_name'],
-                profile_data['email'],
-                profile_data['country'],
-                profile_data['followers'],
-                profile_data['account_type']
-            ))
-            self.connect.commit()
-            logger.info(f' Loaded user: {profile_data['display_name']}')
+            self._upsert_user(profile_data)
+            self._commit()
+            logger.info(f' Loaded user: {profile_data["display_name"]}')
             return True
 
         except Exception as e:
             logger.error(f' Failed to load user: {e}')
-            self.connect.rollback()
+            self._rollback()
             return False
 
-    def load_tracks(self, tracks_df):
-        """Load tracks data to database"""
+    def _copy_to_staging(self, staging_df):
+        """Stream staging_df into a temporary staging table with COPY FROM STDIN"""
+        self._begin()
+        self.cursor.execute(CREATE_STAGING_SQL)
+        payload = staging_csv(staging_df).encode('utf-8')
+        started = time.perf_counter()
+        self.cursor.copy_expert(COPY_STAGING_SQL, io.BytesIO(payload))
+        self.metrics.observe_statement(
+            STAGING_TABLE, time.perf_counter() - started, len(staging_df), len(staging_df), len(payload)
+        )
+
+    def _merge_tracks(self, tracks_df, user_id=None):
+        """
+        COPY tracks_df into the staging table and merge it into artists, tracks
+        and (when tracks_df has played_at and user_id is given) listening_history
+        with one set-based statement each. Does not commit.
+
+        Every row is staged; tracks whose stored row_hash matches are skipped
+        by the merge itself, so the database is the only change filter.
+        """
+        load_history = user_id is not None and 'played_at' in tracks_df
+        staging_df = staging_frame(tracks_df)
+        self._copy_to_staging(staging_df)
+
+        # Distinct candidates per target, so rows_conflicted counts real skips
+        self._execute('artists', MERGE_ARTISTS_SQL, rows_attempted=staging_df['artist_id'].dropna().nunique())
+        self._execute('tracks', MERGE_TRACKS_SQL, rows_attempted=staging_df['track_id'].nunique())
+
+        if load_history:
+            self._pending_partitions += ensure_partitions_for(self.cursor, tracks_df['played_at'])
+            plays = len(staging_df[['track_id', 'played_at']].dropna().drop_duplicates())
+            self._execute('listening_history', MERGE_HISTORY_SQL, (user_id,), rows_attempted=plays)
+
+    def load_tracks(self, tracks_df, user_id=None):
+        """
+        Load tracks data to database
+
+        Rows are COPY'd into a staging table and merged into artists, tracks
+        and listening_history in one transaction (see _merge_tracks).
+        """
         if tracks_df.empty:
             return 0
 
         try:
-            # First, Load artists
-            artists_data = []
-            for _, row in tracks_df.iterrows():
-                artists_data.append((row['artist_id'], row['artist_name']))
-
-                if artists_data:
-                    artists_query = """
-                        INSERT INTO artists (artist_id, artist_name)
-                        VALUES %s
-                        ON CONFLICT (artist_id) DO NOTHING
-                    """
-                    execute_values(self.cursor, artists_query, artists_data)
-
-                    # Then load tracks
-                    tracks_data = []
-                    for _, row in tracks_df.iterrows():
-                        tracks_data.append((
-                            row['track_id'],
-                            row['track_name'],
-                            row['artist_id'],
-                            row['album_id'],
-                            row['popularity'],
-                            row['duration_ms'],
-                            row['explicit'],
-                            row['track_number'],
-                            row['preview_url'],
-                            row['spotify_url'],
-                            row['album_image_url']
-                        ))
-
-                        tracks_query = """
-                            INSERT INTO tracks (track_id, track_name, artist_id, album_id, popularity, duration_ms, explicit, track_number, preview_url, spotify_url, album_image_url)
-                            VALUES %s
-                            ON CONFLICT (track_id) DO NOTHING
-                        """
-                        execute_values(self.cursor, tracks_query, tracks_data)
-
-                        self.connect.commit()
-                        logger.info(f' Loaded {len(tracks_df)} tracks')
-                        return len(tracks_df)
+            self._merge_tracks(tracks_df, user_id)
+            self._commit()
+            logger.info(f' Loaded {len(tracks_df)} tracks')
+            return len(tracks_df)
 
         except Exception as e:
             logger.error(f' Failed to load tracks: {e}')
-            self.connect.rollback()
+            self._rollback()
+            return 0
+
+    def load_batch(self, profile_data, tracks_df):
+        """
+        Load a user's profile and plays in a single transaction
+
+        Raises on failure (after rolling back), so callers such as Airflow tasks fail visibly.
+
+        Returns:
+            number of track rows loaded
+        """
+        try:
+            self._upsert_user(profile_data)
+            if tracks_df is not None and not tracks_df.empty:
+                self._merge_tracks(tracks_df, profile_data['user_id'])
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+
+        tracks_loaded = 0 if tracks_df is None else len(tracks_df)
+        logger.info(f' Loaded {profile_data["user_id"]} and {tracks_loaded} tracks')
+        return tracks_loaded
+
+    def _loaded_chunks(self, run_id):
+        self.cursor.execute(f'SELECT chunk_name FROM {CHUNK_LOADS_TABLE} WHERE run_id = %s', (run_id,))
+        return {row[0] for row in self.cursor.fetchall()}
+
+    def _record_chunk(self, run_id, chunk):
+        self._execute(CHUNK_LOADS_TABLE, f"""
+            INSERT INTO {CHUNK_LOADS_TABLE} (run_id, chunk_name, checksum, row_count)
+            VALUES (%s, %s, %s, %s)
+        """, (run_id, chunk['name'], chunk.get('sha256'), chunk.get('rows', 0)), rows_attempted=1)
+
+    def _commit_staged(self, run_id, chunk, tracks_df, user_id, profile_data=None):
+        """One transaction: optional user upsert, the chunk's merge and its marker rows"""
+        try:
+            if profile_data is not None:
+                self._upsert_user(profile_data)
+                self._record_chunk(run_id, {'name': PROFILE_MARKER})
+            if chunk is not None:
+                self._merge_tracks(tracks_df, user_id)
+                self._record_chunk(run_id, chunk)
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+
+    def load_staged(self, store, run_id, profile_data=None):
+        """
+        Load a run staged by StagingStore, resuming after the last committed chunk
+
+        Each chunk is merged and its marker row written in one transaction,
+        so after a crash a retry skips exactly the chunks already loaded.
+        Raises on failure (after rolling back the current chunk).
+
+        Args:
+            store: StagingStore holding the run
+            run_id: Staged run to load
+            profile_data: User row to upsert (defaults to the staged profile)
+
+        Returns:
+            number of track rows loaded by this call
+        """
+        manifest = store.manifest(run_id)
+        if manifest is None:
+            raise FileNotFoundError(f'Run {run_id} is not staged in {store.root}')
+        run_id = manifest['run_id']
+        profile_data = profile_data or manifest.get('profile')
+        user_id = profile_data['user_id'] if profile_data else None
+
+        done = self._loaded_chunks(run_id)
+        self._rollback()
+        pending_profile = profile_data is not None and PROFILE_MARKER not in done
+        pending = [chunk for chunk in manifest['chunks'] if chunk['name'] not in done]
+        if len(pending) < len(manifest['chunks']):
+            logger.info(f' Resuming run {run_id}: {len(manifest["chunks"]) - len(pending)} chunks already loaded')
+
+        if pending_profile and not pending:
+            self._commit_staged(run_id, None, None, user_id, profile_data)
+
+        loaded = 0
+        for chunk in pending:
+            tracks_df = store.read_chunk(run_id, chunk)
+            self._commit_staged(run_id, chunk, tracks_df, user_id, profile_data if pending_profile else None)
+            pending_profile = False
+            loaded += len(tracks_df)
+
+        logger.info(f' Loaded {loaded} staged tracks for run {run_id}')
+        return loaded
+
+    def load_artist_details(self, artists_df):
+        """Upsert enriched artists (genres, popularity, followers)"""
+        if artists_df.empty:
+            return 0
+
+        try:
+            artists_data = [
+                (row.artist_id, row.artist_name, list(row.genres), row.popularity, row.followers, hashed)
+                for row, hashed in zip(artists_df.itertuples(index=False), hash_rows(artists_df, ARTIST_HASH_COLUMNS))
+            ]
+            query = """
+                INSERT INTO artists (artist_id, artist_name, genres, popularity, followers, row_hash)
+                VALUES %s
+                ON CONFLICT (artist_id) DO UPDATE SET
+                    artist_name = EXCLUDED.artist_name,
+                    genres = EXCLUDED.genres,
+                    popularity = EXCLUDED.popularity,
+                    followers = EXCLUDED.followers,
+                    row_hash = EXCLUDED.row_hash
+                WHERE artists.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+            """
+            self._execute_values('artists', query, artists_data)
+            self._commit()
+            logger.info(f' Loaded {len(artists_data)} artist details')
+            return len(artists_data)
+
+        except Exception as e:
+            logger.error(f' Failed to load artists: {e}')
+            self._rollback()
+            return 0
+
+    def load_albums(self, albums_df):
+        """Load albums to database"""
+        if albums_df.empty:
+            return 0
+
+        try:
+            albums_data = [
+                (row.album_id, row.album_name, row.artist_id, row.album_type,
+                 row.release_date, row.total_tracks, row.album_image_url)
+                for row in albums_df.itertuples(index=False)
+            ]
+            query = """
+                INSERT INTO albums (album_id, album_name, artist_id, album_type, release_date, total_tracks, album_image_url)
+                VALUES %s
+                ON CONFLICT (album_id) DO NOTHING
+            """
+            self._execute_values('albums', query, albums_data)
+            self._commit()
+            logger.info(f' Loaded {len(albums_data)} albums')
+            return len(albums_data)
+
+        except Exception as e:
+            logger.error(f' Failed to load albums: {e}')
+            self._rollback()
+            return 0
+
+    def load_audio_features(self, features_df):
+        """Load audio features to database"""
+        if features_df.empty:
+            return 0
+
+        try:
+            columns = list(features_df.columns)
+            query = f"""
+                INSERT INTO audio_features ({', '.join(columns)})
+                VALUES %s
+                ON CONFLICT (track_id) DO NOTHING
+            """
+            features_data = list(features_df.itertuples(index=False, name=None))
+            self._execute_values('audio_features', query, features_data)
+            self._commit()
+            logger.info(f' Loaded audio features for {len(features_data)} tracks')
+            return len(features_data)
+
+        except Exception as e:
+            logger.error(f' Failed to load audio features: {e}')
+            self._rollback()
             return 0
 
     def close(self):
         """Close database connection"""
+        self.lock_sampler.stop(self.backend_pid)
         self.cursor.close()
-        self.connection.close()
+        if self._pooled:
+            get_pool().putconn(self.connect)
+        else:
+            self.connect.close()
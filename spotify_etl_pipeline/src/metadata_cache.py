@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config.spotify_config import SpotifyConfig
+
+logger = logging.getLogger(__name__)
+
+class MetadataCache:
+    """
+    On-disk SQLite cache of Spotify entities keyed by (kind, Spotify ID).
+
+    Each entry holds the raw API object, valid for `ttl_seconds` after it was fetched.
+
+    The cache holds at most `max_entries` rows; the least recently used are
+    evicted first.
+    """
+
+    def __init__(self, path=None, ttl_seconds=None, max_entries=None):
+        self.path = path or SpotifyConfig.METADATA_CACHE_PATH
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else SpotifyConfig.METADATA_CACHE_TTL
+        self.max_entries = max_entries if max_entries is not None else SpotifyConfig.METADATA_CACHE_MAX_ENTRIES
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entities (
+                kind TEXT NOT NULL,
+                id TEXT NOT NULL,
+                payload TEXT,
+                fetched_at REAL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (kind, id)
+            )
+        """)
+        self.db.execute('CREATE INDEX IF NOT EXISTS idx_entities_accessed_at ON entities(accessed_at)')
+
+        self.hits = 0
+        self.misses = 0
+
+    def _select(self, columns, kind, ids):
+        # Stay well below SQLite's bound-parameter limit
+        rows = []
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows.extend(self.db.execute(
+                f'SELECT id, {columns} FROM entities WHERE kind = ? AND id IN ({placeholders})',
+                [kind] + batch
+            ).fetchall())
+        return rows
+
+    def _touch(self, kind, ids, now):
+        self.db.executemany(
+            'UPDATE entities SET accessed_at = ? WHERE kind = ? AND id = ?',
+            [(now, kind, i) for i in ids]
+        )
+
+    def get_many(self, kind, ids):
+        """Return {id: payload} for every ID with a fresh cached payload"""
+        if not ids:
+            return {}
+        now = time.time()
+        with self._lock:
+            rows = self._select('payload, fetched_at', kind, ids)
+            found = {
+                entity_id: json.loads(payload)
+                for entity_id, payload, fetched_at in rows
+                if payload is not None and fetched_at is not None and now - fetched_at < self.ttl_seconds
+            }
+            self.db.execute('BEGIN')
+            self._touch(kind, found, now)
+            self.db.execute('COMMIT')
+
+            self.hits += len(found)
+            self.misses += len(set(ids)) - len(found)
+        return found
+
+    def put_many(self, kind, payloads):
+        """Store freshly fetched payloads ({id: payload})"""
+        if not payloads:
+            return
+        now = time.time()
+        with self._lock:
+            self.db.execute('BEGIN')
+            self.db.executemany("""
+                INSERT INTO entities (kind, id, payload, fetched_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (kind, id) DO UPDATE SET
+                    payload = excluded.payload,
+                    fetched_at = excluded.fetched_at,
+                    accessed_at = excluded.accessed_at
+            """, [(kind, i, json.dumps(p), now, now) for i, p in payloads.items()])
+            self.db.execute('COMMIT')
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries above max_entries (caller holds the lock)"""
+        count = self.db.execute('SELECT COUNT(*) FROM entities').fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        self.db.execute("""
+            DELETE FROM entities WHERE rowid IN (
+                SELECT rowid FROM entities ORDER BY accessed_at LIMIT ?
+            )
+        """, (excess,))
+        logger.info(f'Evicted {excess} metadata cache entries')
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        self.db.close()
+
+_metadata_cache = None
+_metadata_cache_lock = threading.Lock()
+
+def get_metadata_cache():
+    """Process-wide metadata cache"""
+    global _metadata_cache
+    with _metadata_cache_lock:
+        if _metadata_cache is None:
+            _metadata_cache = MetadataCache()
+        return _metadata_cache
@@ -0,0 +1,355 @@
+import logging
+from psycopg2 import errors
+from .db_pool import get_pool, without_statement_timeout
+from .partitions import (
+    PARENT_TABLE,
+    copy_legacy_rows,
+    ensure_partitions,
+    is_partitioned,
+    list_partitions,
+    rename_legacy_table,
+)
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_TABLE = 'schema_migrations'
+# pg_advisory_lock key, so two workers starting at once don't both migrate
+MIGRATION_LOCK_KEY = 72_605_311
+
+# Set once this process has seen an up-to-date schema; later calls skip the database
+_up_to_date = False
+
+class Migration:
+    """
+    One schema version.
+
+    Either `apply(cursor)` runs inside the shared migration transaction, or
+    `index` = (name, table, definition) is built with CREATE INDEX CONCURRENTLY
+    outside it (per partition for partitioned tables), so writers are never blocked.
+    """
+
+    def __init__(self, version, name, apply=None, index=None):
+        self.version = version
+        self.name = name
+        self.apply = apply
+        self.index = index
+
+    @property
+    def concurrent(self):
+        return self.index is not None
+
+def _v1_base_tables(cursor):
+    """users, artists, albums, tracks, audio_features, top_tracks and staging markers"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id VARCHAR(255) PRIMARY KEY,
+            display_name VARCHAR(255),
+            email VARCHAR(255),
+            country VARCHAR(10),
+            followers INTEGER,
+            account_type VARCHAR(50),
+            row_hash CHAR(40),
+            etl_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS artists (
+            artist_id VARCHAR(255) PRIMARY KEY,
+            artist_name VARCHAR(255) NOT NULL,
+            genres TEXT[],
+            popularity INTEGER,
+            followers INTEGER,
+            row_hash CHAR(40),
+            etl_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS albums (
+            album_id VARCHAR(255) PRIMARY KEY,
+            album_name VARCHAR(255),
+            artist_id VARCHAR(255) REFERENCES artists(artist_id),
+            album_type VARCHAR(50),
+            release_date VARCHAR(20),
+            total_tracks INTEGER,
+            album_image_url TEXT,
+            etl_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tracks (
+            track_id VARCHAR(255) PRIMARY KEY,
+            track_name VARCHAR(255) NOT NULL,
+            artist_id VARCHAR(255) REFERENCES artists(artist_id),
+            album_id VARCHAR(255),
+            duration_ms INTEGER,
+            explicit BOOLEAN,
+            popularity INTEGER,
+            track_number INTEGER,
+            preview_url TEXT,
+            spotify_url TEXT,
+            album_image_url TEXT,
+            row_hash CHAR(40),
+            etl_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS audio_features (
+            track_id VARCHAR(255) PRIMARY KEY REFERENCES tracks(track_id),
+            danceability DECIMAL(4,3),
+            energy DECIMAL(4,3),
+            key INTEGER,
+            loudness DECIMAL(5,3),
+            mode INTEGER,
+            speechiness DECIMAL(4,3),
+            acousticness DECIMAL(6,5),
+            instrumentalness DECIMAL(6,5),
+            liveness DECIMAL(4,3),
+            valence DECIMAL(4,3),
+            tempo DECIMAL(6,3),
+            duration_ms INTEGER,
+            time_signature INTEGER,
+            etl_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Aggregated top tracks per time range (was only in create_database.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS top_tracks (
+            id SERIAL PRIMARY KEY,
+            user_id VARCHAR(255),
+            track_id VARCHAR(255) REFERENCES tracks(track_id),
+            time_range VARCHAR(50),
+            rank_position INTEGER,
+            retrieved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Commit markers for staged chunks (see DatabaseLoader.load_staged)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS staging_chunk_loads (
+            run_id VARCHAR(255),
+            chunk_name VARCHAR(255),
+            checksum CHAR(64),
+            row_count INTEGER,
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (run_id, chunk_name)
+        )
+    """)
+
+    # Databases created by the old setup script may predate these columns
+    for table, column, column_type in [
+        ('artists', 'genres', 'TEXT[]'),
+        ('artists', 'popularity', 'INTEGER'),
+        ('artists', 'followers', 'INTEGER'),
+        ('tracks', 'album_id', 'VARCHAR(255)'),
+        ('tracks', 'track_number', 'INTEGER'),
+        ('tracks', 'album_image_url', 'TEXT'),
+        ('users', 'row_hash', 'CHAR(40)'),
+        ('artists', 'row_hash', 'CHAR(40)'),
+        ('tracks', 'row_hash', 'CHAR(40)'),
+    ]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}')
+
+def _v2_listening_history(cursor):
+    """Monthly range-partitioned listening_history (moving a plain legacy table aside)"""
+    legacy_history = rename_legacy_table(cursor)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {PARENT_TABLE} (
+            history_id BIGSERIAL,
+            user_id VARCHAR(255),
+            track_id VARCHAR(255) REFERENCES tracks(track_id),
+            played_at TIMESTAMP NOT NULL,
+            context_type VARCHAR(100),
+            context_name VARCHAR(255),
+            etl_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (history_id, played_at),
+            CONSTRAINT uq_listening_history_play UNIQUE (user_id, played_at, track_id)
+        ) PARTITION BY RANGE (played_at)
+    """)
+    ensure_partitions(cursor)
+    if legacy_history:
+        copy_legacy_rows(cursor)
+
+def _v5_data_quality_metrics(cursor):
+    """One row per data-quality metric per loaded batch (see data_quality.py)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS data_quality_metrics (
+            id BIGSERIAL PRIMARY KEY,
+            run_id VARCHAR(255) NOT NULL,
+            user_id VARCHAR(255),
+            check_name VARCHAR(100) NOT NULL,
+            metric VARCHAR(255) NOT NULL,
+            value DOUBLE PRECISION,
+            threshold DOUBLE PRECISION,
+            passed BOOLEAN,
+            batch_rows INTEGER,
+            checked_at TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'UTC')
+        )
+    """)
+    # Trend queries read one metric over time
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_data_quality_metrics_metric
+        ON data_quality_metrics (metric, checked_at)
+    """)
+
+MIGRATIONS = [
+    Migration(1, 'base tables', apply=_v1_base_tables),
+    Migration(2, 'partitioned listening_history', apply=_v2_listening_history),
+    # BRIN suits append-mostly, time-ordered plays and stays tiny
+    Migration(3, 'listening_history played_at BRIN index',
+              index=('idx_listening_history_played_at_brin', PARENT_TABLE, 'USING BRIN (played_at)')),
+    Migration(4, 'listening_history user_id index',
+              index=('idx_listening_history_user_id', PARENT_TABLE, '(user_id)')),
+    Migration(5, 'data_quality_metrics table', apply=_v5_data_quality_metrics),
+]
+
+def applied_versions(cursor):
+    """Versions already applied (a single query; empty before the first migration)"""
+    try:
+        cursor.execute(f'SELECT version FROM {MIGRATIONS_TABLE}')
+        return {row[0] for row in cursor.fetchall()}
+    except errors.UndefinedTable:
+        cursor.connection.rollback()
+        return set()
+
+def _record(cursor, migration):
+    cursor.execute(
+        f'INSERT INTO {MIGRATIONS_TABLE} (version, name) VALUES (%s, %s) ON CONFLICT (version) DO NOTHING',
+        (migration.version, migration.name)
+    )
+
+def drop_invalid_index(cursor, name):
+    """
+    A failed concurrent build leaves an invalid index behind; drop it so it's rebuilt
+
+    Needs an autocommit cursor (DROP INDEX CONCURRENTLY).
+    """
+    cursor.execute("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND NOT i.indisvalid AND c.relkind = 'i'
+    """, (name,))
+    if cursor.fetchone():
+        cursor.execute(f'DROP INDEX CONCURRENTLY {name}')
+
+def _create_index(cursor, name, table, definition):
+    """
+    CREATE INDEX CONCURRENTLY (autocommit cursor)
+
+    Partitioned tables can't be indexed concurrently, so the parent index is
+    created ON ONLY the parent (instant, initially invalid), each partition is
+    indexed concurrently and attached; the parent index turns valid once all are.
+    """
+    if not is_partitioned(cursor, table):
+        drop_invalid_index(cursor, name)
+        cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition}')
+        return
+
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} {definition}')
+    for partition, month in list_partitions(cursor):
+        partition_index = f'{name}_y{month.year}m{month.month:02d}'
+        cursor.execute("""
+            SELECT 1 FROM pg_inherits i
+            JOIN pg_class parent ON parent.oid = i.inhparent
+            JOIN pg_class child ON child.oid = i.inhrelid
+            JOIN pg_index x ON x.indexrelid = child.oid
+            WHERE parent.relname = %s AND x.indrelid = %s::regclass
+        """, (name, partition))
+        if cursor.fetchone():
+            continue
+        drop_invalid_index(cursor, partition_index)
+        cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition_index} ON {partition} {definition}')
+        cursor.execute(f'ALTER INDEX {name} ATTACH PARTITION {partition_index}')
+
+def migrate(connection=None):
+    """
+    Bring the schema up to date
+
+    Applied versions are read with one query; if nothing is missing the call
+    returns without any DDL or catalog locks. Missing transactional steps run
+    in a single transaction, then missing indexes are built concurrently.
+
+    Returns:
+        versions applied by this call
+    """
+    global _up_to_date
+    if _up_to_date:
+        return []
+
+    pooled = connection is None
+    connection = connection or get_pool().getconn()
+    cursor = connection.cursor()
+    try:
+        done = applied_versions(cursor)
+        connection.rollback()
+        pending = [m for m in MIGRATIONS if m.version not in done]
+        if not pending:
+            _up_to_date = True
+            return []
+
+        # Legacy copies and concurrent index builds can outlast the pool's statement_timeout
+        with without_statement_timeout(connection):
+            cursor.execute('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_KEY,))
+            connection.commit()
+            try:
+                applied = _apply(connection, cursor)
+            finally:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_KEY,))
+                connection.commit()
+
+        _up_to_date = True
+        return applied
+
+    finally:
+        cursor.close()
+        if pooled:
+            get_pool().putconn(connection)
+
+def _apply(connection, cursor):
+    """Apply missing migrations (caller holds the advisory lock)"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Re-read under the lock: another worker may have just migrated
+    done = applied_versions(cursor)
+    pending = [m for m in MIGRATIONS if m.version not in done]
+
+    applied = []
+    try:
+        for migration in pending:
+            if migration.concurrent:
+                continue
+            logger.info(f'Applying schema version {migration.version}: {migration.name}')
+            migration.apply(cursor)
+            _record(cursor, migration)
+            applied.append(migration.version)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    connection.autocommit = True
+    try:
+        for migration in pending:
+            if not migration.concurrent:
+                continue
+            logger.info(f'Applying schema version {migration.version}: {migration.name}')
+            _create_index(cursor, *migration.index)
+            _record(cursor, migration)
+            applied.append(migration.version)
+    finally:
+        connection.autocommit = False
+
+    logger.info(f'Schema migrated to version {max(m.version for m in MIGRATIONS)}')
+    return applied
+
+def reset_cache():
+    """Forget that the schema was up to date (e.g. after restoring a database)"""
+    global _up_to_date
+    _up_to_date = False
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    print(f'Applied versions: {migrate() or "none (already up to date)"}')
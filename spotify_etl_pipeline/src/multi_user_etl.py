@@ -0,0 +1,85 @@
+import glob
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config.spotify_config import SpotifyConfig
+from .extract_spotify import SpotifyExtractor
+from .load_to_database import DatabaseLoader
+from .rate_limiter import get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+def discover_token_caches(cache_dir=None):
+    """List the per-user token cache files in cache_dir"""
+    cache_dir = cache_dir or SpotifyConfig.TOKEN_CACHE_DIR
+    paths = sorted(
+        path for path in glob.glob(os.path.join(cache_dir, '*'))
+        if os.path.isfile(path) and not path.endswith('.lock')
+    )
+    logger.info(f'Found {len(paths)} token caches in {cache_dir}')
+    return paths
+
+def extract_user(cache_path):
+    """Extract one user's profile and new plays (runs in a worker thread)"""
+    extractor = SpotifyExtractor(cache_path=cache_path)
+    profile = extractor.get_user_profile()
+    recent_tracks = extractor.get_recent_played(incremental=True)
+    return extractor, profile, recent_tracks
+
+def run_multi_user_etl(cache_paths=None, max_workers=None):
+    """
+    Run extraction for many users through a bounded thread pool
+
+    All workers share the process-wide rate limiter, so throughput scales
+    with max_workers until the API quota is reached. Each user's results
+    are loaded as soon as that user finishes, on this thread, so one DB
+    connection serves the whole run.
+
+    Returns:
+        dict of {cache_path: tracks loaded, or None if the user failed}
+    """
+    cache_paths = cache_paths if cache_paths is not None else discover_token_caches()
+    max_workers = max_workers or SpotifyConfig.MULTI_USER_WORKERS
+    results = {}
+    if not cache_paths:
+        logger.info('No users to process')
+        return results
+
+    logger.info(f'Starting multi-user ETL for {len(cache_paths)} users with {max_workers} workers...')
+    loader = DatabaseLoader()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='spotify-user') as pool:
+            futures = {pool.submit(extract_user, path): path for path in cache_paths}
+
+            for future in as_completed(futures):
+                cache_path = futures[future]
+                try:
+                    extractor, profile, recent_tracks = future.result()
+                except Exception as e:
+                    logger.error(f'Extraction failed for {cache_path}: {e}')
+                    results[cache_path] = None
+                    continue
+
+                if not profile:
+                    results[cache_path] = None
+                    continue
+
+                loader.load_user_profile(profile)
+                loaded = 0
+                if not recent_tracks.empty:
+                    loaded = loader.load_tracks(recent_tracks, user_id=profile['user_id'])
+                    if loaded:
+                        extractor.commit_watermark(recent_tracks, user_id=profile['user_id'])
+
+                results[cache_path] = loaded
+                logger.info(f'Loaded {loaded} tracks for {profile["user_id"]}')
+    finally:
+        loader.close()
+
+    failed = sum(1 for r in results.values() if r is None)
+    logger.info(f'Multi-user ETL finished: {len(results) - failed} ok, {failed} failed, '
+                f'rate limiter {get_rate_limiter().stats()}')
+    return results
+
+if __name__ == '__main__':
+    run_multi_user_etl()
@@ -0,0 +1,83 @@
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Column name -> (path into a track object, dtype)
+# Paths are walked key by key (ints index into lists); a missing step gives the default.
+TRACK_FIELDS = {
+    'track_id': (('id',), 'object'),
+    'track_name': (('name',), 'object'),
+    'artist_id': (('artists', 0, 'id'), 'category'),
+    'artist_name': (('artists', 0, 'name'), 'category'),
+    'album_id': (('album', 'id'), 'category'),
+    'album_name': (('album', 'name'), 'category'),
+    'popularity': (('popularity',), 'Int16'),
+    'duration_ms': (('duration_ms',), 'Int32'),
+    'explicit': (('explicit',), 'boolean'),
+    'track_number': (('track_number',), 'Int16'),
+    'preview_url': (('preview_url',), 'object'),
+    'spotify_url': (('external_urls', 'spotify'), 'object'),
+    'album_image_url': (('album', 'images', 0, 'url'), 'object'),
+}
+
+# Columns kept as '' rather than null when Spotify omits them
+EMPTY_STRING_DEFAULTS = {'preview_url', 'album_image_url'}
+
+PLAYED_AT_DTYPE = 'object'
+ADDED_AT_DTYPE = 'object'
+
+def _walk(obj, path):
+    for step in path:
+        try:
+            obj = obj[step]
+        except (KeyError, IndexError, TypeError):
+            return None
+        if obj is None:
+            return None
+    return obj
+
+def _track_columns(tracks):
+    """Fill one list per column straight from the track objects (no per-row dicts)"""
+    tracks = list(tracks)
+    columns = {}
+    for name, (path, _) in TRACK_FIELDS.items():
+        values = [_walk(track, path) for track in tracks]
+        if name in EMPTY_STRING_DEFAULTS:
+            values = ['' if v is None else v for v in values]
+        columns[name] = values
+    columns['artist_ids'] = [[artist['id'] for artist in track.get('artists') or []] for track in tracks]
+    return columns
+
+def _frame(columns, dtypes):
+    df = pd.DataFrame(columns)
+    if df.empty:
+        return df
+    return df.astype({name: dtype for name, dtype in dtypes.items() if name in df and dtype != 'object'})
+
+def _track_dtypes():
+    return {name: dtype for name, (_, dtype) in TRACK_FIELDS.items()}
+
+def parse_top_tracks(items):
+    """Build a typed tracks DataFrame from full track objects (/me/top/tracks, /tracks)"""
+    return _frame(_track_columns(items), _track_dtypes())
+
+def parse_recent_played(items):
+    """Build a typed DataFrame from /me/player/recently-played items"""
+    items = list(items)
+    columns = {'played_at': [item['played_at'] for item in items]}
+    columns.update(_track_columns(item['track'] for item in items))
+    return _frame(columns, {'played_at': PLAYED_AT_DTYPE, **_track_dtypes()})
+
+def parse_track_items(items):
+    """
+    Build a tracks DataFrame from saved-track or playlist items ({'added_at', 'track'}).
+    Local files, episodes and removed tracks are skipped.
+    """
+    items = [
+        item for item in items
+        if item.get('track') and item['track'].get('type', 'track') == 'track' and item['track'].get('id')
+    ]
+    columns = {'added_at': [item.get('added_at') for item in items]}
+    columns.update(_track_columns(item['track'] for item in items))
+    return _frame(columns, {'added_at': ADDED_AT_DTYPE, **_track_dtypes()})
@@ -0,0 +1,213 @@
+import logging
+from datetime import date
+import pandas as pd
+from config.database_config import DatabaseConfig
+from .db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'listening_history'
+LEGACY_TABLE = 'listening_history_legacy'
+ROLLUP_TABLE = 'listening_history_monthly'
+
+# Partitions known to exist in this process (skips catalog lookups); only
+# names whose CREATE has committed belong here, see remember_partitions
+_known_partitions = set()
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+    return f'{PARENT_TABLE}_y{month.year}m{month.month:02d}'
+
+def create_partition_sql(month):
+    return f"""
+        CREATE TABLE IF NOT EXISTS {partition_name(month)}
+        PARTITION OF {PARENT_TABLE}
+        FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')
+    """
+
+def months_for(played_at_values):
+    """Sorted first-of-month dates covering a batch of played_at values"""
+    played_at = pd.to_datetime(pd.Series(played_at_values), utc=True, format='ISO8601').dropna()
+    return sorted({month_start(ts) for ts in played_at})
+
+def ensure_partition(cursor, month):
+    """
+    Create the monthly partition for `month` if it doesn't exist yet (no commit)
+
+    The name is not cached here: pass it to remember_partitions once the
+    transaction has committed, so a rolled-back CREATE is looked up again.
+    """
+    name = partition_name(month)
+    if name in _known_partitions:
+        return name
+
+    cursor.execute('SELECT 1 FROM pg_class WHERE relname = %s', (name,))
+    if not cursor.fetchone():
+        cursor.execute(create_partition_sql(month))
+        logger.info(f'Created partition {name}')
+    return name
+
+def pending_months(played_at_values):
+    """Months in a batch whose partitions this process hasn't seen yet"""
+    return [month for month in months_for(played_at_values) if partition_name(month) not in _known_partitions]
+
+def remember_partition(month):
+    """Record that the partition for `month` exists (after creating it without ensure_partition)"""
+    _known_partitions.add(partition_name(month))
+
+def remember_partitions(names):
+    """Record partitions from ensure_partition(s) once their transaction has committed"""
+    _known_partitions.update(names)
+
+def ensure_partitions(cursor, months_ahead=3, months_back=1, today=None):
+    """Create partitions around the current month so loads never wait on DDL"""
+    current = month_start(today or date.today())
+    return [ensure_partition(cursor, add_months(current, offset))
+            for offset in range(-months_back, months_ahead + 1)]
+
+def ensure_partitions_for(cursor, played_at_values):
+    """Create partitions for every month that appears in a batch of played_at values"""
+    return [ensure_partition(cursor, month) for month in months_for(played_at_values)]
+
+def _relkind(cursor, table):
+    """pg_class.relkind of a public table ('r' plain, 'p' partitioned), or None if missing"""
+    cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s AND relnamespace = 'public'::regnamespace",
+                   (table,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def is_partitioned(cursor, table=PARENT_TABLE):
+    """True if `table` (by default listening_history) is a partitioned table"""
+    return _relkind(cursor, table) == 'p'
+
+def rename_legacy_table(cursor):
+    """
+    Move a plain (pre-partitioning) listening_history out of the way,
+    renaming its indexes so the new table can reuse their names.
+
+    Returns:
+        True if a legacy table was renamed
+    """
+    if _relkind(cursor, PARENT_TABLE) != 'r':
+        return False
+
+    cursor.execute('SELECT indexname FROM pg_indexes WHERE tablename = %s', (PARENT_TABLE,))
+    for (index_name,) in cursor.fetchall():
+        cursor.execute(f'ALTER INDEX {index_name} RENAME TO {index_name}_legacy')
+    cursor.execute(f'ALTER TABLE {PARENT_TABLE} RENAME TO {LEGACY_TABLE}')
+    logger.info(f'Renamed unpartitioned {PARENT_TABLE} to {LEGACY_TABLE}')
+    return True
+
+def copy_legacy_rows(cursor):
+    """Copy plays from the legacy table into the partitioned one (after rename_legacy_table)"""
+    cursor.execute(f'SELECT MIN(played_at), MAX(played_at) FROM {LEGACY_TABLE}')
+    low, high = cursor.fetchone()
+    if low is None:
+        return 0
+
+    month = month_start(low)
+    while month <= month_start(high):
+        ensure_partition(cursor, month)
+        month = add_months(month, 1)
+
+    cursor.execute(f"""
+        INSERT INTO {PARENT_TABLE} (user_id, track_id, played_at, context_type, context_name, etl_timestamp)
+        SELECT user_id, track_id, played_at, context_type, context_name, etl_timestamp
+        FROM {LEGACY_TABLE}
+        ON CONFLICT (user_id, played_at, track_id) DO NOTHING
+    """)
+    copied = cursor.rowcount
+    logger.info(f'Copied {copied} plays from {LEGACY_TABLE}; drop it once verified')
+    return copied
+
+def list_partitions(cursor):
+    """Return [(partition name, month)] for the monthly partitions, oldest first"""
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s
+    """, (PARENT_TABLE,))
+    partitions = []
+    for (name,) in cursor.fetchall():
+        suffix = name[len(PARENT_TABLE) + 2:]
+        try:
+            year, month = suffix.split('m')
+            partitions.append((name, date(int(year), int(month), 1)))
+        except ValueError:
+            continue
+    return sorted(partitions, key=lambda p: p[1])
+
+def apply_retention(connection, keep_months=24, rollup=True, drop=False, today=None):
+    """
+    Detach monthly partitions older than keep_months
+
+    With rollup=True the plays are first summarised into listening_history_monthly
+    (plays per user, track and month), so long-range trends survive detaching.
+    Detached partitions stay as standalone tables unless drop=True.
+
+    Returns:
+        names of the partitions detached
+    """
+    cutoff = add_months(month_start(today or date.today()), -keep_months)
+    cursor = connection.cursor()
+    if rollup:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+                user_id VARCHAR(255),
+                track_id VARCHAR(255),
+                month DATE,
+                plays INTEGER,
+                PRIMARY KEY (user_id, track_id, month)
+            )
+        """)
+        connection.commit()
+
+    detached = []
+    for name, month in list_partitions(cursor):
+        if month >= cutoff:
+            break
+        if rollup:
+            cursor.execute(f"""
+                INSERT INTO {ROLLUP_TABLE} (user_id, track_id, month, plays)
+                SELECT user_id, track_id, %s, COUNT(*)
+                FROM {name}
+                GROUP BY user_id, track_id
+                ON CONFLICT (user_id, track_id, month) DO UPDATE SET plays = EXCLUDED.plays
+            """, (month,))
+        cursor.execute(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}')
+        if drop:
+            cursor.execute(f'DROP TABLE {name}')
+        connection.commit()
+        _known_partitions.discard(name)
+        detached.append(name)
+        logger.info(f'Detached partition {name}')
+
+    cursor.close()
+    return detached
+
+def maintain_partitions(keep_months=None, months_ahead=3):
+    """
+    Scheduled job (the DAG's maintain_partitions task): create upcoming
+    partitions and apply retention
+
+    Returns:
+        names of the partitions detached
+    """
+    keep_months = keep_months or DatabaseConfig.HISTORY_RETENTION_MONTHS
+    with get_pool().connection() as connection:
+        with connection.cursor() as cursor:
+            names = ensure_partitions(cursor, months_ahead=months_ahead)
+        connection.commit()
+        remember_partitions(names)
+        return apply_retention(connection, keep_months=keep_months)
+
+if __name__ == '__main__':
+    maintain_partitions()
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from config.spotify_config import SpotifyConfig
+
+logger = logging.getLogger(__name__)
+
+class RateLimitExceeded(Exception):
+    """Raised when a call is still throttled after all retries"""
+
+def _status_of(error):
+    # spotipy.SpotifyException uses http_status, aiohttp.ClientResponseError uses status
+    return getattr(error, 'http_status', None) or getattr(error, 'status', None)
+
+def _retry_after_of(error):
+    headers = getattr(error, 'headers', None) or {}
+    value = headers.get('Retry-After') or headers.get('retry-after')
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    """
+    Shared token-bucket scheduler for Spotify API calls.
+
+    - `rate` requests per second on average, with bursts up to `burst`
+    - at most `max_in_flight` requests running at once
+    - a 429 pauses *every* caller until its Retry-After has passed
+    - 429/5xx are retried with jittered exponential backoff
+
+    Works from threads (`call`) and from asyncio (`call_async`).
+    """
+
+    def __init__(self, rate=10.0, burst=20, max_in_flight=8, max_retries=5,
+                 base_backoff=1.0, max_backoff=60.0):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._async_in_flight = weakref.WeakKeyDictionary()
+
+        # Metrics
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.throttle_seconds = 0.0
+
+    def _reserve(self):
+        """Take one token and return how long the caller must wait for it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            self.requests += 1
+
+            wait = 0.0
+            if self._tokens < 0:
+                wait = -self._tokens / self.rate
+            wait = max(wait, self._blocked_until - now)
+            return wait
+
+    def _backoff(self, attempt):
+        # Full jitter: uniform in [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+
+    def _record_wait(self, seconds):
+        if seconds > 0:
+            with self._lock:
+                self.throttle_seconds += seconds
+
+    def penalize(self, seconds):
+        """Block all callers for `seconds` (used for Retry-After)"""
+        with self._lock:
+            self.throttled += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        logger.warning(f'Spotify rate limit hit, pausing requests for {seconds:.1f}s')
+
+    def _handle_error(self, error, attempt):
+        """Return the delay before retrying, or re-raise if not retryable"""
+        status = _status_of(error)
+        if status == 429:
+            retry_after = _retry_after_of(error)
+            delay = retry_after if retry_after is not None else self._backoff(attempt)
+            self.penalize(delay)
+        elif status is not None and 500 <= status < 600:
+            delay = self._backoff(attempt)
+        else:
+            raise error
+
+        if attempt >= self.max_retries:
+            raise RateLimitExceeded(f'Gave up after {attempt + 1} attempts: {error}') from error
+
+        with self._lock:
+            self.retries += 1
+        # The Retry-After pause is enforced by _reserve(); add jitter on top
+        return 0.0 if status == 429 else delay
+
+    def call(self, func, *args, **kwargs):
+        """Run a blocking Spotify call under the rate limit"""
+        attempt = 0
+        while True:
+            wait = self._reserve()
+            if wait > 0:
+                self._record_wait(wait)
+                time.sleep(wait + random.uniform(0, 0.05))
+
+            with self._in_flight:
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    delay = self._handle_error(e, attempt)
+
+            if delay > 0:
+                self._record_wait(delay)
+                time.sleep(delay)
+            attempt += 1
+
+    def _async_semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_in_flight.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._async_in_flight[loop] = semaphore
+        return semaphore
+
+    async def call_async(self, func, *args, **kwargs):
+        """Await a Spotify coroutine function under the rate limit"""
+        attempt = 0
+        semaphore = self._async_semaphore()
+        while True:
+            wait = self._reserve()
+            if wait > 0:
+                self._record_wait(wait)
+                await asyncio.sleep(wait + random.uniform(0, 0.05))
+
+            async with semaphore:
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    delay = self._handle_error(e, attempt)
+
+            if delay > 0:
+                self._record_wait(delay)
+                await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        """Current counters, e.g. for task return values or logs"""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'retries': self.retries,
+                'throttle_seconds': round(self.throttle_seconds, 3),
+            }
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Process-wide limiter shared by every Spotify client"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(
+                rate=SpotifyConfig.RATE_LIMIT_PER_SECOND,
+                burst=SpotifyConfig.RATE_LIMIT_BURST,
+                max_in_flight=SpotifyConfig.MAX_IN_FLIGHT_REQUESTS,
+            )
+        return _rate_limiter
+
+def set_rate_share(share):
+    """
+    Rebuild the process-wide limiter with `share` (0-1] of the configured budget
+
+    For processes that run side by side against one API quota, e.g. N mapped
+    Airflow tasks each take 1/N. Call before creating any Spotify client.
+    """
+    global _rate_limiter
+    share = min(max(share, 0.0), 1.0) or 1.0
+    with _rate_limiter_lock:
+        _rate_limiter = RateLimiter(
+            rate=SpotifyConfig.RATE_LIMIT_PER_SECOND * share,
+            burst=max(1, int(SpotifyConfig.RATE_LIMIT_BURST * share)),
+            max_in_flight=max(1, int(SpotifyConfig.MAX_IN_FLIGHT_REQUESTS * share)),
+        )
+        return _rate_limiter
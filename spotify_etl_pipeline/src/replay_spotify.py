@@ -0,0 +1,310 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import requests
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = '/v1'
+
+def fixture_name(method, path, params):
+    """File name for one recorded request (method + API path + sorted query)"""
+    if path.startswith(API_PREFIX):
+        path = path[len(API_PREFIX):]
+    query = urlencode(sorted((k, str(v)) for k, v in (params or {}).items()))
+    digest = hashlib.sha1(query.encode('utf-8')).hexdigest()[:10]
+    return f"{method.upper()}{path.replace('/', '_')}_{digest}.json"
+
+class RecordingSession(requests.Session):
+    """
+    requests.Session that saves every Spotify API response to fixtures_dir.
+
+    Pass it to spotipy: spotipy.Spotify(auth_manager=..., requests_session=RecordingSession(dir))
+    """
+
+    def __init__(self, fixtures_dir):
+        super().__init__()
+        self.fixtures_dir = fixtures_dir
+        os.makedirs(fixtures_dir, exist_ok=True)
+
+    def request(self, method, url, **kwargs):
+        response = super().request(method, url, **kwargs)
+        # Key on the URL that was actually sent: requests drops None params
+        # (spotipy passes before=None/after=None), and so must the replay key
+        parts = urlsplit(response.request.url)
+        params = dict(parse_qsl(parts.query))
+
+        try:
+            body = response.json() if response.content else None
+        except ValueError:
+            body = None
+
+        fixture = {
+            'status': response.status_code,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() in ('retry-after',)},
+            'body': body,
+        }
+        with open(os.path.join(self.fixtures_dir, fixture_name(method, parts.path, params)), 'w') as f:
+            json.dump(fixture, f)
+        return response
+
+# User ID of the synthetic library's profile
+REPLAY_USER_ID = 'replay_user'
+
+def _iso(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+class SyntheticLibrary:
+    """Deterministic fake Spotify data for a user with `plays` plays and `saved_tracks` saved tracks"""
+
+    def __init__(self, plays=50, saved_tracks=0, distinct_tracks=2000, distinct_artists=300, start_ms=1_700_000_000_000):
+        self.plays = plays
+        self.saved_tracks = saved_tracks
+        self.distinct_tracks = distinct_tracks
+        self.distinct_artists = distinct_artists
+        self.start_ms = start_ms
+
+    def track(self, n):
+        n %= self.distinct_tracks
+        artist = n % self.distinct_artists
+        return {
+            'id': f'track{n:07d}',
+            'type': 'track',
+            'name': f'Track {n}',
+            'artists': [{'id': f'artist{artist:05d}', 'name': f'Artist {artist}'}],
+            'album': {
+                'id': f'album{n // 10:06d}',
+                'name': f'Album {n // 10}',
+                'images': [{'url': f'https://i.scdn.co/image/{n // 10}'}],
+            },
+            'popularity': n % 100,
+            'duration_ms': 180_000 + n % 60_000,
+            'explicit': n % 7 == 0,
+            'track_number': n % 12 + 1,
+            'preview_url': None,
+            'external_urls': {'spotify': f'https://open.spotify.com/track/{n}'},
+        }
+
+    def artist(self, n):
+        return {'id': f'artist{n:05d}', 'type': 'artist', 'name': f'Artist {n}', 'genres': [f'genre{n % 20}'],
+                'popularity': n % 100, 'followers': {'total': n * 10}}
+
+    def album(self, n):
+        first_track = self.track(n * 10)
+        return {'id': f'album{n:06d}', 'type': 'album', 'name': f'Album {n}', 'album_type': 'album',
+                'artists': first_track['artists'], 'release_date': f'{2000 + n % 25}-01-01', 'total_tracks': 10,
+                'images': first_track['album']['images']}
+
+    def audio_features(self, n):
+        return {'id': f'track{n:07d}', 'danceability': n % 10 / 10, 'energy': n % 7 / 7, 'key': n % 12,
+                'loudness': -(n % 30), 'mode': n % 2, 'speechiness': 0.05, 'acousticness': 0.1,
+                'instrumentalness': 0.0, 'liveness': 0.1, 'valence': n % 5 / 5, 'tempo': 90 + n % 60,
+                'duration_ms': 180_000 + n % 60_000, 'time_signature': 4}
+
+    def played_at_ms(self, i):
+        return self.start_ms + i * 1000
+
+    def recently_played(self, params, base_url):
+        limit = int(params.get('limit', 20))
+        after = params.get('after')
+        if after is not None:
+            # Oldest `limit` plays after the cursor, so paging moves forward
+            first = max(0, (int(after) - self.start_ms) // 1000 + 1)
+        else:
+            first = max(0, self.plays - limit)
+        indexes = range(first, min(self.plays, first + limit))
+
+        items = [{'played_at': _iso(self.played_at_ms(i)), 'track': self.track(i)} for i in reversed(indexes)]
+        cursors = None
+        if items:
+            cursors = {'after': str(self.played_at_ms(indexes[-1])), 'before': str(self.played_at_ms(indexes[0]))}
+        return {'items': items, 'limit': limit, 'cursors': cursors, 'next': None}
+
+    def saved(self, params, base_url):
+        limit = int(params.get('limit', 20))
+        offset = int(params.get('offset', 0))
+        indexes = range(offset, min(self.saved_tracks, offset + limit))
+        next_url = None
+        if offset + limit < self.saved_tracks:
+            next_url = f"{base_url}/me/tracks?{urlencode({'limit': limit, 'offset': offset + limit})}"
+        return {
+            'items': [{'added_at': _iso(self.played_at_ms(i)), 'track': self.track(i)} for i in indexes],
+            'limit': limit, 'offset': offset, 'total': self.saved_tracks, 'next': next_url,
+        }
+
+    def handle(self, path, params, base_url):
+        """Return a response body for an API path, or None if not simulated"""
+        # spotipy requests the profile as 'me/'
+        path = path.rstrip('/')
+        if path == '/me':
+            return {'id': REPLAY_USER_ID, 'display_name': 'Replay User', 'email': '', 'country': 'US',
+                    'followers': {'total': 0}, 'product': 'premium'}
+        if path == '/me/player/recently-played':
+            return self.recently_played(params, base_url)
+        if path == '/me/top/tracks':
+            limit = int(params.get('limit', 20))
+            return {'items': [self.track(i) for i in range(limit)], 'next': None}
+        if path == '/me/tracks':
+            return self.saved(params, base_url)
+        # Bulk lookups: the number in each synthetic ID is the entity's index
+        ids = [i for i in params.get('ids', '').split(',') if i]
+        if path == '/tracks':
+            return {'tracks': [self.track(int(i[5:])) for i in ids]}
+        if path == '/artists':
+            return {'artists': [self.artist(int(i[6:])) for i in ids]}
+        if path == '/albums':
+            return {'albums': [self.album(int(i[5:])) for i in ids]}
+        if path == '/audio-features':
+            return {'audio_features': [self.audio_features(int(i[5:])) for i in ids]}
+        return None
+
+class ReplayServer:
+    """
+    Local HTTP server that plays back recorded fixtures (and/or a SyntheticLibrary)
+    with configurable latency, 5xx errors and 429s.
+
+    Usage:
+        with ReplayServer(library=SyntheticLibrary(plays=5000), latency=0.02) as server:
+            sp = new_spotify_client(auth='replay')  # from auth_spotify
+            sp.prefix = server.api_url + '/'
+    """
+
+    def __init__(self, fixtures_dir=None, library=None, latency=0.0, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=1, seed=0):
+        self.fixtures_dir = fixtures_dir
+        self.library = library
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def api_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}{API_PREFIX}'
+
+    def _fault(self):
+        """Decide whether this request gets a 429 or a 500"""
+        with self._lock:
+            self.requests += 1
+            roll = self._random.random()
+            if roll < self.throttle_rate:
+                self.throttled += 1
+                return 429
+            if roll < self.throttle_rate + self.error_rate:
+                self.errors += 1
+                return 500
+        return None
+
+    def _lookup(self, method, path, params):
+        if self.fixtures_dir:
+            fixture_path = os.path.join(self.fixtures_dir, fixture_name(method, path, params))
+            if os.path.exists(fixture_path):
+                with open(fixture_path) as f:
+                    fixture = json.load(f)
+                return fixture['status'], fixture.get('headers', {}), fixture['body']
+        if self.library is not None:
+            body = self.library.handle(path[len(API_PREFIX):], params, self.api_url)
+            if body is not None:
+                return 200, {}, body
+        return 404, {}, {'error': {'status': 404, 'message': f'No fixture for {path}'}}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so each request reuses the client's connection; without
+            # Nagle, headers and body written separately don't wait on a delayed ACK
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                parts = urlsplit(self.path)
+                params = dict(parse_qsl(parts.query))
+
+                fault = server._fault()
+                if fault == 429:
+                    status, headers, body = 429, {'Retry-After': str(server.retry_after)}, {
+                        'error': {'status': 429, 'message': 'API rate limit exceeded'}}
+                elif fault == 500:
+                    status, headers, body = 500, {}, {'error': {'status': 500, 'message': 'Server error'}}
+                else:
+                    status, headers, body = server._lookup('GET', parts.path, params)
+
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f'Replay server listening on {self.api_url}')
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'throttled': self.throttled, 'errors': self.errors}
+
+def record_fixtures(fixtures_dir, cache_path=None):
+    """Run the standard extraction against the live API and record every response"""
+    import spotipy
+    from .auth_spotify import get_spotify_oauth
+    from .extract_spotify import TIME_RANGES, SpotifyExtractor
+
+    # A session of our own gets no urllib3 retries, so 429s are recorded as served
+    sp = spotipy.Spotify(
+        auth_manager=get_spotify_oauth(cache_path, interactive=True),
+        requests_session=RecordingSession(fixtures_dir)
+    )
+    extractor = SpotifyExtractor(sp=sp)
+    extractor.get_user_profile()
+    extractor.get_recent_played(limit=50)
+    for time_range in TIME_RANGES:
+        extractor.get_top_tracks(time_range=time_range, limit=50)
+    for chunk_df in extractor.iter_saved_tracks():
+        pass
+    logger.info(f'Recorded fixtures to {fixtures_dir}')
+
+if __name__ == '__main__':
+    import sys
+    record_fixtures(sys.argv[1] if len(sys.argv) > 1 else 'data/fixtures')
@@ -1,110 +1,21 @@
-import psycopg2
-from config.database_config import DatabaseConfig
+from .db_pool import get_pool
+from .migrations import migrate
 import logging
 
 logger = logging.getLogger(__name__)
 
 class DatabaseSetup:
     def __init__(self):
-        self.connection = psycopg2.connect(
-            host=DatabaseConfig.DB_HOST,
-            port=DatabaseConfig.DB_PORT,
-            database=DatabaseConfig.DB_NAME,
-            user=DatabaseConfig.DB_USER,
-            password=DatabaseConfig.DB_PASSWORD
-        )
+        self.connection = get_pool().getconn()
         self.cursor = self.connection.cursor()
         logger.info('Connected to PostgreSQL database')
 
     def create_tables(self):
-        """Create all tables for Spotify ETL"""
+        """Create or upgrade all tables for Spotify ETL (see migrations.py)"""
         try:
-            # Users table
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id VARCHAR(255) PRIMARY KEY,
-                    display_name VARCHAR(255),
-                    email VARCHAR(255),
-                    country VARCHAR(10),
-                    followers INTEGER,
-                    account_type VARCHAR(50),
-                    etl_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id)
-                )
-            """)
-            
-            # Artists table
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS artists (
-                    artist_id VARCHAR(255) PRIMARY KEY,
-                    artist_name VARCHAR(255) NOT NULL,
-                    etl_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(artist_id)
-                )
-            """)
-            
-            # Tracks table
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS tracks (
-                    track_id VARCHAR(255) PRIMARY KEY,
-                    track_name VARCHAR(255) NOT NULL,
-                    artist_id VARCHAR(255) REFERENCES artists(artist_id),
-                    duration_ms INTEGER,
-                    explicit BOOLEAN,
-                    popularity INTEGER,
-                    preview_url TEXT,
-                    spotify_url TEXT,
-                    etl_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(track_id)
-                )
-            """)
-            
-            # Listening history table
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS listening_history (
-                    history_id SERIAL PRIMARY KEY,
-                    user_id VARCHAR(255),
-                    track_id VARCHAR(255) REFERENCES tracks(track_id),
-                    played_at TIMESTAMP NOT NULL,
-                    context_type VARCHAR(100),
-                    context_name VARCHAR(255),
-                    etl_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Audio features table (for later when we add audio analysis)
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS audio_features (
-                    track_id VARCHAR(255) PRIMARY KEY REFERENCES tracks(track_id),
-                    danceability DECIMAL(4,3),
-                    energy DECIMAL(4,3),
-                    key INTEGER,
-                    loudness DECIMAL(5,3),
-                    mode INTEGER,
-                    speechiness DECIMAL(4,3),
-                    acousticness DECIMAL(6,5),
-                    instrumentalness DECIMAL(6,5),
-                    liveness DECIMAL(4,3),
-                    valence DECIMAL(4,3),
-                    tempo DECIMAL(6,3),
-                    duration_ms INTEGER,
-                    time_signature INTEGER,
-                    etl_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Create indexes for better performance
-            self.cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_listening_history_played_at 
-                ON listening_history(played_at DESC)
-            """)
-            
-            self.cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_listening_history_user_id 
-                ON listening_history(user_id)
-            """)
-            
-            self.connection.commit()
+            applied = migrate(self.connection)
+            if applied:
+                logger.info(f" Applied schema versions {applied}")
             logger.info(" All database tables created successfully!")
             
             # Show what we created
@@ -115,6 +26,7 @@ class DatabaseSetup:
                 ORDER BY table_name
             """)
             tables = self.cursor.fetchall()
+            self.connection.rollback()
             print("\n Created Tables:")
             for table in tables:
                 print(f"   • {table[0]}")
@@ -127,7 +39,7 @@ class DatabaseSetup:
     def close(self):
         """Close db connection"""
         self.cursor.close()
-        self.connection.close()
+        get_pool().putconn(self.connection)
 
 def setup_database():
     """Main function to setup db"""
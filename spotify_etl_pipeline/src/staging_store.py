@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timezone
+import pandas as pd
+from config.spotify_config import SpotifyConfig
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+class ChecksumMismatch(Exception):
+    """A staged chunk no longer matches the checksum recorded when it was written"""
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def safe_run_id(run_id):
+    """Airflow run IDs ('scheduled__2024-01-01T00:00:00+00:00') as a directory name"""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', run_id)
+
+def prune_run_dirs(root, max_age_days):
+    """Delete the run directories under root last modified more than max_age_days ago"""
+    if not os.path.isdir(root):
+        return []
+    cutoff = time.time() - max_age_days * 24 * 3600
+    removed = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(name)
+    return removed
+
+class StagingStore:
+    """
+    Write-ahead staging area for extracted plays.
+
+    A run is written once as Parquet chunks plus a manifest (profile, chunk
+    names, row counts, SHA-256 checksums). The manifest is written last, so
+    a run is either complete or ignored; once written, a run never changes.
+
+    Layout:
+        <root>/<run_id>/chunk-00000.parquet
+        <root>/<run_id>/manifest.json
+    """
+
+    def __init__(self, root=None):
+        self.root = root or SpotifyConfig.STAGING_DIR
+
+    def run_dir(self, run_id):
+        return os.path.join(self.root, safe_run_id(run_id))
+
+    def manifest(self, run_id):
+        """Return the manifest of a complete run, or None"""
+        path = os.path.join(self.run_dir(run_id), MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def write(self, run_id, tracks_df, profile=None, chunk_rows=None):
+        """
+        Stage tracks_df (and the user's profile) for run_id
+
+        If the run is already staged its manifest is returned unchanged, so a
+        retried extract can't swap out chunks a loader may have committed.
+
+        Returns:
+            the run's manifest
+        """
+        existing = self.manifest(run_id)
+        if existing is not None:
+            logger.info(f'Run {run_id} already staged; keeping its {len(existing["chunks"])} chunks')
+            return existing
+
+        chunk_rows = chunk_rows or SpotifyConfig.STAGING_CHUNK_ROWS
+        run_dir = self.run_dir(run_id)
+        os.makedirs(run_dir, exist_ok=True)
+
+        chunks = []
+        for index, start in enumerate(range(0, len(tracks_df), chunk_rows)):
+            name = f'chunk-{index:05d}.parquet'
+            path = os.path.join(run_dir, name)
+            tmp_path = f'{path}.tmp'
+            tracks_df.iloc[start:start + chunk_rows].to_parquet(tmp_path, index=False)
+            checksum = file_sha256(tmp_path)
+            os.replace(tmp_path, path)
+            chunks.append({'name': name, 'rows': min(chunk_rows, len(tracks_df) - start), 'sha256': checksum})
+
+        manifest = {
+            'run_id': safe_run_id(run_id),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'profile': profile,
+            'rows': len(tracks_df),
+            'max_played_at': tracks_df['played_at'].max() if 'played_at' in tracks_df and len(tracks_df) else None,
+            'chunks': chunks,
+        }
+        tmp_path = os.path.join(run_dir, f'{MANIFEST_NAME}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, default=str)
+        os.replace(tmp_path, os.path.join(run_dir, MANIFEST_NAME))
+
+        logger.info(f'Staged {len(tracks_df)} rows for run {run_id} in {len(chunks)} chunks')
+        # As stored (JSON types), so a first write and a retried one return the same thing
+        return self.manifest(run_id)
+
+    def read_chunk(self, run_id, chunk, columns=None):
+        """Read one chunk (optionally only `columns`) after verifying its checksum"""
+        path = os.path.join(self.run_dir(run_id), chunk['name'])
+        checksum = file_sha256(path)
+        if checksum != chunk['sha256']:
+            raise ChecksumMismatch(f'{path}: expected {chunk["sha256"]}, got {checksum}')
+        return pd.read_parquet(path, columns=columns)
+
+    def read_all(self, run_id, columns=None):
+        """All staged rows of a run as one DataFrame"""
+        manifest = self.manifest(run_id)
+        if not manifest or not manifest['chunks']:
+            return pd.DataFrame(columns=columns)
+        return pd.concat([self.read_chunk(run_id, chunk, columns) for chunk in manifest['chunks']],
+                         ignore_index=True)
+
+    def prune(self, max_age_days=None):
+        """Delete staged runs older than max_age_days"""
+        max_age_days = max_age_days if max_age_days is not None else SpotifyConfig.STAGING_RETENTION_DAYS
+        removed = prune_run_dirs(self.root, max_age_days)
+        if removed:
+            logger.info(f'Pruned {len(removed)} staged runs')
+        return removed
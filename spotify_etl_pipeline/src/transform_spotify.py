@@ -0,0 +1,67 @@
+import logging
+from datetime import datetime, timezone
+import pandas as pd
+from .parse_spotify import TRACK_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Columns kept by transform_tracks (when present), in this order
+TRACK_COLUMNS = list(TRACK_FIELDS) + ['artist_ids', 'played_at', 'added_at']
+
+# Target dtypes; timestamps are parsed to naive UTC, as the TIMESTAMP columns store them
+TRACK_DTYPES = {name: dtype for name, (_, dtype) in TRACK_FIELDS.items()}
+TIMESTAMP_COLUMNS = ['played_at', 'added_at']
+
+def etl_now():
+    """One naive-UTC timestamp for a whole batch"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def to_utc(values):
+    """Parse ISO timestamps (strings, datetimes, tz-aware or not) to naive UTC datetime64"""
+    return pd.to_datetime(values, utc=True, format='ISO8601', errors='coerce').dt.tz_localize(None)
+
+def transform_tracks(tracks_df, etl_timestamp=None):
+    """
+    Clean a tracks/plays DataFrame with column operations only
+
+    - keeps TRACK_COLUMNS, dropping anything else
+    - parses played_at/added_at to naive UTC (rows with an unparseable played_at are dropped)
+    - coerces every column to the parser's dtype, copying only columns that differ
+    - stamps the whole batch with one etl_timestamp
+
+    Cost is a handful of vectorized passes, independent of Python-level row count.
+    """
+    if tracks_df is None or tracks_df.empty:
+        return pd.DataFrame(columns=TRACK_COLUMNS + ['etl_timestamp'])
+
+    df = tracks_df[[c for c in TRACK_COLUMNS if c in tracks_df]].copy()
+
+    for column in TIMESTAMP_COLUMNS:
+        if column in df and not pd.api.types.is_datetime64_dtype(df[column]):
+            df[column] = to_utc(df[column])
+    if 'played_at' in df:
+        invalid = df['played_at'].isna()
+        if invalid.any():
+            logger.warning(f'Dropping {int(invalid.sum())} rows with an invalid played_at')
+            df = df[~invalid]
+
+    dtypes = {c: t for c, t in TRACK_DTYPES.items() if c in df and t != 'object' and str(df[c].dtype) != t}
+    if dtypes:
+        df = df.astype(dtypes)
+
+    df['etl_timestamp'] = pd.Timestamp(etl_timestamp or etl_now())
+    return df.reset_index(drop=True)
+
+def transform_profile(profile, etl_timestamp=None):
+    """Profile fields the users table stores, stamped with etl_timestamp"""
+    if not profile:
+        return None
+    return {
+        'user_id': profile['user_id'],
+        'display_name': profile['display_name'],
+        'email': profile.get('email', ''),
+        'country': profile.get('country', ''),
+        'followers': profile['followers'],
+        'account_type': profile['account_type'],
+        'etl_timestamp': etl_timestamp or etl_now()
+    }
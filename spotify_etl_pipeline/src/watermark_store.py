@@ -0,0 +1,94 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+import pandas as pd
+from config.spotify_config import SpotifyConfig
+
+logger = logging.getLogger(__name__)
+
+def played_at_to_ms(played_at):
+    """Convert a Spotify ISO played_at timestamp to Unix milliseconds"""
+    return int(pd.Timestamp(played_at).value // 1_000_000)
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive flock on `<path>.lock` for a read-modify-write of path
+
+    Covers other processes (Celery tasks, the daemon) as well as threads,
+    since every holder opens its own file description.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f'{path}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def write_json_atomic(path, data):
+    """Write data to a unique temp file next to path, then rename it into place"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f'.{os.path.basename(path)}.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+class WatermarkStore:
+    """
+    Persisted high-water marks for incremental extraction.
+
+    Stores the last seen `played_at` per user as Unix milliseconds, which is
+    the unit the recently-played `after` cursor expects.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or SpotifyConfig.WATERMARK_PATH
+        self._lock = threading.Lock()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Could not read watermarks from {self.path}: {e}')
+            return {}
+
+    def get(self, user_id):
+        """Return the last played_at (ms) for a user, or None"""
+        with self._lock:
+            value = self._read().get(user_id)
+        return int(value) if value is not None else None
+
+    def set(self, user_id, played_at_ms):
+        """Advance the watermark for a user (never moves backwards)"""
+        with self._lock, file_lock(self.path):
+            marks = self._read()
+            current = marks.get(user_id)
+            if current is not None and int(current) >= played_at_ms:
+                return int(current)
+
+            marks[user_id] = int(played_at_ms)
+
+            # Write to a temp file first so a crash never leaves half a file
+            write_json_atomic(self.path, marks)
+
+        logger.info(f'Watermark for {user_id} advanced to {played_at_ms}')
+        return int(played_at_ms)
+
+    def advance(self, user_id, played_at_values):
+        """Advance the watermark to the newest of a batch of played_at values"""
+        played_at = pd.to_datetime(pd.Series(played_at_values), utc=True, format='ISO8601')
+        if played_at.dropna().empty:
+            return self.get(user_id)
+        return self.set(user_id, played_at_to_ms(played_at.max()))
@@ -0,0 +1,25 @@
+import os
+import psycopg2
+import pytest
+from src.migrations import migrate
+
+# Database tests run against a throwaway database, e.g.
+# SPOTIFY_TEST_DSN=postgresql://postgres@localhost:5433/spotify_test
+TEST_DSN = os.getenv('SPOTIFY_TEST_DSN')
+
+@pytest.fixture
+def test_dsn():
+    """DSN of the test database (skips without SPOTIFY_TEST_DSN)"""
+    if not TEST_DSN:
+        pytest.skip('SPOTIFY_TEST_DSN is not set')
+    return TEST_DSN
+
+@pytest.fixture
+def db_connection(test_dsn):
+    """A psycopg2 connection to the migrated test database"""
+    connection = psycopg2.connect(test_dsn)
+    migrate(connection)
+    yield connection
+    # DatabaseLoader.close() closes a connection it was handed
+    if not connection.closed:
+        connection.close()
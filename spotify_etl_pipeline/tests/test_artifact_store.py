@@ -0,0 +1,46 @@
+import os
+import pandas as pd
+from src.artifact_store import ArtifactStore, is_ref
+from src.parse_spotify import parse_recent_played
+from src.replay_spotify import SyntheticLibrary, _iso
+
+RUN_ID = 'scheduled__2024-01-01T00:00:00+00:00'
+
+def _plays(plays=5):
+    library = SyntheticLibrary(plays=plays, distinct_tracks=3)
+    return parse_recent_played([{'played_at': _iso(library.played_at_ms(i)), 'track': library.track(i)}
+                                for i in range(plays)])
+
+def test_arrow_round_trip_keeps_values_and_dtypes(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    df = _plays()
+    df.loc[0, 'popularity'] = pd.NA
+
+    ref = store.write_frame(df, RUN_ID, 'recent')
+    assert is_ref(ref) and ref['rows'] == 5 and ref['columns'] == list(df.columns)
+    assert ref['__artifact__'].endswith('.arrow') and os.path.exists(ref['__artifact__'])
+
+    pd.testing.assert_frame_equal(store.read_frame(ref), df)
+    pd.testing.assert_frame_equal(store.read_frame(ref, columns=['track_id']), df[['track_id']])
+
+def test_offload_and_resolve_nested_values(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    value = {'profile': {'user_id': 'u'}, 'top_tracks': {'short_term': _plays(2)}, 'pages': [_plays(3)]}
+
+    offloaded = store.offload(value, RUN_ID, 'extract')
+    assert offloaded['profile'] == {'user_id': 'u'}
+    assert is_ref(offloaded['top_tracks']['short_term']) and is_ref(offloaded['pages'][0])
+
+    resolved = store.resolve(offloaded)
+    pd.testing.assert_frame_equal(resolved['top_tracks']['short_term'], value['top_tracks']['short_term'])
+    pd.testing.assert_frame_equal(resolved['pages'][0], value['pages'][0])
+
+def test_prune_removes_old_runs(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    old = os.path.dirname(store.write_frame(_plays(1), 'old', 'recent')['__artifact__'])
+    store.write_frame(_plays(1), 'new', 'recent')
+    week_ago = os.path.getmtime(old) - 7 * 24 * 3600
+    os.utime(old, (week_ago, week_ago))
+
+    assert store.prune(max_age_days=3) == ['old']
+    assert os.listdir(tmp_path) == ['new']
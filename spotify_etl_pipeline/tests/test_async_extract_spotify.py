@@ -0,0 +1,50 @@
+import asyncio
+import itertools
+from src.async_extract_spotify import AsyncSpotifyExtractor
+from src.extract_spotify import RECENTLY_PLAYED_PAGE_SIZE, TIME_RANGES
+from src.replay_spotify import REPLAY_USER_ID, ReplayServer, SyntheticLibrary
+from src.watermark_store import WatermarkStore
+
+class CountingAuthManager:
+    """Hands out a new token on every call, like a cache that keeps refreshing"""
+
+    def __init__(self):
+        self._tokens = itertools.count(1)
+        self.calls = 0
+
+    def get_access_token(self, as_dict=True):
+        self.calls += 1
+        return f'token-{next(self._tokens)}'
+
+def extract(server, auth_manager, watermarks, **kwargs):
+    async def run():
+        async with AsyncSpotifyExtractor(auth_manager=auth_manager, base_url=server.api_url,
+                                         watermark_store=watermarks) as extractor:
+            return await extractor.extract_all(**kwargs)
+    return asyncio.run(run())
+
+def test_extract_all_asks_for_a_token_per_request(tmp_path):
+    auth_manager = CountingAuthManager()
+    watermarks = WatermarkStore(str(tmp_path / 'marks.json'))
+    with ReplayServer(library=SyntheticLibrary(plays=30)) as server:
+        data = extract(server, auth_manager, watermarks, recent_limit=10, top_limit=5)
+        requests = server.stats()['requests']
+
+    assert data['profile']['user_id'] == REPLAY_USER_ID
+    assert len(data['recent_tracks']) == 10
+    assert sorted(data['top_tracks']) == sorted(TIME_RANGES)
+    assert all(len(tracks) == 5 for tracks in data['top_tracks'].values())
+    # profile + recent plays + one request per time range
+    assert requests == 2 + len(TIME_RANGES)
+    assert auth_manager.calls == requests
+
+def test_incremental_pages_past_the_watermark(tmp_path):
+    library = SyntheticLibrary(plays=2 * RECENTLY_PLAYED_PAGE_SIZE + 10)
+    watermarks = WatermarkStore(str(tmp_path / 'marks.json'))
+    watermarks.set(REPLAY_USER_ID, library.played_at_ms(4))
+    auth_manager = CountingAuthManager()
+    with ReplayServer(library=library) as server:
+        data = extract(server, auth_manager, watermarks, time_ranges=['short_term'], incremental=True)
+
+    assert len(data['recent_tracks']) == library.plays - 5
+    assert data['recent_tracks']['played_at'].is_unique
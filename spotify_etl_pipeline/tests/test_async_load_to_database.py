@@ -0,0 +1,67 @@
+import asyncio
+from datetime import date
+import pandas as pd
+import pytest
+from src import partitions
+from src.async_load_to_database import AsyncDatabaseLoader
+from src.partitions import partition_name
+
+MONTH = date(1998, 2, 1)
+PROFILE = {'user_id': 'async-user', 'display_name': 'Async', 'email': '', 'country': 'SE',
+           'followers': 0, 'account_type': 'free'}
+
+def _plays():
+    # Two tracks, one play repeated inside the batch
+    return pd.DataFrame({
+        'track_id': ['async-t1', 'async-t2', 'async-t2'],
+        'track_name': ['One', 'Two', 'Two'],
+        'artist_id': ['async-a1', 'async-a1', 'async-a1'],
+        'artist_name': ['Artist', 'Artist', 'Artist'],
+        'played_at': pd.to_datetime(['1998-02-01 10:00', '1998-02-01 10:05', '1998-02-01 10:05']),
+    })
+
+def _count(cursor, query, params):
+    cursor.execute(query, params)
+    return cursor.fetchone()[0]
+
+@pytest.fixture
+def cleanup(db_connection):
+    yield db_connection
+    with db_connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {partition_name(MONTH)}')
+        cursor.execute("DELETE FROM tracks WHERE track_id LIKE 'async-%'")
+        cursor.execute("DELETE FROM artists WHERE artist_id LIKE 'async-%'")
+        cursor.execute("DELETE FROM users WHERE user_id = 'async-user'")
+    db_connection.commit()
+    partitions._known_partitions.discard(partition_name(MONTH))
+
+def test_copy_merge_and_pipelined_history(test_dsn, cleanup):
+    async def load():
+        async with AsyncDatabaseLoader(conninfo=test_dsn) as loader:
+            loaded = await loader.load_batch(PROFILE, _plays())
+            return loaded, loader.metrics.snapshot()
+    loaded, metrics = asyncio.run(load())
+
+    assert loaded == 3
+    assert metrics['tables']['staging_tracks']['rows_attempted'] == 3
+    assert metrics['failed_transactions'] == 0
+    assert partition_name(MONTH) in partitions._known_partitions
+
+    cursor = cleanup.cursor()
+    assert _count(cursor, "SELECT COUNT(*) FROM tracks WHERE track_id LIKE 'async-%%'", ()) == 2
+    assert _count(cursor, "SELECT COUNT(*) FROM artists WHERE artist_id = 'async-a1'", ()) == 1
+    assert _count(cursor, 'SELECT COUNT(*) FROM listening_history WHERE user_id = %s', ('async-user',)) == 2
+    assert _count(cursor, f'SELECT COUNT(*) FROM {partition_name(MONTH)}', ()) == 2
+    cursor.close()
+
+def test_rolled_back_partition_is_not_cached(test_dsn, cleanup):
+    async def load():
+        async with AsyncDatabaseLoader(conninfo=test_dsn) as loader:
+            # user_id longer than VARCHAR(255): the pipelined history merge fails
+            return await loader.load_tracks(_plays(), user_id='u' * 300)
+
+    assert asyncio.run(load()) == 0
+    assert partition_name(MONTH) not in partitions._known_partitions
+    cursor = cleanup.cursor()
+    assert _count(cursor, 'SELECT COUNT(*) FROM pg_class WHERE relname = %s', (partition_name(MONTH),)) == 0
+    cursor.close()
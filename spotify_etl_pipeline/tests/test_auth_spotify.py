@@ -0,0 +1,80 @@
+import threading
+import time
+import pytest
+from spotipy.oauth2 import SpotifyOauthError
+from src.auth_spotify import SCOPES, LockedCacheFileHandler, SharedSpotifyOAuth
+
+def _token(n, expires_in=3600):
+    # Padded so a write takes long enough for readers to overlap it
+    return {'access_token': f'access-{n}' + 'x' * 4096, 'refresh_token': 'refresh', 'token_type': 'Bearer',
+            'scope': ' '.join(SCOPES), 'expires_in': expires_in, 'expires_at': int(time.time()) + expires_in}
+
+class CountingOAuth(SharedSpotifyOAuth):
+    """Refreshes without the network, counting how often it had to"""
+
+    def __init__(self, cache_path):
+        super().__init__(client_id='id', client_secret='secret', redirect_uri='http://127.0.0.1:8888/callback',
+                         scope=' '.join(SCOPES), cache_handler=LockedCacheFileHandler(cache_path))
+        self.refreshes = 0
+
+    def refresh_access_token(self, refresh_token):
+        self.refreshes += 1
+        time.sleep(0.05)
+        token_info = _token(self.refreshes)
+        self.cache_handler.save_token_to_cache(token_info)
+        return token_info
+
+def _run_threads(target, count):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def test_readers_never_see_a_partial_token(tmp_path):
+    cache_path = str(tmp_path / 'cache')
+    writer = LockedCacheFileHandler(cache_path)
+    writer.save_token_to_cache(_token(0))
+    done = threading.Event()
+    misses = []
+
+    def refresh():
+        for n in range(1, 300):
+            writer.save_token_to_cache(_token(n))
+        done.set()
+
+    def read():
+        reader = LockedCacheFileHandler(cache_path)
+        while not done.is_set():
+            if reader.get_cached_token() is None:
+                misses.append(1)
+
+    refresher = threading.Thread(target=refresh)
+    refresher.start()
+    _run_threads(read, 4)
+    refresher.join()
+
+    assert misses == []
+    assert [name for name in tmp_path.iterdir() if name.name.startswith('.cache.')] == []
+
+def test_expiring_token_is_refreshed_once_across_workers(tmp_path):
+    cache_path = str(tmp_path / 'cache')
+    LockedCacheFileHandler(cache_path).save_token_to_cache(_token(0, expires_in=10))
+    managers = [CountingOAuth(cache_path) for _ in range(4)]
+    tokens = []
+
+    def worker(manager):
+        tokens.append(manager.get_access_token(as_dict=False))
+
+    threads = [threading.Thread(target=worker, args=(manager,)) for manager in managers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(manager.refreshes for manager in managers) == 1
+    assert len(set(tokens)) == 1 and tokens[0].startswith('access-1')
+
+def test_missing_token_never_prompts(tmp_path):
+    with pytest.raises(SpotifyOauthError):
+        CountingOAuth(str(tmp_path / 'cache')).get_access_token(as_dict=False)
@@ -0,0 +1,81 @@
+import psycopg2
+import pandas as pd
+import pytest
+from src.data_quality import DataQualityEngine
+from src.load_to_database import DatabaseLoader
+from src.transform_spotify import etl_now
+from src.watermark_store import WatermarkStore
+
+USER_ID = 'dq-user'
+RUN_ID = 'dq-test-run'
+PROFILE = {'user_id': USER_ID, 'display_name': 'DQ', 'email': '', 'country': 'US', 'followers': 0,
+           'account_type': 'free'}
+
+def _plays(played_at):
+    return pd.DataFrame({
+        'track_id': [f'dq-t{i}' for i in range(len(played_at))],
+        'track_name': [f'Song {i}' for i in range(len(played_at))],
+        'artist_id': 'dq-a1', 'artist_name': 'Artist', 'album_id': 'dq-al1', 'duration_ms': 180000,
+        'played_at': played_at,
+    })
+
+@pytest.fixture
+def batch():
+    """Two plays from the last couple of hours"""
+    now = pd.Timestamp(etl_now()).floor('s')
+    return _plays([now - pd.Timedelta(hours=2), now - pd.Timedelta(hours=1)])
+
+@pytest.fixture
+def engine(db_connection, test_dsn, tmp_path, batch):
+    """An engine over the test database, with USER_ID and the batch loaded"""
+    loader = DatabaseLoader(connection=psycopg2.connect(test_dsn))
+    loader.load_user_profile(PROFILE)
+    loader.load_tracks(batch, user_id=USER_ID)
+    loader.close()
+
+    yield DataQualityEngine(connection=db_connection, max_null_rate=0.1, max_freshness_lag_hours=24,
+                            watermark_store=WatermarkStore(str(tmp_path / 'marks.json')))
+
+    cursor = db_connection.cursor()
+    cursor.execute('DELETE FROM data_quality_metrics WHERE run_id = %s', (RUN_ID,))
+    cursor.execute('DELETE FROM listening_history WHERE user_id = %s', (USER_ID,))
+    cursor.execute("DELETE FROM tracks WHERE track_id LIKE 'dq-%'")
+    cursor.execute("DELETE FROM artists WHERE artist_id LIKE 'dq-%'")
+    cursor.execute('DELETE FROM users WHERE user_id = %s', (USER_ID,))
+    db_connection.commit()
+
+def test_loaded_batch_passes_every_check(engine, batch):
+    report = engine.check_batch(RUN_ID, USER_ID, batch)
+
+    assert report['passed'] and report['failed'] == []
+    assert report['user_id'] == USER_ID and report['rows'] == 2
+    metrics = report['metrics']
+    assert metrics['row_count.listening_history'] == 2
+    assert metrics['duplicate_keys.batch'] == 0
+    assert metrics['null_rate.tracks.album_id'] == 0.0
+    assert 1 <= metrics['freshness_lag_hours'] <= 2
+
+def test_results_carry_check_metric_value_threshold_and_outcome(engine, batch):
+    results = engine.run_checks(USER_ID, batch)
+
+    assert all(set(r) == {'check', 'metric', 'value', 'threshold', 'passed'} for r in results)
+    by_metric = {r['metric']: r for r in results}
+    assert by_metric['row_count.batch'] == {'check': 'row_count', 'metric': 'row_count.batch', 'value': 2,
+                                            'threshold': None, 'passed': None}
+    assert by_metric['null_rate.listening_history.track_id']['threshold'] == 0.1
+
+def test_failures_are_reported_and_recorded(engine, batch):
+    # A duplicated play, and one play that never reached the database
+    unloaded = _plays([batch['played_at'].max()]).assign(track_id='dq-unloaded')
+    report = engine.check_batch(RUN_ID, USER_ID, pd.concat([batch, batch.tail(1), unloaded], ignore_index=True))
+
+    assert not report['passed']
+    assert set(report['failed']) == {'duplicate_keys.batch', 'row_count.listening_history', 'missing_tracks.batch'}
+    assert report['metrics']['missing_tracks.batch'] == 1
+
+    history = engine.history('duplicate_keys.batch', limit=1)
+    assert history[0][1:] == (USER_ID, 1.0, False)
+
+def test_unknown_user_fails_referential_integrity(engine, batch):
+    report = engine.check_batch(RUN_ID, 'dq-nobody', batch.head(0))
+    assert report['failed'] == ['user_exists']
@@ -0,0 +1,25 @@
+import psycopg2
+import pytest
+from src.db_pool import without_statement_timeout
+
+def _timeout(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SHOW statement_timeout')
+        return cursor.fetchone()[0]
+
+def test_statement_timeout_is_lifted_then_restored(test_dsn):
+    connection = psycopg2.connect(test_dsn, options='-c statement_timeout=1234')
+    try:
+        with without_statement_timeout(connection):
+            assert _timeout(connection) == '0'
+            connection.commit()
+        assert _timeout(connection) == '1234ms'
+
+        # Restored after a failure inside the block, too
+        with pytest.raises(psycopg2.Error):
+            with without_statement_timeout(connection):
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1 / 0')
+        assert _timeout(connection) == '1234ms'
+    finally:
+        connection.close()
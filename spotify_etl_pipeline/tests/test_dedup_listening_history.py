@@ -0,0 +1,40 @@
+import pytest
+from src.dedup_listening_history import add_unique_constraint, delete_duplicates
+
+@pytest.fixture
+def legacy_history(db_connection):
+    """A plain (v1-style) listening_history in its own schema, with duplicate plays"""
+    cursor = db_connection.cursor()
+    cursor.execute('DROP SCHEMA IF EXISTS dedup_test CASCADE')
+    cursor.execute('CREATE SCHEMA dedup_test')
+    cursor.execute('SET search_path TO dedup_test')
+    cursor.execute("""
+        CREATE TABLE listening_history (
+            history_id SERIAL PRIMARY KEY,
+            user_id VARCHAR(255),
+            track_id VARCHAR(255),
+            played_at TIMESTAMP NOT NULL
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO listening_history (user_id, track_id, played_at) VALUES
+            ('u1', 't1', '2023-01-01 10:00'), ('u1', 't2', '2023-01-01 10:05'),
+            ('u1', 't1', '2023-01-01 10:00'), ('u2', 't1', '2023-01-01 10:00'),
+            ('u1', 't1', '2023-01-01 10:00'), ('u1', 't2', '2023-01-01 10:05')
+    """)
+    db_connection.commit()
+    yield db_connection
+    cursor.execute('DROP SCHEMA dedup_test CASCADE')
+    cursor.execute('RESET search_path')
+    db_connection.commit()
+
+def test_keeps_the_oldest_row_of_each_play(legacy_history):
+    assert delete_duplicates(legacy_history, batch_size=2, pause_seconds=0) == 3
+    cursor = legacy_history.cursor()
+    cursor.execute('SELECT history_id FROM listening_history ORDER BY history_id')
+    assert [row[0] for row in cursor.fetchall()] == [1, 2, 4]
+
+    assert delete_duplicates(legacy_history, batch_size=2, pause_seconds=0) == 0
+    add_unique_constraint(legacy_history)
+    cursor.execute("SELECT 1 FROM pg_constraint WHERE conname = 'uq_listening_history_play'")
+    assert cursor.fetchone()
@@ -0,0 +1,74 @@
+import pytest
+from src.auth_spotify import new_spotify_client
+from src.enrich_spotify import SpotifyEnricher, collect_ids
+from src.extract_spotify import SpotifyExtractor
+from src.load_to_database import DatabaseLoader
+from src.metadata_cache import MetadataCache
+from src.replay_spotify import ReplayServer, SyntheticLibrary
+from src.watermark_store import WatermarkStore
+
+@pytest.fixture
+def server():
+    # 50 recent plays of tracks 0-49 and 120 saved tracks (0-119), one album per ten tracks
+    with ReplayServer(library=SyntheticLibrary(plays=50, saved_tracks=120)) as server:
+        yield server
+
+@pytest.fixture
+def extractor(server, tmp_path):
+    sp = new_spotify_client(auth='replay-token')
+    sp.prefix = server.api_url + '/'
+    extractor = SpotifyExtractor(sp=sp, cache=MetadataCache(str(tmp_path / 'cache.sqlite')),
+                                 watermark_store=WatermarkStore(str(tmp_path / 'marks.json')))
+    yield extractor
+    extractor.cache.close()
+
+def _delete_synthetic_rows(cursor):
+    cursor.execute("DELETE FROM audio_features WHERE track_id LIKE 'track%'")
+    cursor.execute("DELETE FROM tracks WHERE track_id LIKE 'track%'")
+    cursor.execute("DELETE FROM albums WHERE album_id LIKE 'album%'")
+    cursor.execute("DELETE FROM artists WHERE artist_id LIKE 'artist%'")
+
+def test_saved_tracks_are_paged_and_rechunked(server, extractor):
+    chunks = list(extractor.iter_saved_tracks(chunk_size=40))
+
+    assert [len(chunk) for chunk in chunks] == [40, 40, 40]
+    assert chunks[-1]['track_id'].iloc[-1] == 'track0000119'
+    # Three pages of 50, each fetched once
+    assert server.stats()['requests'] == 3
+
+# Spotify deprecated the audio-features endpoint; spotipy warns on every call
+@pytest.mark.filterwarnings('ignore::DeprecationWarning')
+def test_enrichment_fetches_missing_entities_in_full_batches(server, extractor, db_connection):
+    recent = extractor.get_recent_played(limit=50)
+    saved = list(extractor.iter_saved_tracks(chunk_size=1000))
+    ids = collect_ids(recent, *saved)
+    assert (len(ids['tracks']), len(ids['artists']), len(ids['albums'])) == (120, 120, 12)
+
+    loader = DatabaseLoader(connection=db_connection)
+    try:
+        _delete_synthetic_rows(loader.cursor)
+        loader.connect.commit()
+
+        before = server.stats()['requests']
+        summary = SpotifyEnricher(extractor, loader).enrich(recent, *saved)
+        requests = server.stats()['requests'] - before
+
+        assert summary == {'artists': 120, 'albums': 12, 'tracks': 120, 'audio_features': 120}
+        # artists 3x50, albums 1x20, audio features 2x100; tracks 0-49 came with the
+        # recent plays and are served from the metadata cache, so only 70 are fetched (2x50)
+        assert requests == 3 + 1 + 2 + 2
+
+        loader.cursor.execute("SELECT COUNT(*) FROM audio_features WHERE track_id LIKE 'track%'")
+        assert loader.cursor.fetchone()[0] == 120
+        loader.cursor.execute("SELECT COUNT(*) FROM artists WHERE artist_id LIKE 'artist%' AND popularity IS NOT NULL")
+        assert loader.cursor.fetchone()[0] == 120
+
+        # Everything is in Postgres now: a second pass makes no API calls
+        before = server.stats()['requests']
+        assert SpotifyEnricher(extractor, loader).enrich(recent, *saved) == {
+            'artists': 0, 'albums': 0, 'tracks': 0, 'audio_features': 0}
+        assert server.stats()['requests'] == before
+    finally:
+        _delete_synthetic_rows(loader.cursor)
+        loader.connect.commit()
+        loader.close()
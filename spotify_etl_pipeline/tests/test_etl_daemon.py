@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+import pytest
+from config.database_config import DatabaseConfig
+from src.etl_daemon import DailySchedule, DaemonState, ETLDaemon, IntervalSchedule, due_slots, parse_schedule
+
+def test_interval_next_after_is_strictly_later_and_aligned():
+    schedule = IntervalSchedule(3600)
+    assert schedule.next_after(datetime(2024, 1, 1, 10, 30)) == datetime(2024, 1, 1, 11, 0)
+    assert schedule.next_after(datetime(2024, 1, 1, 11, 0)) == datetime(2024, 1, 1, 12, 0)
+
+def test_daily_schedule_runs_at_the_given_time():
+    schedule = DailySchedule('02:00')
+    assert schedule.next_after(datetime(2024, 1, 1, 1, 59)) == datetime(2024, 1, 1, 2, 0)
+    assert schedule.next_after(datetime(2024, 1, 1, 2, 0)) == datetime(2024, 1, 2, 2, 0)
+
+def test_parse_schedule():
+    assert isinstance(parse_schedule('daily@03:15'), DailySchedule)
+    assert parse_schedule('every:90').seconds == 90
+    with pytest.raises(ValueError):
+        parse_schedule('hourly')
+    with pytest.raises(ValueError):
+        IntervalSchedule(0)
+
+def test_due_slots_lists_missed_slots_oldest_first():
+    schedule = DailySchedule('02:00')
+    slots = due_slots(schedule, datetime(2024, 1, 1, 2, 0), datetime(2024, 1, 4, 3, 0))
+    assert slots == [datetime(2024, 1, d, 2, 0) for d in (2, 3, 4)]
+
+def test_due_slots_nothing_due_before_next_slot():
+    schedule = DailySchedule('02:00')
+    assert due_slots(schedule, datetime(2024, 1, 1, 2, 0), datetime(2024, 1, 2, 1, 59)) == []
+
+def test_due_slots_first_run_is_due_now():
+    now = datetime(2024, 1, 1, 12, 0)
+    assert due_slots(IntervalSchedule(60), None, now) == [now]
+
+def test_due_slots_is_capped():
+    from src import etl_daemon
+    now = datetime(2024, 1, 1)
+    slots = due_slots(IntervalSchedule(1), now - timedelta(days=1), now)
+    assert len(slots) == etl_daemon.MAX_MISSED_SLOTS
+
+def test_daemon_state_round_trip(tmp_path):
+    state = DaemonState(str(tmp_path / 'state.json'))
+    assert state.get('u') is None
+    state.set('u', datetime(2024, 1, 1, 2, 0))
+    state.set('v', datetime(2024, 1, 2, 2, 0))
+    assert state.get('u') == datetime(2024, 1, 1, 2, 0)
+    assert DaemonState(state.path).get('v') == datetime(2024, 1, 2, 2, 0)
+
+def test_daemon_rejects_more_runs_than_the_pool_can_serve():
+    with pytest.raises(ValueError):
+        ETLDaemon(run=lambda extractor: 0, users={}, max_concurrent_runs=DatabaseConfig.POOL_MAX_SIZE)
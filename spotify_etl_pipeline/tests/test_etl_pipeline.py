@@ -0,0 +1,64 @@
+import pandas as pd
+from src import etl_pipeline
+from src.etl_pipeline import run_etl
+
+PLAYS = pd.DataFrame({
+    'track_id': ['t1'], 'track_name': ['One'], 'artist_id': ['a1'], 'artist_name': ['Artist'],
+    'album_name': ['Album'], 'album_id': ['al1'], 'duration_ms': [1000], 'popularity': [10],
+    'explicit': [False], 'played_at': ['2024-01-01T00:00:00.000Z'],
+})
+
+class FakeExtractor:
+    def __init__(self, profile):
+        self.profile = profile
+        self.watermarks = []
+
+    def get_user_profile(self):
+        return self.profile
+
+    def get_recent_played(self, incremental=False):
+        return PLAYS.copy()
+
+    def commit_watermark(self, tracks_df, user_id=None):
+        self.watermarks.append((user_id, len(tracks_df)))
+
+class FakeLoader:
+    """Records what reached the database instead of writing it"""
+    history = []
+
+    def load_user_profile(self, profile):
+        return True
+
+    def load_tracks(self, tracks_df, user_id=None):
+        if user_id is not None:
+            self.history.append((user_id, len(tracks_df)))
+        return len(tracks_df)
+
+    def close(self):
+        pass
+
+def test_missing_profile_fails_without_moving_the_watermark(monkeypatch):
+    FakeLoader.history = []
+    monkeypatch.setattr(etl_pipeline, 'DatabaseLoader', FakeLoader)
+    extractor = FakeExtractor(profile=None)
+
+    assert run_etl(extractor) is None
+    assert extractor.watermarks == []
+    assert FakeLoader.history == []
+
+def test_enrichment_failure_keeps_the_committed_load(monkeypatch):
+    class FailingEnricher:
+        def __init__(self, extractor, loader):
+            pass
+
+        def enrich(self, tracks_df):
+            raise RuntimeError('403 audio-features')
+
+    FakeLoader.history = []
+    monkeypatch.setattr(etl_pipeline, 'DatabaseLoader', FakeLoader)
+    monkeypatch.setattr(etl_pipeline, 'SpotifyEnricher', FailingEnricher)
+    extractor = FakeExtractor(profile={'user_id': 'u1', 'display_name': 'U', 'followers': 0, 'account_type': 'free'})
+
+    assert run_etl(extractor) == 1
+    assert FakeLoader.history == [('u1', 1)]
+    assert extractor.watermarks == [('u1', 1)]
@@ -0,0 +1,65 @@
+import threading
+import time
+import psycopg2
+from src.load_metrics import Histogram, LoadMetrics, LockWaitSampler
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [('0.1', 2), ('1.0', 3), ('+Inf', 4)]
+    assert histogram.count == 4
+    assert histogram.sum == 2.65
+
+def test_observe_statement_counts_conflicts():
+    metrics = LoadMetrics()
+    metrics.observe_statement('tracks', 0.01, rows_attempted=10, rows_affected=7, bytes_sent=100)
+    stats = metrics.snapshot()['tables']['tracks']
+    assert (stats['rows_inserted'], stats['rows_conflicted'], stats['bytes_sent']) == (7, 3, 100)
+
+def test_prometheus_exposition():
+    metrics = LoadMetrics()
+    metrics.observe_statement('tracks', 0.02, rows_attempted=5, rows_affected=5)
+    metrics.observe_transaction(0.3, lock_wait_seconds=0.0, committed=False)
+    lines = metrics.to_prometheus().splitlines()
+
+    assert '# TYPE spotify_load_rows_inserted_total counter' in lines
+    assert 'spotify_load_rows_inserted_total{table="tracks"} 5' in lines
+    assert 'spotify_load_statement_seconds_bucket{table="tracks",le="0.025"} 1' in lines
+    assert 'spotify_load_statement_seconds_bucket{table="tracks",le="+Inf"} 1' in lines
+    assert 'spotify_load_statement_seconds_count{table="tracks"} 1' in lines
+    assert 'spotify_load_transaction_seconds_bucket{le="0.25"} 0' in lines
+    assert 'spotify_load_transaction_seconds_bucket{le="0.5"} 1' in lines
+    assert 'spotify_load_failed_transactions_total 1' in lines
+
+def test_write_is_atomic(tmp_path):
+    path = LoadMetrics().write(str(tmp_path / 'metrics' / 'load.prom'))
+    assert open(path).read().endswith('\n')
+    assert not (tmp_path / 'metrics' / 'load.prom.tmp').exists()
+
+def test_lock_wait_sampler_measures_registered_backends(test_dsn):
+    holder = psycopg2.connect(test_dsn)
+    waiter = psycopg2.connect(test_dsn)
+    sampler = LockWaitSampler(interval=0.02, dsn=test_dsn)
+    try:
+        sampler.start(holder.get_backend_pid())
+        sampler.start(waiter.get_backend_pid())
+
+        # The waiter blocks on the holder's advisory lock until it is released
+        holder.cursor().execute('SELECT pg_advisory_lock(1)')
+        blocked = threading.Thread(target=lambda: waiter.cursor().execute(
+            'SELECT pg_advisory_lock(1); SELECT pg_advisory_unlock(1)'))
+        blocked.start()
+        time.sleep(0.3)
+        holder.cursor().execute('SELECT pg_advisory_unlock(1)')
+        blocked.join()
+
+        assert sampler.stop(waiter.get_backend_pid()) > 0
+        assert sampler.stop(holder.get_backend_pid()) == 0
+    finally:
+        started = time.monotonic()
+        sampler.close()
+        assert time.monotonic() - started < 0.5
+        holder.close()
+        waiter.close()
@@ -0,0 +1,32 @@
+import pandas as pd
+from src.load_to_database import DatabaseLoader
+
+def _tracks(popularity):
+    return pd.DataFrame({'track_id': ['hash-t1', 'hash-t2'], 'track_name': ['One', 'Two'],
+                         'artist_id': ['hash-a1', 'hash-a1'], 'artist_name': ['Artist', 'Artist'],
+                         'popularity': [popularity, 10]})
+
+def _xmins(cursor):
+    cursor.execute("SELECT track_id, xmin::text FROM tracks WHERE track_id LIKE 'hash-%' ORDER BY track_id")
+    return dict(cursor.fetchall())
+
+def test_row_hash_is_the_only_change_filter(db_connection):
+    loader = DatabaseLoader(connection=db_connection)
+    try:
+        assert loader.load_tracks(_tracks(50)) == 2
+        first = _xmins(loader.cursor)
+
+        # Every row is staged again; unchanged hashes make the merge a no-op
+        assert loader.load_tracks(_tracks(50)) == 2
+        assert _xmins(loader.cursor) == first
+        assert loader.metrics.snapshot()['tables']['tracks']['rows_conflicted'] == 2
+
+        loader.load_tracks(_tracks(60))
+        second = _xmins(loader.cursor)
+        assert second['hash-t1'] != first['hash-t1']
+        assert second['hash-t2'] == first['hash-t2']
+    finally:
+        loader.cursor.execute("DELETE FROM tracks WHERE track_id LIKE 'hash-%'")
+        loader.cursor.execute("DELETE FROM artists WHERE artist_id LIKE 'hash-%'")
+        loader.connect.commit()
+        loader.close()
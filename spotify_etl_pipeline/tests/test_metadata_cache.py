@@ -0,0 +1,59 @@
+import pytest
+from src import metadata_cache
+from src.metadata_cache import MetadataCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(metadata_cache.time, 'time', clock)
+    return clock
+
+def _cache(tmp_path, **kwargs):
+    return MetadataCache(str(tmp_path / 'cache.sqlite'), **kwargs)
+
+def test_hits_and_misses(tmp_path, clock):
+    cache = _cache(tmp_path, ttl_seconds=60)
+    cache.put_many('track', {'t1': {'name': 'One'}, 't2': {'name': 'Two'}})
+
+    assert cache.get_many('track', ['t1', 't2', 't3']) == {'t1': {'name': 'One'}, 't2': {'name': 'Two'}}
+    # Same IDs under another kind are different entities
+    assert cache.get_many('artist', ['t1']) == {}
+    assert cache.stats() == {'hits': 2, 'misses': 2}
+    cache.close()
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = _cache(tmp_path, ttl_seconds=60)
+    cache.put_many('track', {'t1': {'name': 'One'}})
+
+    clock.advance(59)
+    assert 't1' in cache.get_many('track', ['t1'])
+    # Reading doesn't extend an entry's life, only a new fetch does
+    clock.advance(1)
+    assert cache.get_many('track', ['t1']) == {}
+
+    cache.put_many('track', {'t1': {'name': 'One again'}})
+    assert cache.get_many('track', ['t1']) == {'t1': {'name': 'One again'}}
+    cache.close()
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = _cache(tmp_path, ttl_seconds=3600, max_entries=3)
+    for track_id in ('t1', 't2', 't3'):
+        cache.put_many('track', {track_id: {}})
+        clock.advance(1)
+
+    # t1 is read, so t2 is now the least recently used
+    cache.get_many('track', ['t1'])
+    clock.advance(1)
+    cache.put_many('track', {'t4': {}})
+    assert set(cache.get_many('track', ['t1', 't2', 't3', 't4'])) == {'t1', 't3', 't4'}
+    cache.close()
@@ -0,0 +1,85 @@
+import pytest
+from src import migrations
+from src.migrations import MIGRATIONS, Migration, migrate
+
+def test_versions_are_unique_and_ascending():
+    versions = [m.version for m in MIGRATIONS]
+    assert versions == sorted(set(versions))
+
+@pytest.fixture
+def migration_schema(db_connection, monkeypatch):
+    """An empty schema (with its own schema_migrations) and a cold up-to-date cache"""
+    cursor = db_connection.cursor()
+    cursor.execute('DROP SCHEMA IF EXISTS migrations_test CASCADE')
+    cursor.execute('CREATE SCHEMA migrations_test')
+    cursor.execute('SET search_path TO migrations_test')
+    db_connection.commit()
+    monkeypatch.setattr(migrations, '_up_to_date', False)
+    yield db_connection
+    db_connection.rollback()
+    db_connection.autocommit = False
+    cursor.execute('DROP SCHEMA migrations_test CASCADE')
+    cursor.execute('RESET search_path')
+    db_connection.commit()
+
+def _fake_migrations(log):
+    def create_table(cursor):
+        log.append(1)
+        cursor.execute('CREATE TABLE plays (id INTEGER, user_id TEXT)')
+
+    def add_column(cursor):
+        log.append(3)
+        cursor.execute('ALTER TABLE plays ADD COLUMN played_at TIMESTAMP')
+
+    return [
+        Migration(1, 'plays', apply=create_table),
+        Migration(2, 'plays user_id index', index=('idx_migrations_test_user_id', 'plays', '(user_id)')),
+        Migration(3, 'plays played_at', apply=add_column),
+    ]
+
+def _index_is_valid(cursor, name):
+    cursor.execute("""
+        SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s
+    """, (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def test_transactional_steps_run_in_order_before_indexes(migration_schema, monkeypatch):
+    log = []
+    monkeypatch.setattr(migrations, 'MIGRATIONS', _fake_migrations(log))
+
+    # Concurrent index builds run after the shared transaction
+    assert migrate(migration_schema) == [1, 3, 2]
+    assert log == [1, 3]
+    assert _index_is_valid(migration_schema.cursor(), 'idx_migrations_test_user_id') is True
+
+def test_applied_versions_are_skipped(migration_schema, monkeypatch):
+    log = []
+    monkeypatch.setattr(migrations, 'MIGRATIONS', _fake_migrations(log)[:1])
+    assert migrate(migration_schema) == [1]
+
+    # Up to date in this process: no database round trip at all
+    assert migrate(migration_schema) == []
+
+    # Another process sees version 1 recorded and only applies the new ones
+    migrations.reset_cache()
+    monkeypatch.setattr(migrations, 'MIGRATIONS', _fake_migrations(log))
+    assert migrate(migration_schema) == [3, 2]
+    assert log == [1, 3]
+
+def test_invalid_index_from_a_failed_build_is_rebuilt(migration_schema, monkeypatch):
+    cursor = migration_schema.cursor()
+    cursor.execute("CREATE TABLE plays (id INTEGER, user_id TEXT)")
+    cursor.execute("INSERT INTO plays VALUES (1, 'u1'), (2, 'u1')")
+    migration_schema.commit()
+
+    # A unique concurrent build over duplicates fails and leaves the index invalid
+    migration_schema.autocommit = True
+    with pytest.raises(Exception):
+        cursor.execute('CREATE UNIQUE INDEX CONCURRENTLY idx_migrations_test_user_id ON plays (user_id)')
+    migration_schema.autocommit = False
+    assert _index_is_valid(cursor, 'idx_migrations_test_user_id') is False
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', _fake_migrations([])[1:2])
+    assert migrate(migration_schema) == [2]
+    assert _index_is_valid(cursor, 'idx_migrations_test_user_id') is True
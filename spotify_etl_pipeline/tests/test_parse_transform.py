@@ -0,0 +1,43 @@
+import pandas as pd
+from src.parse_spotify import parse_recent_played
+from src.replay_spotify import SyntheticLibrary, _iso
+from src.transform_spotify import TRACK_DTYPES, to_utc, transform_profile, transform_tracks
+
+def recent_items(plays=5):
+    library = SyntheticLibrary(plays=plays, distinct_tracks=3)
+    return [{'played_at': _iso(library.played_at_ms(i)), 'track': library.track(i)} for i in range(plays)]
+
+def test_to_utc_normalises_offsets_to_naive_utc():
+    parsed = to_utc(pd.Series(['2024-01-01T00:00:00.123Z', '2024-01-01T02:00:00+02:00', 'not a date']))
+    assert parsed.dt.tz is None
+    assert parsed[0] == pd.Timestamp('2024-01-01 00:00:00.123')
+    assert parsed[1] == pd.Timestamp('2024-01-01 00:00:00')
+    assert pd.isna(parsed[2])
+
+def test_to_utc_accepts_aware_datetimes():
+    aware = pd.Series(pd.to_datetime(['2024-06-01T12:00:00'])).dt.tz_localize('Europe/Berlin')
+    assert to_utc(aware)[0] == pd.Timestamp('2024-06-01 10:00:00')
+
+def test_transform_tracks_types_and_single_timestamp():
+    df = parse_recent_played(recent_items())
+    df['unexpected'] = 1
+    df.loc[1, 'played_at'] = 'garbage'
+
+    out = transform_tracks(df, etl_timestamp=pd.Timestamp('2024-01-01'))
+
+    assert 'unexpected' not in out
+    assert len(out) == len(df) - 1
+    assert pd.api.types.is_datetime64_dtype(out['played_at'])
+    assert out['etl_timestamp'].nunique() == 1
+    for column, dtype in TRACK_DTYPES.items():
+        if dtype != 'object':
+            assert str(out[column].dtype) == dtype
+
+def test_transform_tracks_survives_a_second_pass():
+    once = transform_tracks(parse_recent_played(recent_items()))
+    twice = transform_tracks(once, etl_timestamp=once['etl_timestamp'][0])
+    pd.testing.assert_frame_equal(once, twice)
+
+def test_transform_empty_inputs():
+    assert transform_tracks(pd.DataFrame()).empty
+    assert transform_profile(None) is None
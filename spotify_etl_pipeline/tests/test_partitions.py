@@ -0,0 +1,38 @@
+from datetime import date
+import pandas as pd
+from src import partitions
+from src.load_to_database import DatabaseLoader
+from src.partitions import add_months, months_for, partition_name
+
+def test_months_for_covers_every_played_at_month():
+    months = months_for(['2024-01-31T23:59:59Z', '2024-02-01T00:00:00+01:00', '2024-03-15T12:00:00Z'])
+    assert months == [date(2024, 1, 1), date(2024, 3, 1)]
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert partition_name(date(2024, 3, 1)) == 'listening_history_y2024m03'
+
+def _plays(played_at):
+    return pd.DataFrame({'track_id': ['t1'], 'track_name': ['Song'], 'artist_id': ['a1'],
+                         'artist_name': ['Artist'], 'played_at': [pd.Timestamp(played_at)]})
+
+def _partition_exists(cursor, name):
+    cursor.execute('SELECT 1 FROM pg_class WHERE relname = %s', (name,))
+    return cursor.fetchone() is not None
+
+def test_partition_is_cached_only_after_commit(db_connection):
+    name = partition_name(date(1999, 1, 1))
+    loader = DatabaseLoader(connection=db_connection)
+    try:
+        # user_id longer than VARCHAR(255): the history merge fails after the CREATE
+        assert loader.load_tracks(_plays('1999-01-15'), user_id='u' * 300) == 0
+        assert name not in partitions._known_partitions
+        assert not _partition_exists(loader.cursor, name)
+
+        assert loader.load_tracks(_plays('1999-01-15'), user_id='partition-test') == 1
+        assert name in partitions._known_partitions
+        assert _partition_exists(loader.cursor, name)
+    finally:
+        loader.cursor.execute(f'DROP TABLE IF EXISTS {name}')
+        loader.cursor.execute("DELETE FROM tracks WHERE track_id = 't1'")
+        loader.connect.commit()
+        partitions._known_partitions.discard(name)
+        loader.close()
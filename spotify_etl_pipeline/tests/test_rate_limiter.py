@@ -0,0 +1,42 @@
+import time
+import pytest
+from spotipy.exceptions import SpotifyException
+from src.auth_spotify import new_spotify_client
+from src.rate_limiter import RateLimiter, _retry_after_of
+from src.replay_spotify import REPLAY_USER_ID, ReplayServer, SyntheticLibrary
+
+def _client(server):
+    sp = new_spotify_client(auth='replay-token')
+    sp.prefix = server.api_url + '/'
+    return sp
+
+def test_429_reaches_the_caller_with_retry_after():
+    with ReplayServer(library=SyntheticLibrary(), throttle_rate=1.0, retry_after=7) as server:
+        with pytest.raises(SpotifyException) as raised:
+            _client(server).current_user()
+    assert raised.value.http_status == 429
+    assert _retry_after_of(raised.value) == 7
+
+def test_5xx_keeps_its_status():
+    with ReplayServer(library=SyntheticLibrary(), error_rate=1.0) as server:
+        with pytest.raises(SpotifyException) as raised:
+            _client(server).current_user()
+    assert raised.value.http_status == 500
+
+def test_rate_limiter_waits_out_retry_after():
+    limiter = RateLimiter(rate=1000, burst=1000)
+    with ReplayServer(library=SyntheticLibrary(), retry_after=0.3) as server:
+        sp = _client(server)
+        calls = []
+
+        def current_user():
+            # Only the first request is throttled
+            server.throttle_rate = 0.0 if calls else 1.0
+            calls.append(time.monotonic())
+            return sp.current_user()
+
+        profile = limiter.call(current_user)
+
+    assert profile['id'] == REPLAY_USER_ID
+    assert limiter.stats()['throttled'] == 1
+    assert calls[1] - calls[0] >= 0.3
@@ -0,0 +1,29 @@
+import spotipy
+from src.auth_spotify import new_spotify_client
+from src.replay_spotify import RecordingSession, ReplayServer, SyntheticLibrary
+
+def _client(server, sp=None):
+    sp = sp or new_spotify_client(auth='replay-token')
+    sp.prefix = server.api_url + '/'
+    return sp
+
+def _extract(sp):
+    return {
+        'profile': sp.current_user(),
+        'recent': sp.current_user_recently_played(limit=5),
+        'top': sp.current_user_top_tracks(limit=3, time_range='short_term'),
+    }
+
+def test_recorded_fixtures_replay(tmp_path):
+    fixtures_dir = str(tmp_path / 'fixtures')
+    with ReplayServer(library=SyntheticLibrary(plays=20)) as server:
+        # Recorded the way record_fixtures does it
+        sp = spotipy.Spotify(auth='replay-token', requests_session=RecordingSession(fixtures_dir))
+        recorded = _extract(_client(server, sp))
+
+    # No library this time: every response must come from a fixture
+    with ReplayServer(fixtures_dir=fixtures_dir) as server:
+        replayed = _extract(_client(server))
+
+    assert replayed == recorded
+    assert len(replayed['recent']['items']) == 5
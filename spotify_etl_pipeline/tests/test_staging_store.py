@@ -0,0 +1,56 @@
+import os
+import pandas as pd
+import pytest
+from src.staging_store import ChecksumMismatch, StagingStore
+
+@pytest.fixture
+def tracks_df():
+    return pd.DataFrame({
+        'track_id': [f't{i}' for i in range(25)],
+        'played_at': pd.date_range('2024-01-01', periods=25, freq='min'),
+    })
+
+def test_write_chunks_and_read_back(tmp_path, tracks_df):
+    store = StagingStore(str(tmp_path))
+    manifest = store.write('scheduled__2024-01-01T00:00:00+00:00', tracks_df, profile={'user_id': 'u'}, chunk_rows=10)
+
+    assert [chunk['rows'] for chunk in manifest['chunks']] == [10, 10, 5]
+    assert manifest['rows'] == 25
+    assert manifest['profile'] == {'user_id': 'u'}
+    pd.testing.assert_frame_equal(store.read_all(manifest['run_id']), tracks_df)
+    assert list(store.read_all(manifest['run_id'], columns=['track_id']).columns) == ['track_id']
+
+def test_rewrite_keeps_the_staged_run(tmp_path, tracks_df):
+    store = StagingStore(str(tmp_path))
+    first = store.write('run', tracks_df, chunk_rows=10)
+    # A retried extract must not replace chunks a loader may already have committed
+    second = store.write('run', tracks_df.head(3), chunk_rows=10)
+    assert second == first
+    assert len(store.read_all('run')) == 25
+
+def test_checksum_mismatch_is_detected(tmp_path, tracks_df):
+    store = StagingStore(str(tmp_path))
+    manifest = store.write('run', tracks_df, chunk_rows=10)
+    chunk = manifest['chunks'][1]
+    tracks_df.iloc[:3].to_parquet(os.path.join(store.run_dir('run'), chunk['name']), index=False)
+
+    store.read_chunk('run', manifest['chunks'][0])
+    with pytest.raises(ChecksumMismatch):
+        store.read_chunk('run', chunk)
+
+def test_incomplete_run_is_ignored(tmp_path, tracks_df):
+    store = StagingStore(str(tmp_path))
+    os.makedirs(store.run_dir('run'))
+    assert store.manifest('run') is None
+    assert store.read_all('run').empty
+
+def test_prune_removes_only_old_runs(tmp_path, tracks_df):
+    store = StagingStore(str(tmp_path))
+    store.write('old', tracks_df)
+    store.write('new', tracks_df)
+    week_ago = os.path.getmtime(store.run_dir('old')) - 7 * 24 * 3600
+    os.utime(store.run_dir('old'), (week_ago, week_ago))
+
+    assert store.prune(max_age_days=3) == ['old']
+    assert store.manifest('old') is None
+    assert len(store.read_all('new')) == 25
@@ -0,0 +1,30 @@
+import multiprocessing
+import os
+from src.watermark_store import WatermarkStore
+
+def advance_users(path, worker, users, marks):
+    # A fresh store per process, like separate Celery tasks
+    store = WatermarkStore(path)
+    for user in range(users):
+        for mark in range(1, marks + 1):
+            store.set(f'w{worker}-u{user}', mark)
+
+def test_set_never_moves_backwards(tmp_path):
+    store = WatermarkStore(str(tmp_path / 'marks.json'))
+    assert store.get('u') is None
+    store.set('u', 200)
+    assert store.set('u', 100) == 200
+    assert store.advance('u', ['1970-01-01T00:00:00.300Z']) == 300
+
+def test_concurrent_writers_lose_no_users(tmp_path):
+    path = str(tmp_path / 'marks.json')
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=advance_users, args=(path, w, 5, 4)) for w in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    store = WatermarkStore(path)
+    assert all(store.get(f'w{w}-u{u}') == 4 for w in range(4) for u in range(5))
+    assert [name for name in os.listdir(tmp_path) if name.startswith('.marks.json.')] == []